@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Multithreaded stress benchmark for MutableGraphStore.
+
+Reader threads repeatedly iterate, count and query the store, while
+writer threads add and remove nodes and relationships. Every read either
+completes or fails fast with a ConcurrentModificationError; any other
+error is reported as a failure.
+
+Usage: python bench/concurrency.py [readers] [writers] [seconds]
+"""
+
+
+from __future__ import print_function
+
+import sys
+from os.path import dirname, join as path_join
+from threading import Event, Thread
+from time import sleep, time
+
+sys.path.insert(0, path_join(dirname(__file__), ".."))
+
+from cypy.graph.store import MutableGraphStore, ConcurrentModificationError
+
+
+def reader(store, stop, stats):
+    while not stop.is_set():
+        try:
+            for n_id in store.nodes("Person"):
+                store.node_properties(n_id)
+            store.node_count("Person")
+            list(store.relationships("KNOWS"))
+            with store.read_lock():
+                total = sum(1 for _ in store.nodes())
+                assert total == store.node_count()
+        except ConcurrentModificationError:
+            stats["retries"] += 1
+        except Exception as error:
+            stats["failures"] += 1
+            print("Reader failed: {!r}".format(error))
+        else:
+            stats["reads"] += 1
+
+
+def writer(store, stop, stats):
+    while not stop.is_set():
+        try:
+            n_ids = store.add_nodes([(["Person"], {"n": i}) for i in range(10)])
+            store.add_relationships([("KNOWS", (n_ids[i], n_ids[i + 1]), {}) for i in range(9)])
+            store.remove_nodes(n_ids[:5])
+        except Exception as error:
+            stats["failures"] += 1
+            print("Writer failed: {!r}".format(error))
+        else:
+            stats["writes"] += 1
+
+
+def main(readers=4, writers=2, seconds=5.0):
+    store = MutableGraphStore()
+    store.add_nodes([(["Person"], {"n": i}) for i in range(1000)])
+    stop = Event()
+    stats = {"reads": 0, "retries": 0, "writes": 0, "failures": 0}
+    threads = [Thread(target=reader, args=(store, stop, stats)) for _ in range(readers)]
+    threads.extend(Thread(target=writer, args=(store, stop, stats)) for _ in range(writers))
+    t0 = time()
+    for thread in threads:
+        thread.start()
+    sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time() - t0
+    print("{} readers, {} writers, {:.1f}s".format(readers, writers, elapsed))
+    print("  reads:    {} ({:.0f}/s)".format(stats["reads"], stats["reads"] / elapsed))
+    print("  retries:  {}".format(stats["retries"]))
+    print("  writes:   {} ({:.0f}/s)".format(stats["writes"], stats["writes"] / elapsed))
+    print("  failures: {}".format(stats["failures"]))
+    print("  nodes:    {}".format(store.node_count()))
+    return 1 if stats["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(float(arg) if "." in arg else int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Creation rate benchmark for standalone nodes and relationships.
+
+Creates `count` standalone nodes, then `count` relationships between
+them, and reports entities per second. The store behind each entity is
+built only when first required, so the stores for the first `sample`
+relationships are then also built, and the rate reported separately.
+Finally, `sample` more of each entity are created with memory tracing
+on, to report the memory allocated per entity.
+
+Usage: python bench/entities.py [count] [sample]
+"""
+
+
+from __future__ import print_function
+
+import sys
+import tracemalloc
+from os.path import dirname, join as path_join
+from time import time
+
+sys.path.insert(0, path_join(dirname(__file__), ".."))
+
+from cypy.graph import Node, Relationship
+
+
+class KNOWS(Relationship):
+    pass
+
+
+def report(title, count, seconds):
+    print("  {:<14} {} in {:.2f}s ({:.0f}/s)".format(title + ":", count, seconds, count / seconds))
+
+
+def main(count=100000, sample=10000):
+    t0 = time()
+    nodes = [Node("Person", name="Person %d" % i, age=i % 100) for i in range(count)]
+    t1 = time()
+    relationships = [KNOWS(nodes[i], nodes[i - 1], since=1999) for i in range(count)]
+    t2 = time()
+    for relationship in relationships[:sample]:
+        relationship.__graph_store__()
+    t3 = time()
+    print("Standalone entities")
+    report("nodes", count, t1 - t0)
+    report("relationships", count, t2 - t1)
+    report("stores built", min(sample, count), t3 - t2)
+    del nodes, relationships
+    tracemalloc.start()
+    nodes = [Node("Person", name="Person %d" % i, age=i % 100) for i in range(sample)]
+    node_size, _ = tracemalloc.get_traced_memory()
+    relationships = [KNOWS(nodes[i], nodes[i - 1], since=1999) for i in range(sample)]
+    relationship_size = tracemalloc.get_traced_memory()[0] - node_size
+    tracemalloc.stop()
+    print("Memory per entity")
+    print("  nodes:         {:.0f} bytes".format(node_size / sample))
+    print("  relationships: {:.0f} bytes".format(relationship_size / sample))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Throughput benchmark for the CSV bulk loader.
+
+Writes a synthetic node file and relationship file with `rows` rows in
+total, split evenly between the two, then loads both into a new
+MutableGraphStore and reports rows per second. For comparison, the
+first `sample` node rows are then also created one at a time through
+Graph.create, from rows already parsed into memory.
+
+Usage: python bench/loading.py [rows] [batch_size] [sample]
+"""
+
+
+from __future__ import print_function
+
+import csv
+import sys
+from io import open as io_open
+from os.path import dirname, join as path_join
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+sys.path.insert(0, path_join(dirname(__file__), ".."))
+
+from cypy.graph import Graph
+from cypy.graph.loader import CSVLoader
+from cypy.graph.store import MutableGraphStore
+
+
+def write_files(directory, rows):
+    node_count = rows // 2
+    random = Random(0)
+    nodes_path = path_join(directory, "nodes.csv")
+    relationships_path = path_join(directory, "relationships.csv")
+    with io_open(nodes_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id:ID(Person)", "name", "age:int", "score:float", "tags:string[]", ":LABEL"])
+        for i in range(node_count):
+            writer.writerow(["p%d" % i, "Person %d" % i, random.randint(0, 99), random.random(),
+                             "a;b", "Person"])
+    with io_open(relationships_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([":START_ID(Person)", ":END_ID(Person)", "since:int", ":TYPE"])
+        for i in range(rows - node_count):
+            writer.writerow(["p%d" % random.randrange(node_count), "p%d" % random.randrange(node_count),
+                             random.randint(1950, 2018), "KNOWS"])
+    return nodes_path, relationships_path
+
+
+def main(rows=1000000, batch_size=None, sample=10000):
+    directory = mkdtemp()
+    try:
+        nodes_path, relationships_path = write_files(directory, rows)
+        store = MutableGraphStore()
+        loader = CSVLoader(store, batch_size=batch_size)
+        t0 = time()
+        node_count = loader.load_nodes(nodes_path)
+        t1 = time()
+        relationship_count = loader.load_relationships(relationships_path)
+        t2 = time()
+        print("Bulk load, batch size {}".format(loader.batch_size))
+        print("  nodes:         {} in {:.2f}s ({:.0f}/s)".format(node_count, t1 - t0, node_count / (t1 - t0)))
+        print("  relationships: {} in {:.2f}s ({:.0f}/s)".format(relationship_count, t2 - t1,
+                                                                 relationship_count / (t2 - t1)))
+        print("  total:         {} in {:.2f}s ({:.0f}/s)".format(node_count + relationship_count, t2 - t0,
+                                                                 (node_count + relationship_count) / (t2 - t0)))
+        sample_rows = []
+        with io_open(nodes_path, newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            for i, row in enumerate(reader):
+                if i == sample:
+                    break
+                sample_rows.append(row)
+        graph = Graph()
+        t0 = time()
+        for n_id, name, age, score, tags, label in sample_rows:
+            graph.create(label, id=n_id, name=name, age=int(age), score=float(score), tags=tags.split(";"))
+        t1 = time()
+        print("Graph.create per row")
+        print("  nodes:         {} in {:.2f}s ({:.0f}/s)".format(len(sample_rows), t1 - t0,
+                                                                 len(sample_rows) / (t1 - t0)))
+    finally:
+        rmtree(directory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Top-k retrieval benchmark for ordered node selections.
+
+Creates `count` nodes with a random score, and then times retrieval of
+the top `k` nodes by score: by sorting the whole selection, by heap
+selection (as used when a limit is applied) and by reading an ordered
+index.
+
+Usage: python bench/ordering.py [count] [k]
+"""
+
+
+from __future__ import print_function
+
+import sys
+from os.path import dirname, join as path_join
+from random import Random
+from time import time
+
+sys.path.insert(0, path_join(dirname(__file__), ".."))
+
+from cypy.graph.store import MutableGraphStore
+from cypy.graph import NodeSelection
+
+
+def timed(title, function, repeat=5):
+    t0 = time()
+    for _ in range(repeat):
+        result = function()
+    seconds = (time() - t0) / repeat
+    print("  {:<14} {:.4f}s".format(title + ":", seconds))
+    return result
+
+
+def main(count=200000, k=100):
+    random = Random(0)
+    store = MutableGraphStore()
+    store.add_nodes((["Item"], {"score": random.random()}) for _ in range(count))
+    items = NodeSelection(store, labels=["Item"])
+    print("Top {} of {} nodes by score".format(k, count))
+    expected = timed("full sort", lambda: list(items.order_by("score", descending=True).keys())[:k])
+    heap = timed("heap", lambda: list(items.order_by("score", descending=True).limit(k).keys()))
+    store.create_index("Item", "score", ordered=True)
+    index = timed("ordered index", lambda: list(items.order_by("score", descending=True).limit(k).keys()))
+    assert heap == expected and index == expected
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -16,6 +16,17 @@
 # limitations under the License.
 
 
+from __future__ import absolute_import
+
+from bisect import bisect_left, bisect_right
+from itertools import chain
+
+try:
+    from collections.abc import ItemsView, Mapping, Set, ValuesView
+except ImportError:
+    from collections import ItemsView, Mapping, Set, ValuesView
+
+
 class ReactiveSet(set):
     """ A :class:`set` that can trigger callbacks for each element added
     or removed.
@@ -37,7 +48,7 @@ class ReactiveSet(set):
         return self
 
     def __iand__(self, other):
-        elements = self ^ other
+        elements = self - other
         set.__iand__(self, other)
         if callable(self._on_remove):
             self._on_remove(*elements)
@@ -110,6 +121,745 @@ class ReactiveSet(set):
             self._on_remove(*elements)
 
 
+class FrozenSortedSet(object):
+    """ An immutable collection of distinct, mutually comparable elements,
+    held in sorted order.
+
+    Elements are stored in a single sorted tuple and located by binary
+    search.
+    """
+
+    def __init__(self, iterable=()):
+        self._values = tuple(sorted(set(iterable)))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, list(self))
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __reversed__(self):
+        return reversed(self._values)
+
+    def __contains__(self, element):
+        values = self._values
+        i = bisect_left(values, element)
+        return i < len(values) and values[i] == element
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True), reverse=False):
+        """ Iterate through all elements between `minimum` and `maximum`.
+
+        Either bound may be :const:`None`, in which case the range is
+        unbounded at that end. The `inclusive` pair determines whether
+        each bound is itself included in the range.
+        """
+        values = self._values
+        if minimum is None:
+            start = 0
+        elif inclusive[0]:
+            start = bisect_left(values, minimum)
+        else:
+            start = bisect_right(values, minimum)
+        if maximum is None:
+            stop = len(values)
+        elif inclusive[1]:
+            stop = bisect_right(values, maximum)
+        else:
+            stop = bisect_left(values, maximum)
+        if reverse:
+            return (values[i] for i in range(stop - 1, start - 1, -1))
+        else:
+            return (values[i] for i in range(start, stop))
+
+
+class SortedSet(object):
+    """ A mutable collection of distinct, mutually comparable elements,
+    held in sorted order.
+
+    Elements are stored in a list of sorted sublists, each of which is
+    kept between half and double the `load` factor in length. This gives
+    logarithmic search and cheap insertion and removal without the
+    overhead of a tree of Python objects.
+    """
+
+    load = 500
+
+    def __init__(self, iterable=()):
+        values = sorted(set(iterable))
+        load = self.load
+        self._lists = [values[i:(i + load)] for i in range(0, len(values), load)]
+        self._maxes = [sublist[-1] for sublist in self._lists]
+        self._len = len(values)
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, list(self))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._lists)
+
+    def __reversed__(self):
+        return chain.from_iterable(reversed(sublist) for sublist in reversed(self._lists))
+
+    def __contains__(self, element):
+        maxes = self._maxes
+        pos = bisect_left(maxes, element)
+        if pos == len(maxes):
+            return False
+        sublist = self._lists[pos]
+        i = bisect_left(sublist, element)
+        return i < len(sublist) and sublist[i] == element
+
+    def add(self, element):
+        """ Add an element to the set.
+        """
+        lists = self._lists
+        maxes = self._maxes
+        if not lists:
+            lists.append([element])
+            maxes.append(element)
+            self._len = 1
+            return
+        pos = bisect_left(maxes, element)
+        if pos == len(maxes):
+            pos -= 1
+        sublist = lists[pos]
+        i = bisect_left(sublist, element)
+        if i < len(sublist) and sublist[i] == element:
+            return
+        sublist.insert(i, element)
+        maxes[pos] = sublist[-1]
+        self._len += 1
+        if len(sublist) > 2 * self.load:
+            half = len(sublist) // 2
+            lists.insert(pos + 1, sublist[half:])
+            del sublist[half:]
+            maxes.insert(pos, sublist[-1])
+
+    def discard(self, element):
+        """ Discard an element from the set, if present.
+        """
+        lists = self._lists
+        maxes = self._maxes
+        pos = bisect_left(maxes, element)
+        if pos == len(maxes):
+            return
+        sublist = lists[pos]
+        i = bisect_left(sublist, element)
+        if i == len(sublist) or sublist[i] != element:
+            return
+        del sublist[i]
+        self._len -= 1
+        if len(sublist) < self.load // 2 and len(lists) > 1:
+            # Merge undersized sublists into a neighbour, splitting
+            # again if the result grows too large.
+            if pos == len(lists) - 1:
+                pos -= 1
+            sublist = lists[pos]
+            sublist.extend(lists.pop(pos + 1))
+            del maxes[pos + 1]
+            if len(sublist) > 2 * self.load:
+                half = len(sublist) // 2
+                lists.insert(pos + 1, sublist[half:])
+                del sublist[half:]
+                maxes.insert(pos + 1, lists[pos + 1][-1])
+            maxes[pos] = sublist[-1]
+        elif sublist:
+            maxes[pos] = sublist[-1]
+        else:
+            del lists[pos]
+            del maxes[pos]
+
+    def _position(self, element, right):
+        # Return the (sublist, index) position at which `element` would
+        # be inserted to the left or right of any equal element.
+        bisect = bisect_right if right else bisect_left
+        maxes = self._maxes
+        pos = bisect(maxes, element)
+        if pos == len(maxes):
+            return pos, 0
+        return pos, bisect(self._lists[pos], element)
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True), reverse=False):
+        """ Iterate through all elements between `minimum` and `maximum`.
+
+        Either bound may be :const:`None`, in which case the range is
+        unbounded at that end. The `inclusive` pair determines whether
+        each bound is itself included in the range.
+        """
+        lists = self._lists
+        if minimum is None:
+            start = (0, 0)
+        else:
+            start = self._position(minimum, not inclusive[0])
+        if maximum is None:
+            stop = (len(lists), 0)
+        else:
+            stop = self._position(maximum, inclusive[1])
+        if start >= stop:
+            return iter(())
+        if reverse:
+            return self._iter_reversed(start, stop)
+        else:
+            return self._iter(start, stop)
+
+    def _iter(self, start, stop):
+        lists = self._lists
+        for pos in range(start[0], min(stop[0] + 1, len(lists))):
+            sublist = lists[pos]
+            begin = start[1] if pos == start[0] else 0
+            end = stop[1] if pos == stop[0] else len(sublist)
+            for i in range(begin, end):
+                yield sublist[i]
+
+    def _iter_reversed(self, start, stop):
+        lists = self._lists
+        for pos in range(min(stop[0], len(lists) - 1), start[0] - 1, -1):
+            sublist = lists[pos]
+            begin = start[1] if pos == start[0] else 0
+            end = stop[1] if pos == stop[0] else len(sublist)
+            for i in range(end - 1, begin - 1, -1):
+                yield sublist[i]
+
+
+try:
+    _popcount = int.bit_count
+except AttributeError:
+    def _popcount(n):
+        return bin(n).count("1")
+
+
+_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+_MISSING = object()
+
+
+class _Trie(object):
+    # A hash array mapped trie node, in which `slots` holds one entry
+    # for each bit set in `bitmap`. Each entry is either a leaf, held as
+    # a (hash, key, value) tuple, or a sub-node. Nodes may be modified
+    # in place only by their `owner`.
+
+    __slots__ = ("bitmap", "slots", "owner")
+
+    def __init__(self, bitmap, slots, owner=None):
+        self.bitmap = bitmap
+        self.slots = slots
+        self.owner = owner
+
+
+class _Collision(object):
+    # Leaves whose keys have identical hashes.
+
+    __slots__ = ("hash", "slots", "owner")
+
+    def __init__(self, hash_, slots, owner=None):
+        self.hash = hash_
+        self.slots = slots
+        self.owner = owner
+
+
+_EMPTY_TRIE = _Trie(0, [])
+
+
+def _editable(node, owner):
+    if owner is not None and node.owner is owner:
+        return node
+    elif isinstance(node, _Collision):
+        return _Collision(node.hash, list(node.slots), owner)
+    else:
+        return _Trie(node.bitmap, list(node.slots), owner)
+
+
+def _trie_get(node, h, key):
+    shift = 0
+    while True:
+        if type(node) is _Collision:
+            for leaf in node.slots:
+                if leaf[1] == key:
+                    return leaf[2]
+            return _MISSING
+        bit = 1 << ((h >> shift) & 31)
+        if not node.bitmap & bit:
+            return _MISSING
+        child = node.slots[_popcount(node.bitmap & (bit - 1))]
+        if type(child) is tuple:
+            if child[0] == h and (child[1] is key or child[1] == key):
+                return child[2]
+            return _MISSING
+        node = child
+        shift += 5
+
+
+def _trie_set(node, shift, leaf, owner):
+    # Return the node with `leaf` added or replaced, together with a
+    # flag to indicate whether the number of leaves has grown.
+    h, key, value = leaf
+    if type(node) is _Collision:
+        if h != node.hash:
+            wrapper = _Trie(1 << ((node.hash >> shift) & 31), [node], owner)
+            return _trie_set(wrapper, shift, leaf, owner)
+        for i, existing in enumerate(node.slots):
+            if existing[1] == key:
+                if existing[2] is value:
+                    return node, False
+                node = _editable(node, owner)
+                node.slots[i] = leaf
+                return node, False
+        node = _editable(node, owner)
+        node.slots.append(leaf)
+        return node, True
+    bit = 1 << ((h >> shift) & 31)
+    i = _popcount(node.bitmap & (bit - 1))
+    if not node.bitmap & bit:
+        node = _editable(node, owner)
+        node.bitmap |= bit
+        node.slots.insert(i, leaf)
+        return node, True
+    child = node.slots[i]
+    if type(child) is tuple:
+        if child[0] == h and (child[1] is key or child[1] == key):
+            if child[2] is value:
+                return node, False
+            replacement, added = leaf, False
+        elif child[0] == h:
+            replacement, added = _Collision(h, [child, leaf], owner), True
+        else:
+            replacement, _ = _trie_set(_Trie(0, [], owner), shift + 5, child, owner)
+            replacement, added = _trie_set(replacement, shift + 5, leaf, owner)
+    else:
+        replacement, added = _trie_set(child, shift + 5, leaf, owner)
+        if replacement is child:
+            return node, added
+    node = _editable(node, owner)
+    node.slots[i] = replacement
+    return node, added
+
+
+def _trie_discard(node, shift, h, key, owner):
+    # Return the node with the leaf for `key` removed, together with a
+    # flag to indicate whether such a leaf existed. The node returned
+    # may instead be a single leaf, or None, if that is all that remains.
+    if type(node) is _Collision:
+        if h != node.hash:
+            return node, False
+        for i, existing in enumerate(node.slots):
+            if existing[1] == key:
+                if len(node.slots) == 2:
+                    return node.slots[1 - i], True
+                node = _editable(node, owner)
+                del node.slots[i]
+                return node, True
+        return node, False
+    bit = 1 << ((h >> shift) & 31)
+    if not node.bitmap & bit:
+        return node, False
+    i = _popcount(node.bitmap & (bit - 1))
+    child = node.slots[i]
+    if type(child) is tuple:
+        if not (child[0] == h and (child[1] is key or child[1] == key)):
+            return node, False
+        replacement = None
+    else:
+        replacement, removed = _trie_discard(child, shift + 5, h, key, owner)
+        if not removed:
+            return node, False
+    if replacement is None:
+        if len(node.slots) == 1:
+            return None, True
+        if len(node.slots) == 2 and shift > 0 and type(node.slots[1 - i]) is tuple:
+            return node.slots[1 - i], True
+        node = _editable(node, owner)
+        node.bitmap ^= bit
+        del node.slots[i]
+        return node, True
+    if len(node.slots) == 1 and shift > 0 and type(replacement) is tuple:
+        return replacement, True
+    node = _editable(node, owner)
+    node.slots[i] = replacement
+    return node, True
+
+
+def _trie_build(leaves, shift=0):
+    # Build a trie from a list of leaves with distinct keys in a single
+    # pass, without the copying involved in adding them one by one.
+    buckets = {}
+    for leaf in leaves:
+        buckets.setdefault((leaf[0] >> shift) & 31, []).append(leaf)
+    bitmap = 0
+    slots = []
+    for i in sorted(buckets):
+        bucket = buckets[i]
+        bitmap |= 1 << i
+        if len(bucket) == 1:
+            slots.append(bucket[0])
+        elif all(leaf[0] == bucket[0][0] for leaf in bucket):
+            slots.append(_Collision(bucket[0][0], bucket))
+        else:
+            slots.append(_trie_build(bucket, shift + 5))
+    return _Trie(bitmap, slots)
+
+
+def _trie_leaves(node):
+    for child in node.slots:
+        if type(child) is tuple:
+            yield child
+        else:
+            for leaf in _trie_leaves(child):
+                yield leaf
+
+
+def _trie_root(node):
+    # Wrap a single leaf that has been promoted to the root.
+    if node is None:
+        return _EMPTY_TRIE
+    elif type(node) is tuple:
+        return _Trie(1 << (node[0] & 31), [node])
+    else:
+        return node
+
+
+def _trie_subtree_leaves(node):
+    if node is None:
+        return ()
+    elif type(node) is tuple:
+        return (node,)
+    elif type(node) is _Collision:
+        return node.slots
+    else:
+        return _trie_leaves(node)
+
+
+def _trie_diff(a, b, shift=0):
+    # Yield (key, value in a, value in b) for each leaf that differs
+    # between two tries, either of which may be None. Subtrees shared
+    # by both are skipped, so that the cost is in proportion to the
+    # difference where one trie has been derived from the other.
+    if a is b:
+        return
+    if type(a) is _Trie and type(b) is _Trie:
+        bits = a.bitmap | b.bitmap
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            child_a = a.slots[_popcount(a.bitmap & (bit - 1))] if a.bitmap & bit else None
+            child_b = b.slots[_popcount(b.bitmap & (bit - 1))] if b.bitmap & bit else None
+            for difference in _trie_diff(child_a, child_b, shift + 5):
+                yield difference
+        return
+    old = {leaf[1]: leaf[2] for leaf in _trie_subtree_leaves(a)}
+    for _, key, value in _trie_subtree_leaves(b):
+        old_value = old.pop(key, _MISSING)
+        if old_value is not value:
+            yield key, old_value, value
+    for key, value in old.items():
+        yield key, value, _MISSING
+
+
+class _TrieEditor(object):
+    # Shared machinery for in-place editing of a trie, used to build
+    # new persistent collections without copying a node more than once.
+
+    def __init__(self, root, size, source=None):
+        self._root = root
+        self._len = size
+        self._owner = object()
+        self._source = source
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, key):
+        return _trie_get(self._root, hash(key) & _HASH_MASK, key) is not _MISSING
+
+    def _set(self, key, value):
+        self._root, added = _trie_set(self._root, 0, (hash(key) & _HASH_MASK, key, value), self._owner)
+        if added:
+            self._len += 1
+
+    def _discard(self, key):
+        root, removed = _trie_discard(self._root, 0, hash(key) & _HASH_MASK, key, self._owner)
+        if removed:
+            self._root = _trie_root(root)
+            self._len -= 1
+        return removed
+
+    def _finish(self, cls):
+        # Return a collection of the current contents, or the source
+        # collection if unchanged, and start afresh so that further
+        # edits cannot touch the collection that has been returned.
+        if self._source is None or self._source._root is not self._root:
+            self._owner = object()
+            self._source = cls._new(self._root, self._len)
+        return self._source
+
+
+class PersistentMap(Mapping):
+    """ An immutable mapping, implemented as a hash array mapped trie.
+
+    Methods that would modify a :class:`dict` instead return a new map,
+    which shares all unchanged structure with the original. A single
+    change therefore costs time and memory logarithmic in the size of
+    the map, rather than linear as for a copy. Batches of changes can be
+    made cheaply through an :meth:`.evolver`.
+    """
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, iterable=()):
+        if isinstance(iterable, PersistentMap):
+            self._root, self._len = iterable._root, iterable._len
+        else:
+            items = dict(iterable)
+            self._root = _trie_build([(hash(key) & _HASH_MASK, key, value) for key, value in items.items()])
+            self._len = len(items)
+
+    @classmethod
+    def _new(cls, root, size):
+        inst = object.__new__(cls)
+        inst._root = root
+        inst._len = size
+        return inst
+
+    def __repr__(self):
+        return "{}({{{}}})".format(self.__class__.__name__,
+                                   ", ".join("{!r}: {!r}".format(key, value) for key, value in self.items()))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for leaf in _trie_leaves(self._root):
+            yield leaf[1]
+
+    def __contains__(self, key):
+        return _trie_get(self._root, hash(key) & _HASH_MASK, key) is not _MISSING
+
+    def __getitem__(self, key):
+        value = _trie_get(self._root, hash(key) & _HASH_MASK, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = _trie_get(self._root, hash(key) & _HASH_MASK, key)
+        if value is _MISSING:
+            return default
+        return value
+
+    def items(self):
+        return _PersistentItemsView(self)
+
+    def values(self):
+        return _PersistentValuesView(self)
+
+    def set(self, key, value):
+        """ Return a new map in which `key` maps to `value`.
+        """
+        root, added = _trie_set(self._root, 0, (hash(key) & _HASH_MASK, key, value), None)
+        if root is self._root:
+            return self
+        return self._new(root, self._len + 1 if added else self._len)
+
+    def discard(self, key):
+        """ Return a new map without `key`, or this map if `key` is absent.
+        """
+        root, removed = _trie_discard(self._root, 0, hash(key) & _HASH_MASK, key, None)
+        if not removed:
+            return self
+        return self._new(_trie_root(root), self._len - 1)
+
+    def update(self, iterable):
+        """ Return a new map with all the key-value pairs from `iterable`
+        added to those in this map.
+        """
+        editor = self.evolver()
+        for key, value in iter_items(iterable):
+            editor[key] = value
+        return editor.persistent()
+
+    def diff(self, other, missing=None):
+        """ Iterate through all keys whose values differ between this map
+        and `other`, yielding a triple of the key, the value in this map
+        and the value in `other`. A key absent from either map is given
+        the value `missing` for that map. Values are compared by
+        identity only.
+
+        Structure shared by the two maps is skipped, so two maps derived
+        from a common source can be compared in time proportional to
+        the changes made to each.
+        """
+        if not isinstance(other, PersistentMap):
+            raise TypeError("Can only diff with another PersistentMap")
+        return ((key,
+                 missing if old_value is _MISSING else old_value,
+                 missing if new_value is _MISSING else new_value)
+                for key, old_value, new_value in _trie_diff(self._root, other._root))
+
+    def evolver(self):
+        """ Return a :class:`.PersistentMapEvolver` for making a batch of
+        changes to this map.
+        """
+        return PersistentMapEvolver(self._root, self._len, self)
+
+
+class _PersistentItemsView(ItemsView):
+
+    def __iter__(self):
+        for leaf in _trie_leaves(self._mapping._root):
+            yield leaf[1], leaf[2]
+
+
+class _PersistentValuesView(ValuesView):
+
+    def __iter__(self):
+        for leaf in _trie_leaves(self._mapping._root):
+            yield leaf[2]
+
+
+class PersistentMapEvolver(_TrieEditor):
+    """ A mutable builder for a :class:`.PersistentMap`.
+
+    Changes made through an evolver copy each trie node at most once,
+    however many keys within it are changed. Calling :meth:`.persistent`
+    returns a map of the current contents; the evolver can continue to
+    be used afterwards without affecting that map.
+    """
+
+    def __getitem__(self, key):
+        value = _trie_get(self._root, hash(key) & _HASH_MASK, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = _trie_get(self._root, hash(key) & _HASH_MASK, key)
+        if value is _MISSING:
+            return default
+        return value
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+
+    def __delitem__(self, key):
+        if not self._discard(key):
+            raise KeyError(key)
+
+    def discard(self, key):
+        """ Remove `key`, if present.
+        """
+        self._discard(key)
+
+    def persistent(self):
+        """ Return a :class:`.PersistentMap` of the current contents.
+        """
+        return self._finish(PersistentMap)
+
+
+class PersistentSet(Set):
+    """ An immutable set, implemented as a hash array mapped trie.
+
+    As for :class:`.PersistentMap`, methods that would modify a
+    :class:`set` instead return a new set that shares all unchanged
+    structure with the original.
+    """
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, iterable=()):
+        if isinstance(iterable, PersistentSet):
+            self._root, self._len = iterable._root, iterable._len
+        else:
+            elements = set(iterable)
+            self._root = _trie_build([(hash(element) & _HASH_MASK, element, True) for element in elements])
+            self._len = len(elements)
+
+    @classmethod
+    def _new(cls, root, size):
+        inst = object.__new__(cls)
+        inst._root = root
+        inst._len = size
+        return inst
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return cls(iterable)
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, list(self))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for leaf in _trie_leaves(self._root):
+            yield leaf[1]
+
+    def __contains__(self, element):
+        return _trie_get(self._root, hash(element) & _HASH_MASK, element) is not _MISSING
+
+    __hash__ = Set._hash
+
+    def add(self, element):
+        """ Return a new set that also contains `element`.
+        """
+        root, added = _trie_set(self._root, 0, (hash(element) & _HASH_MASK, element, True), None)
+        if root is self._root:
+            return self
+        return self._new(root, self._len + 1 if added else self._len)
+
+    def discard(self, element):
+        """ Return a new set without `element`, or this set if `element`
+        is absent.
+        """
+        root, removed = _trie_discard(self._root, 0, hash(element) & _HASH_MASK, element, None)
+        if not removed:
+            return self
+        return self._new(_trie_root(root), self._len - 1)
+
+    def update(self, iterable):
+        """ Return a new set that also contains all elements of `iterable`.
+        """
+        editor = self.evolver()
+        for element in iterable:
+            editor.add(element)
+        return editor.persistent()
+
+    def evolver(self):
+        """ Return a :class:`.PersistentSetEvolver` for making a batch of
+        changes to this set.
+        """
+        return PersistentSetEvolver(self._root, self._len, self)
+
+
+class PersistentSetEvolver(_TrieEditor):
+    """ A mutable builder for a :class:`.PersistentSet`.
+    """
+
+    def __iter__(self):
+        for leaf in _trie_leaves(self._root):
+            yield leaf[1]
+
+    def add(self, element):
+        """ Add `element`, if absent.
+        """
+        self._set(element, True)
+
+    def discard(self, element):
+        """ Remove `element`, if present.
+        """
+        self._discard(element)
+
+    def persistent(self):
+        """ Return a :class:`.PersistentSet` of the current contents.
+        """
+        return self._finish(PersistentSet)
+
+
 def iter_items(iterable):
     """ Iterate through all items (key-value pairs) within an iterable
     dictionary-like object. If the object has a `keys` method, this is
@@ -75,7 +75,6 @@ class Value(object):
         =====================  ===============  ===========  =====
 
         """
-        from cypy.graph import Node, Relationship, Path
         if value is None:
             return cls.coerce_null(value)
         elif isinstance(value, bool):
@@ -90,7 +89,8 @@ class Value(object):
             return cls.coerce_string(value, encoding)
         elif isinstance(value, bytes_types):
             return cls.coerce_bytes(value, encoding)
-        elif isinstance(value, Node):
+        from cypy.graph import Node, Relationship, Path
+        if isinstance(value, Node):
             return cls.coerce_node(value, encoding)
         elif isinstance(value, Relationship):
             return cls.coerce_relationship(value, encoding)
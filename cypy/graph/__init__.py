@@ -22,31 +22,35 @@ General purpose graph data storage classes for both mutable and immutable data.
 
 
 from collections import Sequence, Set
-from itertools import chain
+from copy import copy
+from heapq import nlargest, nsmallest
+from itertools import chain, islice
 
 try:
     from collections.abc import Mapping
 except ImportError:
     from collections import Mapping
 
-from cypy.graph.store import GraphStructure, MutableGraphStore, FrozenGraphStore, GraphStore
+from cypy.graph.columns import columns, filter_keys
+from cypy.graph.store import GraphStructure, MutableGraphStore, FrozenGraphStore, GraphStore, \
+    NodeEntry, RelationshipEntry, PropertyRecord, index_value
 
 
 class Subgraph(GraphStructure):
     """ A Subgraph is the base class for all composable graph structures.
     """
 
+    __slots__ = ()
+
     @staticmethod
     def union(*graph_structures):
-        store = MutableGraphStore()
+        stores = []
         for graph_structure in graph_structures:
             try:
-                sub_store = graph_structure.__graph_store__()
+                stores.append(graph_structure.__graph_store__())
             except AttributeError:
                 raise TypeError("{} object is not a graph structure".format(type(graph_structure)))
-            else:
-                store.update(sub_store)
-        return FrozenGraph(store)
+        return FrozenGraph(FrozenGraphStore().union(*stores))
 
     def __graph_order__(self):
         return self._store.node_count()
@@ -69,6 +73,8 @@ class Subgraph(GraphStructure):
 
 class Entity(Subgraph, Mapping):
 
+    __slots__ = ()
+
     _id = None
 
     @property
@@ -78,13 +84,30 @@ class Entity(Subgraph, Mapping):
         return self._id
 
 
+# Entities are weakly referenceable, for identity maps. On Python 2,
+# the Mapping base class has no slots, so already provides this.
+_weakref_slot = () if hasattr(Entity, "__weakref__") else ("__weakref__",)
+
+
 class Node(Entity):
     """ A Node is an graph object that can be connected by one or more
     relationships.
+
+    A standalone node holds its labels and properties inline, and only
+    builds a store of its own when one is required, such as for a union
+    with another graph structure. A node view holds only its key and
+    the store to which it is attached.
     """
 
+    __slots__ = ("_id", "_store", "_labels", "_property_record") + _weakref_slot
+
     __labels__ = ()
 
+    def __graph_store__(self):
+        if self._store is None:
+            self._store = FrozenGraphStore._from_entries([(self._id, self._entry())])
+        return self._store
+
     def __graph_order__(self):
         return 1
 
@@ -97,21 +120,37 @@ class Node(Entity):
         """
         inst = super(Node, cls).__new__(cls)
         inst._id = n_key
-        inst._store = FrozenGraphStore.build({inst._id: (list(chain(cls.__labels__, labels)), properties)})
+        inst._store = None
+        inst._labels = frozenset(chain(cls.__labels__, labels))
+        inst._property_record = PropertyRecord(properties)
         return inst
 
     @classmethod
     def view(cls, graph_structure, n_key):
-        """ Construct a Node attached to an existing store.
+        """ Construct a Node attached to an existing store, or return
+        the existing view from the identity map of that store, if it has
+        one.
         """
+        store = graph_structure.__graph_store__()
+        views = store._views
+        if views is not None:
+            inst = views.get((cls, n_key))
+            if inst is not None:
+                return inst
         inst = super(Node, cls).__new__(cls)
         inst._id = n_key
-        inst._store = graph_structure.__graph_store__()
+        inst._store = store
+        inst._labels = None
+        inst._property_record = None
+        if views is not None:
+            views[(cls, n_key)] = inst
         return inst
 
     def __init__(self, *labels, **properties):
         self._id = FrozenGraphStore.new_node_key()
-        self._store = FrozenGraphStore.build({self._id: (list(chain(self.__labels__, labels)), properties)})
+        self._store = None
+        self._labels = frozenset(chain(self.__labels__, labels))
+        self._property_record = PropertyRecord(properties)
 
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, ", ".join(
@@ -169,17 +208,27 @@ class Node(Entity):
 
         :return: `frozenset` containing labels as strings
         """
+        if self._labels is not None:
+            return self._labels
         labels = self._store.node_labels(self._id)
         if labels is None:
             raise KeyError("Entity not found in the graph")
         return labels
 
     def _properties(self):
+        if self._property_record is not None:
+            return self._property_record
         properties = self._store.node_properties(self._id)
         if properties is None:
             raise KeyError("Entity not found in the graph")
         return properties
 
+    def _entry(self):
+        # Return the detail of this node in the form held by a frozen store.
+        if self._labels is not None:
+            return NodeEntry(self._labels, self._property_record)
+        return FrozenGraphStore.node_entry((self.labels(), self._properties()))
+
     def keys(self):
         """ Return the property keys for this node.
         """
@@ -198,57 +247,81 @@ class Node(Entity):
 
 class Relationship(Entity):
     """ Immutable relationship object.
+
+    As for :class:`.Node`, a standalone relationship holds its
+    properties and nodes inline, and only builds a store of its own,
+    covering itself and its nodes, when one is required. The detail of
+    each node is captured when the relationship is constructed, so
+    later changes to a node view are not seen.
     """
 
+    __slots__ = ("_id", "_store", "_nodes", "_node_entries", "_property_record") + _weakref_slot
+
+    def __graph_store__(self):
+        if self._store is None:
+            r_entry = RelationshipEntry(type(self), tuple(node.id for node in self._nodes), self._property_record)
+            n_entries = self._node_entries or [node._entry() for node in self._nodes]
+            self._store = FrozenGraphStore._from_entries([(node.id, n_entry) for node, n_entry
+                                                          in zip(self._nodes, n_entries)],
+                                                         [(self._id, r_entry)])
+        return self._store
+
+    @staticmethod
+    def _capture(nodes):
+        # Return the entries of `nodes` if any is a view, whose detail
+        # may later change, or None if all are standalone.
+        for node in nodes:
+            if node._labels is None:
+                return tuple(node._entry() for node in nodes)
+        return None
+
     def __graph_order__(self):
-        return len(set(self._store.relationship_nodes(self._id)))
+        return len({node.id for node in self._nodes})
 
     def __graph_size__(self):
         return 1
 
     @classmethod
     def build(cls, r_key, properties, *nodes):
-        node_keys = []
-        node_dict = {}
-        for node in nodes:
-            store = node.__graph_store__()
-            other_node_key = list(store.nodes())[0]
-            node_labels = store.node_labels(other_node_key)
-            node_properties = store.node_properties(other_node_key)
-            node_key = node.id
-            node_keys.append(node_key)
-            node_dict[node_key] = (node_labels, node_properties)
         inst = super(Relationship, cls).__new__(cls)
         inst._id = r_key
-        inst._store = FrozenGraphStore.build(node_dict, {inst._id: (cls, node_keys, properties)})
+        inst._store = None
         inst._nodes = tuple(nodes)
+        inst._node_entries = cls._capture(nodes)
+        inst._property_record = PropertyRecord(properties)
         return inst
 
     @classmethod
     def view(cls, graph_structure, r_key):
+        """ Construct a Relationship attached to an existing store, or
+        return the existing view from the identity map of that store, if
+        it has one.
+        """
+        store = graph_structure.__graph_store__()
+        views = store._views
+        if views is not None:
+            inst = views.get((cls, r_key))
+            if inst is not None:
+                return inst
         inst = super(Relationship, cls).__new__(cls)
         inst._id = r_key
-        inst._store = graph_structure.__graph_store__()
-        inst._nodes = tuple(Node.view(inst, n_key) for n_key in inst._store.relationship_nodes(r_key))
+        inst._store = store
+        inst._nodes = tuple(Node.view(store, n_key) for n_key in store.relationship_nodes(r_key))
+        inst._node_entries = None
+        inst._property_record = None
+        if views is not None:
+            views[(cls, r_key)] = inst
         return inst
 
     def __init__(self, *nodes, **properties):
-        type_ = type(self)
-        node_keys = []
-        node_dict = {}
         for node in nodes:
             if not isinstance(node, Node):
                 raise ValueError("Relationships can only connect nodes (%r passed)" % node)
-            store = node.__graph_store__()
-            other_node_key = list(store.nodes())[0]
-            node_labels = store.node_labels(other_node_key)
-            node_properties = store.node_properties(other_node_key)
-            node_key = node.id
-            node_keys.append(node_key)
-            node_dict[node_key] = (node_labels, node_properties)
         self._id = FrozenGraphStore.new_relationship_key()
-        self._store = FrozenGraphStore.build(node_dict, {self._id: (type_, node_keys, properties)})
-        self._nodes = tuple(nodes)
+        self._store = None
+        self._nodes = nodes
+        self._node_entries = self._capture(nodes)
+        self._property_record = PropertyRecord(properties)
 
     def __repr__(self):
         return "{}({})".format(type(self).__name__, ", ".join(
@@ -261,29 +334,29 @@ class Relationship(Entity):
             return "()-[:{}]->()".format(type(self).__name__)
 
     def __bool__(self):
-        return bool(self._store.relationship_properties(self._id))
+        return bool(self._relationship_properties())
 
     def __nonzero__(self):
-        return bool(self._store.relationship_properties(self._id))
+        return bool(self._relationship_properties())
 
     def __len__(self):
-        return len(self._store.relationship_properties(self._id))
+        return len(self._relationship_properties())
 
     def __iter__(self):
-        return iter(self._store.relationship_properties(self._id))
+        return iter(self._relationship_properties())
 
     def __getitem__(self, key):
-        return self._store.relationship_properties(self._id)[key]
+        return self._relationship_properties()[key]
 
     def __setitem__(self, key, value):
-        properties = self._store.relationship_properties(self._id)
+        properties = self._relationship_properties()
         try:
             properties[key] = value
         except TypeError:
             raise TypeError("Relationship does not support property assignment")
 
     def __delitem__(self, key):
-        properties = self._store.relationship_properties(self._id)
+        properties = self._relationship_properties()
         try:
             del properties[key]
         except TypeError:
@@ -307,20 +380,25 @@ class Relationship(Entity):
         """
         return self._nodes
 
+    def _relationship_properties(self):
+        if self._property_record is not None:
+            return self._property_record
+        return self._store.relationship_properties(self._id)
+
     def keys(self):
         """ Return the property keys for this relationship.
         """
-        return self._store.relationship_properties(self._id).keys()
+        return self._relationship_properties().keys()
 
     def values(self):
         """ Return the property values for this relationship.
         """
-        return self._store.relationship_properties(self._id).values()
+        return self._relationship_properties().values()
 
     def items(self):
         """ Return the full set of properties for this relationship.
         """
-        return self._store.relationship_properties(self._id).items()
+        return self._relationship_properties().items()
 
 
 class Path(Subgraph):
@@ -374,13 +452,19 @@ class Path(Subgraph):
 
 class FrozenGraph(Subgraph):
     """ Immutable graph data structure.
+
+    If `identity_map` is true, nodes and relationships selected from
+    the graph are held in a weak identity map, as described for
+    :meth:`.GraphStore.enable_identity_map`.
     """
 
-    def __init__(self, graph_structure=None):
+    def __init__(self, graph_structure=None, identity_map=False):
         if graph_structure is None:
             self._store = FrozenGraphStore()
         else:
             self._store = FrozenGraphStore(graph_structure.__graph_store__())
+        if identity_map:
+            self._store.enable_identity_map()
 
     def nodes(self, *labels):
         """ Select one or more nodes by label.
@@ -389,25 +473,42 @@ class FrozenGraph(Subgraph):
         :return: an iterable selection of nodes
         :rtype: :class:`.NodeSelection`
         """
-        return NodeSelection(self._store, self._store.nodes(*labels))
+        return NodeSelection(self._store, labels=labels)
 
     def relationships(self, r_type=None, nodes=()):
         """ Select one or more relationships by type and endpoints.
         """
         if isinstance(nodes, Sequence):
-            return RelationshipSelection(self._store, self._store.relationships(r_type, [node.id for node in nodes]))
+            return RelationshipSelection(self._store, r_type=r_type, n_ids=[node.id for node in nodes])
         elif isinstance(nodes, Set):
-            return RelationshipSelection(self._store, self._store.relationships(r_type, {node.id for node in nodes}))
+            return RelationshipSelection(self._store, r_type=r_type, n_ids={node.id for node in nodes})
         else:
             raise TypeError("Nodes must be supplied as a Sequence or a Set")
 
+    def match(self, query, parameters=None):
+        """ Match patterns against this graph.
+
+        :param query: a :class:`.Query` or a string containing a query in
+                      the subset of Cypher understood by
+                      :func:`cypy.graph.matching.parse`
+        :param parameters: values for any parameters in a string query
+        :return: an iterator of :class:`.Record` objects
+        """
+        return match_query(self, query, parameters)
+
 
 class Graph(Subgraph):
     """ Mutable graph data structure.
+
+    If `identity_map` is true, nodes and relationships selected from
+    the graph are held in a weak identity map, as described for
+    :meth:`.GraphStore.enable_identity_map`.
     """
 
-    def __init__(self, graph_structure=None):
+    def __init__(self, graph_structure=None, identity_map=False):
         self._store = MutableGraphStore()
+        if identity_map:
+            self._store.enable_identity_map()
         if graph_structure is not None:
             self._store.update(graph_structure.__graph_store__())
 
@@ -424,6 +525,33 @@ class Graph(Subgraph):
         n_key, = self._store.add_nodes([(labels, properties)])
         return Node.view(self, n_key)
 
+    def merge(self, label, key_properties, **properties):
+        """ Match or create a node.
+
+        If a node with `label` and all of `key_properties` already
+        exists, its other `properties` are updated. Otherwise a new node
+        is created with the label, the key properties and the other
+        properties.
+
+        :param label:
+        :param key_properties: dictionary of properties that identify the node
+        :param properties:
+        :return: the matched or created node
+        """
+        n_key, = self._store.merge_nodes([(label, key_properties, properties)])
+        return Node.view(self, n_key)
+
+    def snapshot(self):
+        """ Return an immutable copy of this graph as it stands.
+
+        Unlike :class:`.FrozenGraph`, this takes a consistent copy
+        under the store lock, and only copies entries changed since the
+        previous snapshot.
+
+        :rtype: :class:`.FrozenGraph`
+        """
+        return FrozenGraph(self._store.snapshot())
+
     def nodes(self, *labels):
         """ Select one or more nodes by label.
 
@@ -431,67 +559,439 @@ class Graph(Subgraph):
         :return: an iterable selection of nodes
         :rtype: :class:`.NodeSelection`
         """
-        return NodeSelection(self._store, self._store.nodes(*labels))
+        return NodeSelection(self._store, labels=labels)
 
     def relationships(self, r_type=None, nodes=()):
         """ Select one or more relationships by type and endpoints.
         """
         if isinstance(nodes, Sequence):
-            return RelationshipSelection(self._store, self._store.relationships(r_type, [node.id for node in nodes]))
+            return RelationshipSelection(self._store, r_type=r_type, n_ids=[node.id for node in nodes])
         elif isinstance(nodes, Set):
-            return RelationshipSelection(self._store, self._store.relationships(r_type, {node.id for node in nodes}))
+            return RelationshipSelection(self._store, r_type=r_type, n_ids={node.id for node in nodes})
         else:
             raise TypeError("Nodes must be supplied as a Sequence or a Set")
 
+    def match(self, query, parameters=None):
+        """ Match patterns against this graph.
+
+        :param query: a :class:`.Query` or a string containing a query in
+                      the subset of Cypher understood by
+                      :func:`cypy.graph.matching.parse`
+        :param parameters: values for any parameters in a string query
+        :return: an iterator of :class:`.Record` objects
+        """
+        return match_query(self, query, parameters)
+
+
+# Properties of an entity that is missing from its store.
+_NO_PROPERTIES = {}
+
+
+class _Descending(object):
+    # Wrapper for a sort key component that reverses its order.
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
 
-class NodeSelection(GraphStructure):
-    """ A selection of nodes.
+
+class Selection(GraphStructure):
+    """ Base class for lazy selections of entities from a store.
+
+    A selection is an iterator over entity views. The operators
+    :meth:`.where`, :meth:`.order_by`, :meth:`.skip` and :meth:`.limit`
+    each return a new selection, leaving the original unchanged, and
+    no work is done until the selection is iterated or queried. Only
+    entities actually returned are constructed as views; keys are used
+    throughout otherwise.
     """
 
+    __slots__ = ("_store", "_source", "_conditions", "_order", "_skip", "_limit", "_selection")
+
     def __graph_store__(self):
         return self._store
 
-    def __init__(self, store, selection):
+    def __init__(self, store, selection=None):
+        if selection is not None and iter(selection) is selection:
+            # An iterator can be read only once, but a selection may be
+            # read many times.
+            selection = frozenset(selection)
         self._store = store
-        self._selection = selection
+        self._source = selection
+        self._conditions = ()
+        self._order = ()
+        self._skip = 0
+        self._limit = None
+        self._selection = None
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        return Node.view(self, next(self._selection))
+        if self._selection is None:
+            self._selection = self._keys()
+        return self._view(next(self._selection))
 
     def next(self):
         return self.__next__()
 
+    def _copy(self, **changes):
+        # Return a new, unstarted selection with some attributes changed.
+        inst = copy(self)
+        inst._selection = None
+        for name, value in changes.items():
+            setattr(inst, name, value)
+        return inst
+
+    def _check_unsliced(self, operation):
+        if self._skip or self._limit is not None:
+            raise ValueError("Cannot apply {} to a selection after skip or limit".format(operation))
+
+    def where(self, **properties):
+        """ Select only those entities whose properties equal all of
+        `properties`. As in Cypher, a condition on a null value
+        matches nothing.
+        """
+        self._check_unsliced("where")
+        conditions = tuple((key, value, index_value(value)) for key, value in sorted(properties.items()))
+        return self._copy(_conditions=self._conditions + conditions)
+
+    def order_by(self, *keys, **kwargs):
+        """ Order entities by the values of the properties `keys`, in
+        Cypher ``ORDER BY`` order. As in Cypher, null values come last
+        in ascending order and first in descending order.
+
+        A `descending` keyword argument may be given, either as a single
+        flag for all keys or as a sequence of flags, one for each key.
+
+        If a limit is also applied, only the entities within it are
+        kept in order, rather than sorting the whole selection. A
+        :class:`.NodeSelection` ordered by a single property that has an
+        ordered index for one of its labels reads that index instead.
+        """
+        descending = kwargs.pop("descending", False)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: {}".format(", ".join(sorted(kwargs))))
+        self._check_unsliced("order_by")
+        if isinstance(descending, bool):
+            descending = [descending] * len(keys)
+        else:
+            descending = list(map(bool, descending))
+            if len(descending) != len(keys):
+                raise ValueError("Expected {} descending flags, got {}".format(len(keys), len(descending)))
+        return self._copy(_order=tuple(zip(keys, descending)))
+
+    def skip(self, count):
+        """ Skip the first `count` entities.
+        """
+        if count < 0:
+            raise ValueError("Skip count must not be negative")
+        limit = None if self._limit is None else max(self._limit - count, 0)
+        return self._copy(_skip=self._skip + count, _limit=limit)
+
+    def limit(self, count):
+        """ Select no more than `count` entities.
+        """
+        if count < 0:
+            raise ValueError("Limit count must not be negative")
+        limit = count if self._limit is None else min(self._limit, count)
+        return self._copy(_limit=limit)
+
+    def keys(self):
+        """ Return an iterator over the keys of the selected entities.
+        """
+        return self._keys()
+
+    def count(self):
+        """ Count the selected entities, without constructing any.
+        """
+        count = self._count()
+        count = max(count - self._skip, 0)
+        if self._limit is not None:
+            count = min(count, self._limit)
+        return count
+
+    def exists(self):
+        """ Return :const:`True` if at least one entity is selected.
+        """
+        if self._limit == 0:
+            return False
+        for _ in islice(self._filtered(), self._skip, None):
+            return True
+        return False
+
+    def values(self, *keys, **kwargs):
+        """ Return the values of the properties `keys` across all
+        selected entities, as a list of :class:`.Column` objects, one
+        for each key. Values are read directly from the store, without
+        constructing any entity views, and rows are in selection order.
+
+        A `use_numpy` keyword argument may be given, as for
+        :func:`cypy.graph.columns.column`.
+        """
+        use_numpy = kwargs.pop("use_numpy", None)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: {}".format(", ".join(sorted(kwargs))))
+        return columns(self._property_maps(self._keys()), keys, use_numpy)
+
+    def filter(self, expression, use_numpy=None):
+        """ Return the set of keys of those selected entities for which
+        a predicate `expression` holds, as evaluated over columns of
+        property values by :func:`cypy.graph.columns.filter_keys`.
+
+        The result can be combined with other key sets by the usual set
+        operators, and views of the entities can be selected by passing
+        it to a new :class:`.NodeSelection` or
+        :class:`.RelationshipSelection`.
+        """
+        keys = list(self._keys())
+        return filter_keys(keys, self._property_maps(keys), expression, use_numpy)
+
+    def first(self):
+        """ Return the first entity selected, or :const:`None` if none
+        are.
+        """
+        for key in islice(self._keys(), 1):
+            return self._view(key)
+        return None
+
+    def _keys(self):
+        stop = None if self._limit is None else self._skip + self._limit
+        if self._order:
+            keys = self._ordered()
+            if keys is None:
+                keys = self._sorted(self._filtered(), stop)
+        else:
+            keys = self._filtered()
+        if self._skip or stop is not None:
+            keys = islice(keys, self._skip, stop)
+        return iter(keys)
+
+    def _sorted(self, keys, count=None):
+        # Return a list of `keys` in order, or of only the first `count`
+        # keys if given, selected by heap rather than by a full sort.
+        keys = list(keys)
+        descending = [flag for _, flag in self._order]
+        order_key = self._order_key
+        reverse = all(descending)
+        if any(descending) and not reverse:
+            order_key = self._mixed_order_key
+        rows = zip(keys, self._property_maps(keys))
+        if count is None:
+            rows = sorted(rows, key=order_key, reverse=reverse)
+        elif reverse:
+            rows = nlargest(count, rows, key=order_key)
+        else:
+            rows = nsmallest(count, rows, key=order_key)
+        return [key for key, _ in rows]
+
+    def _order_key(self, row):
+        _, properties = row
+        values = []
+        for p_key, _ in self._order:
+            value = properties.get(p_key)
+            values.append((1,) if value is None else (0, index_value(value)))
+        return values
+
+    def _mixed_order_key(self, row):
+        values = self._order_key(row)
+        for i, (_, descending) in enumerate(self._order):
+            if descending:
+                values[i] = _Descending(values[i])
+        return values
+
+    def _null_keys(self, p_key):
+        # Yield the keys selected that have no value for `p_key`.
+        keys = list(self._filtered())
+        for key, properties in zip(keys, self._property_maps(keys)):
+            if properties.get(p_key) is None:
+                yield key
+
+    def _ordered(self):
+        # Return an iterator over the keys selected, in order, if an
+        # index can supply that order, or None otherwise.
+        return None
+
+    def _matches(self, key):
+        properties = self._properties(key)
+        for p_key, _, value in self._conditions:
+            p_value = properties.get(p_key)
+            if p_value is None or index_value(p_value) != value:
+                return False
+        return True
+
+    def _filtered(self):
+        # Return an iterator over the keys selected, before ordering,
+        # skip and limit are applied.
+        keys = self._candidates()
+        if self._conditions:
+            keys = filter(self._matches, keys)
+        return keys
+
+    def _count(self):
+        return sum(1 for _ in self._filtered())
+
+    def _candidates(self):
+        raise NotImplementedError()
+
+    def _properties(self, key):
+        raise NotImplementedError()
+
+    def _property_maps(self, keys):
+        # Return a list of the property mappings for `keys`.
+        return [self._properties(key) for key in keys]
+
+    def _view(self, key):
+        raise NotImplementedError()
+
+
+class NodeSelection(Selection):
+    """ A selection of nodes, optionally with all of a set of labels.
+
+    Where a condition given to :meth:`.where` is on a property that is
+    indexed for one of the labels, candidate nodes are looked up in that
+    index rather than scanned.
+    """
+
+    __slots__ = ("_labels",)
+
+    def __init__(self, store, selection=None, labels=()):
+        super(NodeSelection, self).__init__(store, selection)
+        self._labels = frozenset(labels)
+
+    def _candidates(self):
+        store = self._store
+        if self._source is not None:
+            if not self._labels:
+                return iter(self._source)
+            return (n_id for n_id in self._source if self._labels <= set(store.node_labels(n_id) or ()))
+        n_ids = self._indexed_candidates()
+        if n_ids is not None:
+            return n_ids
+        return store.nodes(*self._labels)
+
+    def _indexed_candidates(self):
+        # Return candidates looked up in a property index for one of
+        # the conditions, or None if no condition is indexed.
+        store = self._store
+        if self._conditions and self._labels:
+            indexes = store.node_indexes()
+            for p_key, value, _ in self._conditions:
+                for n_label in self._labels:
+                    if (n_label, p_key) in indexes:
+                        n_ids = store.nodes_by_property(n_label, p_key, value)
+                        if len(self._labels) == 1:
+                            return n_ids
+                        return (n_id for n_id in n_ids if self._labels <= store.node_labels(n_id))
+        return None
+
+    def _ordered(self):
+        # Read nodes from an ordered index for a single order key, unless
+        # a condition can be looked up in an index, which will usually
+        # leave far fewer nodes to sort. Nodes with no value for the key
+        # are not indexed, so are found by a scan: in ascending order,
+        # only once the indexed nodes run out, and in descending order,
+        # only if the index does not hold every node with the label.
+        store = self._store
+        if self._source is not None or len(self._order) != 1 or not self._labels:
+            return None
+        (p_key, descending), = self._order
+        ordered_indexes = store.ordered_node_indexes()
+        for n_label in self._labels:
+            if (n_label, p_key) in ordered_indexes:
+                break
+        else:
+            return None
+        if self._indexed_candidates() is not None:
+            return None
+        n_ids = store.nodes_by_property_range(n_label, p_key, descending=descending)
+        if len(self._labels) > 1:
+            n_ids = (n_id for n_id in n_ids if self._labels <= store.node_labels(n_id))
+        if self._conditions:
+            n_ids = filter(self._matches, n_ids)
+        if descending:
+            if store._node_index_is_complete(n_label, p_key):
+                return n_ids
+            return chain(self._null_keys(p_key), n_ids)
+        return chain(n_ids, self._null_keys(p_key))
+
+    def _count(self):
+        if self._source is None and not self._conditions:
+            return self._store.node_count(*self._labels)
+        return super(NodeSelection, self)._count()
+
+    def _properties(self, key):
+        return self._store.node_properties(key) or {}
+
+    def _property_maps(self, keys):
+        get = self._store._nodes.get
+        return [getattr(get(key), "properties", _NO_PROPERTIES) for key in keys]
+
+    def _view(self, key):
+        return Node.view(self._store, key)
+
     def delete(self):
-        self._store.remove_nodes(self._selection)
+        """ Remove the selected nodes, and their relationships, from
+        the store.
+        """
+        self._store.remove_nodes(list(self._keys()))
 
 
-class RelationshipSelection(GraphStructure):
-    """ A selection of relationships.
+class RelationshipSelection(Selection):
+    """ A selection of relationships, optionally of a given type and
+    with given nodes, as for :meth:`.GraphStore.relationships`.
     """
 
-    def __graph_store__(self):
-        return self._store
+    __slots__ = ("_r_type", "_n_ids")
 
-    def __init__(self, store, selection):
-        self._store = store
-        self._selection = selection
+    def __init__(self, store, selection=None, r_type=None, n_ids=()):
+        super(RelationshipSelection, self).__init__(store, selection)
+        self._r_type = r_type
+        self._n_ids = n_ids
 
-    def __iter__(self):
-        return self
+    def _candidates(self):
+        if self._source is not None:
+            if self._r_type is None:
+                return iter(self._source)
+            return (r_id for r_id in self._source if self._store.relationship_type(r_id) == self._r_type)
+        return self._store.relationships(self._r_type, self._n_ids)
 
-    def __next__(self):
-        r_key = next(self._selection)
-        r_type = self._store.relationship_type(r_key)
-        return r_type.view(self, r_key)
+    def _count(self):
+        if self._source is None and not self._conditions:
+            return self._store.relationship_count(self._r_type, self._n_ids)
+        return super(RelationshipSelection, self)._count()
 
-    def next(self):
-        return self.__next__()
+    def _properties(self, key):
+        return self._store.relationship_properties(key) or {}
+
+    def _property_maps(self, keys):
+        get = self._store._relationships.get
+        return [getattr(get(key), "properties", _NO_PROPERTIES) for key in keys]
+
+    def _view(self, key):
+        return self._store.relationship_type(key).view(self._store, key)
 
     def delete(self):
-        self._store.remove_relationships(self._selection)
+        """ Remove the selected relationships from the store.
+        """
+        self._store.remove_relationships(list(self._keys()))
+
+
+def match_query(graph_structure, query, parameters=None):
+    from cypy.graph.matching import Query, match, parse
+    if not isinstance(query, Query):
+        query = parse(query, parameters)
+    return match(graph_structure, query.patterns, query.where, query.returns)
 
 
 def relationship_type(name):
@@ -502,7 +1002,7 @@ def relationship_type(name):
             str_name = name.encode("utf-8")
         except AttributeError:
             raise ValueError("Invalid type name %r" % name)
-    return type(str_name, (Relationship,), {})
+    return type(str_name, (Relationship,), {"__slots__": ()})
 
 
 def graph_order(graph_structure):
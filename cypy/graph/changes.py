@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Change data capture for mutable graph stores.
+
+A :class:`.ChangeLog` records every change made to a
+:class:`cypy.graph.store.MutableGraphStore` as a numbered
+:class:`.Change`. Consumers can either read changes after a given
+sequence number with :meth:`.ChangeLog.changes` or subscribe to receive
+them in batches, one batch per store operation.
+"""
+
+from collections import deque, namedtuple
+from itertools import islice
+from threading import Lock, RLock
+
+
+NODE_CREATED = "node_created"
+NODE_REMOVED = "node_removed"
+NODE_LABELS_ADDED = "node_labels_added"
+NODE_LABELS_REMOVED = "node_labels_removed"
+NODE_PROPERTY_SET = "node_property_set"
+RELATIONSHIP_CREATED = "relationship_created"
+RELATIONSHIP_REMOVED = "relationship_removed"
+RELATIONSHIP_PROPERTY_SET = "relationship_property_set"
+INDEX_CREATED = "index_created"
+INDEX_DROPPED = "index_dropped"
+CONSTRAINT_CREATED = "constraint_created"
+CONSTRAINT_DROPPED = "constraint_dropped"
+
+
+class Change(namedtuple("Change", ["sequence", "type", "key", "detail"])):
+    """ A single change to a graph store.
+
+    The `detail` depends on the change `type`:
+
+    - :const:`NODE_CREATED`: a (labels, properties) pair, giving the full
+      new state of a node that has been added or replaced
+    - :const:`NODE_REMOVED`: :const:`None`
+    - :const:`NODE_LABELS_ADDED`, :const:`NODE_LABELS_REMOVED`: the set of
+      labels
+    - :const:`NODE_PROPERTY_SET`, :const:`RELATIONSHIP_PROPERTY_SET`: a
+      (key, value) pair, in which a value of :const:`None` denotes removal
+    - :const:`RELATIONSHIP_CREATED`: a (type, node keys, properties) triple
+    - :const:`RELATIONSHIP_REMOVED`: :const:`None`
+    - :const:`INDEX_CREATED`: a flag indicating whether the index is ordered
+    - :const:`INDEX_DROPPED`, :const:`CONSTRAINT_CREATED`,
+      :const:`CONSTRAINT_DROPPED`: :const:`None`
+
+    Schema changes are keyed by a (label, property key) pair. Removal of
+    a node is preceded by removal of each of its relationships.
+    """
+
+    __slots__ = ()
+
+
+class ChangeLogError(LookupError):
+    """ Raised when changes are requested that are no longer retained.
+    """
+
+
+class ChangeLog(object):
+    """ An ordered, bounded record of changes to a graph store.
+
+    Sequence numbers start at 1 and increase by one for each change.
+    Only the most recent `retention` changes are kept. A log that
+    continues an earlier one can be started at a given `sequence`
+    number, the first change recorded being numbered one higher.
+
+    Changes are collected while the store is locked for writing and
+    published when the lock is released. Publication appends them to
+    the log and passes them, as a single list, to each subscriber in
+    turn. Subscribers are called in sequence order, outside the store
+    lock, and may read from the store, but should not write to it.
+    """
+
+    default_retention = 65536
+
+    def __init__(self, retention=None, sequence=0):
+        self._lock = Lock()
+        self._publish_lock = RLock()
+        self._changes = deque(maxlen=retention or self.default_retention)
+        self._pending = []
+        self._sequence = sequence
+        self._subscribers = []
+
+    def __len__(self):
+        return len(self._changes)
+
+    @property
+    def retention(self):
+        """ The maximum number of changes kept.
+        """
+        return self._changes.maxlen
+
+    def last_sequence(self, pending=False):
+        """ Return the sequence number of the latest published change,
+        or of the latest recorded change if `pending` is true. If no
+        such change exists, the starting sequence number is returned.
+        """
+        with self._lock:
+            if pending:
+                return self._sequence
+            else:
+                return self._sequence - len(self._pending)
+
+    def append(self, change_type, key, detail=None):
+        """ Record a change, to be published on the next call to
+        :meth:`.publish`.
+        """
+        with self._lock:
+            self._sequence += 1
+            self._pending.append(Change(self._sequence, change_type, key, detail))
+
+    def publish(self):
+        """ Publish all pending changes to the log and to subscribers.
+        """
+        with self._publish_lock:
+            with self._lock:
+                changes, self._pending = self._pending, []
+                self._changes.extend(changes)
+                subscribers = list(self._subscribers)
+            if changes:
+                for subscriber in subscribers:
+                    subscriber(changes)
+
+    def changes(self, since=0):
+        """ Return a list of all published changes with a sequence
+        number greater than `since`.
+
+        :raises ChangeLogError: if some of those changes are no longer retained
+        """
+        with self._lock:
+            return self._changes_since(since)
+
+    def _changes_since(self, since):
+        if not self._changes:
+            return []
+        first = self._changes[0].sequence
+        if since < first - 1:
+            raise ChangeLogError("Changes after {} are no longer retained; "
+                                 "the earliest retained is {}".format(since, first))
+        return list(islice(self._changes, max(since - first + 1, 0), None))
+
+    def subscribe(self, subscriber, since=None):
+        """ Call `subscriber` with a list of changes each time changes
+        are published. If `since` is given, the subscriber is first
+        called with all retained changes after that sequence number.
+
+        :raises ChangeLogError: if changes after `since` are no longer retained
+        """
+        with self._publish_lock:
+            with self._lock:
+                backlog = [] if since is None else self._changes_since(since)
+                self._subscribers.append(subscriber)
+            if backlog:
+                subscriber(backlog)
+
+    def unsubscribe(self, subscriber):
+        """ Stop calling `subscriber`.
+        """
+        with self._lock:
+            self._subscribers.remove(subscriber)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Column-oriented extraction and filtering of property values.
+
+A :class:`.Column` holds the values of one property across a sequence
+of entities, together with a mask marking those for which the property
+is null. Columns whose values are all numbers or all booleans are held
+in NumPy arrays if NumPy is installed, or otherwise in
+:class:`array.array` objects. All other columns are held in lists.
+
+:func:`.filter_keys` evaluates a predicate expression over such columns
+a whole column at a time, and returns the set of keys for which it
+holds. Expressions are built from ``(key, operator, value)`` conditions,
+with the operators and null semantics of
+:data:`cypy.graph.matching.Predicate`, combined with :class:`.And` and
+:class:`.Or`::
+
+    >>> from cypy.graph.columns import And, Or
+    >>> people.filter(And(("age", ">=", 18), Or(("name", "STARTS WITH", "A"), ("email", "IS NULL", None))))
+"""
+
+from array import array
+from collections import namedtuple
+from itertools import compress
+from operator import and_, or_
+
+from cypy.compat import integer_types, unicode_types, utf8_types
+from cypy.graph.matching import Predicate, operators
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#: The values of one property across a sequence of entities. Each null
+#: value is replaced in `values` by a placeholder (0, :const:`False` or
+#: :const:`None`, depending on the type of the column), and marked by a
+#: true item in the `nulls` mask. The mask is a NumPy boolean array if
+#: NumPy is in use, and a :class:`bytearray` otherwise.
+Column = namedtuple("Column", ["values", "nulls"])
+
+
+def _column_type(values):
+    # Return "bool", "int" or "float" for a list of values that are all
+    # booleans, all integers or all numbers (ignoring nulls), or None.
+    column_type = None
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value_type = "bool"
+        elif isinstance(value, integer_types):
+            value_type = "int"
+        elif isinstance(value, float):
+            value_type = "float"
+        else:
+            return None
+        if column_type is None or column_type == value_type:
+            column_type = value_type
+        elif "bool" in (column_type, value_type):
+            return None
+        else:
+            column_type = "float"
+    return column_type
+
+
+_NUMPY_TYPES = {"bool": "bool", "int": "int64", "float": "float64"}
+
+
+def _int64_typecode():
+    # Typecode "q" is missing before Python 3.3, where "l" is 64 bits
+    # wide on most 64-bit platforms.
+    for typecode in ("q", "l"):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+
+_INT64_TYPECODE = _int64_typecode()
+
+_ARRAY_TYPES = {"bool": "b", "int": _INT64_TYPECODE, "float": "d"}
+
+_PLACEHOLDERS = {"bool": False, "int": 0, "float": 0.0}
+
+
+def column(values, use_numpy=None):
+    """ Build a :class:`.Column` from a list of values, in which nulls
+    are represented by :const:`None`.
+
+    :param values: list of property values
+    :param use_numpy: true to use NumPy, false not to, or :const:`None`
+        to use it if installed
+    :raises ImportError: if NumPy is requested but not installed
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    elif use_numpy and numpy is None:
+        raise ImportError("NumPy is not installed")
+    if use_numpy:
+        nulls = numpy.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    else:
+        nulls = bytearray(value is None for value in values)
+    column_type = _column_type(values)
+    if column_type is not None:
+        placeholder = _PLACEHOLDERS[column_type]
+        if any(nulls):
+            filled = [placeholder if value is None else value for value in values]
+        else:
+            filled = values
+        try:
+            if use_numpy:
+                return Column(numpy.array(filled, dtype=_NUMPY_TYPES[column_type]), nulls)
+            else:
+                return Column(array(_ARRAY_TYPES[column_type], filled), nulls)
+        except (OverflowError, TypeError, ValueError):
+            # Integers too large for 64 bits, or no 64-bit array type
+            # on this platform.
+            pass
+    return Column(list(values), nulls)
+
+
+def columns(rows, keys, use_numpy=None):
+    """ Build a list of :class:`.Column` objects, one for each of
+    `keys`, from a sequence of property mappings.
+
+    :param rows: sequence of property mappings, one per entity
+    :param keys: property keys to extract
+    :param use_numpy: as for :func:`.column`
+    """
+    return [column([properties.get(key) for properties in rows], use_numpy) for key in keys]
+
+
+class And(tuple):
+    """ Expression that holds where all of its operands hold.
+    """
+
+    def __new__(cls, *operands):
+        return tuple.__new__(cls, operands)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, ", ".join(map(repr, self)))
+
+
+class Or(tuple):
+    """ Expression that holds where any of its operands holds.
+    """
+
+    def __new__(cls, *operands):
+        return tuple.__new__(cls, operands)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, ", ".join(map(repr, self)))
+
+
+_NUMBER_TESTS = {
+    "=": lambda values, operand: values == operand,
+    "<>": lambda values, operand: values != operand,
+    "<": lambda values, operand: values < operand,
+    "<=": lambda values, operand: values <= operand,
+    ">": lambda values, operand: values > operand,
+    ">=": lambda values, operand: values >= operand,
+}
+
+_PYTHON_NUMBER_TESTS = {
+    "=": lambda values, operand: [value == operand for value in values],
+    "<>": lambda values, operand: [value != operand for value in values],
+    "<": lambda values, operand: [value < operand for value in values],
+    "<=": lambda values, operand: [value <= operand for value in values],
+    ">": lambda values, operand: [value > operand for value in values],
+    ">=": lambda values, operand: [value >= operand for value in values],
+}
+
+_STRING_TESTS = {
+    "STARTS WITH": lambda value, operand: value.startswith(operand),
+    "ENDS WITH": lambda value, operand: value.endswith(operand),
+    "CONTAINS": lambda value, operand: operand in value,
+}
+
+_INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _operand_type(operand):
+    # Return the column type that an operand can be compared with.
+    if isinstance(operand, bool):
+        return "bool"
+    elif isinstance(operand, integer_types):
+        return "int" if _INT64_RANGE[0] <= operand <= _INT64_RANGE[1] else None
+    elif isinstance(operand, float):
+        return "float" if operand == operand else None
+    else:
+        return None
+
+
+def _is_large_integer(value):
+    return isinstance(value, integer_types) and not isinstance(value, bool) and _operand_type(value) is None
+
+
+def _typed(values):
+    # Return the type of a column built by `column`, or None for a list.
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        return {"b": "bool", "i": "int", "f": "float"}.get(values.dtype.kind)
+    elif isinstance(values, array):
+        return {"b": "bool", _INT64_TYPECODE: "int", "d": "float"}[values.typecode]
+    else:
+        return None
+
+
+def _not_null(mask, nulls, use_numpy):
+    if use_numpy:
+        return mask & ~nulls
+    return [m and not n for m, n in zip(mask, nulls)]
+
+
+def _condition_mask(col, operator, operand, use_numpy):
+    # Return a mask, true where a condition holds for a column.
+    values, nulls = col
+    if operator == "IS NULL":
+        return nulls.copy() if use_numpy else list(map(bool, nulls))
+    elif operator == "IS NOT NULL":
+        return ~nulls if use_numpy else [not n for n in nulls]
+    column_type = _typed(values)
+    if column_type is not None:
+        numeric = column_type in ("int", "float")
+        operand_type = _operand_type(operand)
+        if operator in _NUMBER_TESTS and operand_type is not None:
+            if (operand_type in ("int", "float")) != numeric:
+                # Booleans and numbers are never equal, and never ordered.
+                if operator == "<>":
+                    return _condition_mask(col, "IS NOT NULL", None, use_numpy)
+                return _empty_mask(len(nulls), use_numpy)
+            if use_numpy:
+                return _not_null(_NUMBER_TESTS[operator](values, operand), nulls, True)
+            return _not_null(_PYTHON_NUMBER_TESTS[operator](values, operand), nulls, False)
+        elif operator == "IN" and operand is not None and not any(map(_is_large_integer, operand)):
+            items = [item for item in operand
+                     if _operand_type(item) is not None and (_operand_type(item) in ("int", "float")) == numeric]
+            if use_numpy:
+                return _not_null(numpy.isin(values, items), nulls, True)
+            items = set(items)
+            return _not_null([value in items for value in values], nulls, False)
+    # Any other condition is tested value by value, which is also needed
+    # for operands that do not fit the type of an array column.
+    if operator in _STRING_TESTS:
+        if not isinstance(operand, unicode_types + utf8_types):
+            return _empty_mask(len(nulls), use_numpy)
+        test = _STRING_TESTS[operator]
+        string_types = unicode_types + utf8_types
+        mask = [isinstance(value, string_types) and test(value, operand) for value in values]
+    else:
+        test = operators[operator]
+        mask = [test(value, operand) is True for value in values]
+    if use_numpy:
+        return _not_null(numpy.array(mask, dtype=bool), nulls, True)
+    return _not_null(mask, nulls, False)
+
+
+def _empty_mask(size, use_numpy):
+    if use_numpy:
+        return numpy.zeros(size, dtype=bool)
+    return [False] * size
+
+
+def _conditions(expression):
+    # Yield all (key, operator, value) conditions in an expression.
+    if isinstance(expression, (And, Or)):
+        for operand in expression:
+            for condition in _conditions(operand):
+                yield condition
+    else:
+        if isinstance(expression, Predicate):
+            expression = expression[1:]
+        try:
+            key, operator, value = expression
+        except (TypeError, ValueError):
+            raise ValueError("Invalid condition {!r}".format(expression))
+        operator = operator.upper()
+        if operator not in operators:
+            raise ValueError("Unknown operator {!r}".format(operator))
+        yield key, operator, value
+
+
+def _expression_mask(expression, columns_by_key, use_numpy):
+    if isinstance(expression, (And, Or)):
+        if not expression:
+            raise ValueError("Empty {} expression".format(type(expression).__name__))
+        combine = and_ if isinstance(expression, And) else or_
+        masks = [_expression_mask(operand, columns_by_key, use_numpy) for operand in expression]
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = combine(mask, other) if use_numpy else list(map(combine, mask, other))
+        return mask
+    (key, operator, value), = _conditions(expression)
+    return _condition_mask(columns_by_key[key], operator, value, use_numpy)
+
+
+def filter_keys(keys, rows, expression, use_numpy=None):
+    """ Return the set of those `keys` for which a predicate expression
+    holds over the corresponding property mappings in `rows`.
+
+    Each property referred to by the expression is first extracted as a
+    :class:`.Column`, and each condition is then evaluated over a whole
+    column at a time. Operators are those of
+    :data:`cypy.graph.matching.operators`, so a condition on a null value
+    never holds, and values of different types are unequal but
+    unordered.
+
+    :param keys: sequence of entity keys
+    :param rows: sequence of property mappings, one for each key
+    :param expression: a ``(key, operator, value)`` condition, a
+        :data:`cypy.graph.matching.Predicate`, or an :class:`.And` or
+        :class:`.Or` of expressions
+    :param use_numpy: as for :func:`.column`
+    :return: :class:`frozenset` of keys
+    :raises ValueError: if the expression is not valid
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    p_keys = sorted({key for key, _, _ in _conditions(expression)})
+    columns_by_key = dict(zip(p_keys, columns(rows, p_keys, use_numpy)))
+    mask = _expression_mask(expression, columns_by_key, use_numpy)
+    if use_numpy:
+        return frozenset(keys[i] for i in numpy.flatnonzero(mask))
+    return frozenset(compress(keys, mask))
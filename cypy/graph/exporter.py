@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Streaming export of graph stores to CSV and JSON Lines files.
+
+:func:`.write_csv` writes a node file and a relationship file in the
+format accepted by ``neo4j-admin import`` (and by
+:mod:`cypy.graph.loader`), with a typed header row. :func:`.write_jsonl`
+writes nodes and then relationships to a single file, with one JSON
+object per line.
+
+Entries are read from the store one at a time and written as they are
+read. Either kind of output can be compressed with gzip, and can be
+split into shards holding a fixed number of entries each. For a store
+that may be modified concurrently, hold its read lock while exporting.
+"""
+
+import csv
+import gzip
+import json
+from io import open as io_open
+from os.path import splitext
+
+from cypy.compat import bytes_types, integer_types, ustr, utf8_types
+
+
+_CSV_TYPES = [
+    (bool, "boolean"),
+    (integer_types, "long"),
+    (float, "double"),
+    (bytes_types, "byte[]"),
+]
+
+
+def _type_name(r_type):
+    if isinstance(r_type, type):
+        return r_type.__name__
+    return ustr(r_type)
+
+
+def _endpoints(graph_store, r_id):
+    n_ids = graph_store.relationship_nodes(r_id)
+    if len(n_ids) != 2:
+        raise ValueError("Relationship {!r} does not have exactly two nodes".format(r_id))
+    return n_ids
+
+
+def _csv_type(value):
+    for python_type, csv_type in _CSV_TYPES:
+        if isinstance(value, python_type):
+            return csv_type
+    if isinstance(value, list):
+        element_types = {_csv_type(item) for item in value}
+        if len(element_types) == 1:
+            element_type, = element_types
+            if not element_type.endswith("[]"):
+                return element_type + "[]"
+        return "string[]"
+    return "string"
+
+
+def _merge_csv_types(first, second):
+    if first is None or first == second:
+        return second
+    numbers = {"long", "double"}
+    if {first, second} <= numbers:
+        return "double"
+    if {first, second} <= {t + "[]" for t in numbers}:
+        return "double[]"
+    if first.endswith("[]") and second.endswith("[]"):
+        return "string[]"
+    return "string"
+
+
+def _csv_value(value, array_delimiter):
+    if value is None:
+        return ""
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    elif isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, bytes_types):
+        return array_delimiter.join(str(b) for b in bytearray(value))
+    elif isinstance(value, list):
+        return array_delimiter.join(_csv_value(item, array_delimiter) for item in value)
+    elif isinstance(value, dict):
+        return json.dumps(value, sort_keys=True, default=ustr)
+    else:
+        return ustr(value)
+
+
+def _json_value(value):
+    if isinstance(value, bytes_types):
+        return list(bytearray(value))
+    return ustr(value)
+
+
+if utf8_types:
+
+    # Python 2: gzip files have no text mode, and the csv module and
+    # JSON encoder produce native strings, so output goes to byte
+    # streams and is encoded as UTF-8 as it is written.
+
+    def _open_text(path, compress):
+        if compress:
+            return gzip.open(path, "wb")
+        return io_open(path, "wb")
+
+    def _text_writer(f):
+        def write(text):
+            f.write(ustr(text).encode("utf-8"))
+        return write
+
+    def _csv_writer(f, delimiter):
+        writerow = csv.writer(f, delimiter=str(delimiter), lineterminator="\n").writerow
+
+        def write(row):
+            writerow([ustr(value).encode("utf-8") for value in row])
+
+        return write
+
+else:
+
+    def _open_text(path, compress):
+        if compress:
+            return gzip.open(path, "wt", encoding="utf-8", newline="")
+        return io_open(path, "w", encoding="utf-8", newline="")
+
+    def _text_writer(f):
+        return f.write
+
+    def _csv_writer(f, delimiter):
+        return csv.writer(f, delimiter=delimiter, lineterminator="\n").writerow
+
+
+class _ShardedFile(object):
+    # A sequence of files, each holding at most `shard_size` entries
+    # (or all entries if no shard size is given). Shards are named by
+    # inserting a number before the extension of `path`.
+
+    def __init__(self, path, shard_size=None, compress=False, header=None, writer=None):
+        if compress and not path.endswith(".gz"):
+            path += ".gz"
+        self.compress = path.endswith(".gz")
+        self.path = path
+        self.shard_size = shard_size
+        self.header = header
+        self.writer = writer
+        self.paths = []
+        self._file = None
+        self._write = None
+        self._count = 0
+
+    def _shard_path(self):
+        if self.shard_size is None:
+            return self.path
+        if self.compress:
+            stem, extension = splitext(self.path[:-3])
+            extension += ".gz"
+        else:
+            stem, extension = splitext(self.path)
+        return "{}-{:05d}{}".format(stem, len(self.paths), extension)
+
+    def _open(self):
+        path = self._shard_path()
+        self._file = _open_text(path, self.compress)
+        self.paths.append(path)
+        self._write = (self.writer or _text_writer)(self._file)
+        self._count = 0
+        if self.header is not None:
+            self._write(self.header)
+
+    def write(self, entry):
+        if self._file is None or (self.shard_size is not None and self._count >= self.shard_size):
+            self.close()
+            self._open()
+        self._write(entry)
+        self._count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        # Ensure that at least one file exists, even for no entries.
+        if not self.paths:
+            self._open()
+        self.close()
+        return self.paths
+
+
+def write_csv(graph_store, nodes_path, relationships_path, shard_size=None, compress=False,
+              delimiter=",", array_delimiter=";"):
+    """ Write the nodes and relationships of a graph store (or graph
+    structure) to CSV files in ``neo4j-admin import`` format.
+
+    Node keys are written as IDs, property types are inferred from the
+    values present and every property key appears as a column in each
+    header. The store is read twice: first to find the property types,
+    and then to write the rows. If `shard_size` is given, output is
+    split into numbered files of that many rows each, each with its own
+    header. Files are compressed with gzip if `compress` is true or if
+    a path ends in ``.gz``.
+
+    :returns: a pair of lists holding the node file paths and the
+        relationship file paths written
+    :raises ValueError: if a relationship does not have exactly two nodes
+    """
+    graph_store = graph_store.__graph_store__()
+
+    def csv_writer(f):
+        return _csv_writer(f, delimiter)
+
+    node_types = {}
+    for n_id in graph_store.nodes():
+        for key, value in graph_store.node_properties(n_id).items():
+            node_types[key] = _merge_csv_types(node_types.get(key), _csv_type(value))
+    node_keys = sorted(node_types)
+    node_header = [":ID"] + ["{}:{}".format(key, node_types[key]) for key in node_keys] + [":LABEL"]
+    nodes = _ShardedFile(nodes_path, shard_size, compress, node_header, csv_writer)
+    try:
+        for n_id in graph_store.nodes():
+            properties = graph_store.node_properties(n_id)
+            nodes.write([ustr(n_id)] +
+                        [_csv_value(properties.get(key), array_delimiter) for key in node_keys] +
+                        [array_delimiter.join(sorted(graph_store.node_labels(n_id)))])
+    finally:
+        nodes.close()
+
+    relationship_types = {}
+    for r_id in graph_store.relationships():
+        for key, value in graph_store.relationship_properties(r_id).items():
+            relationship_types[key] = _merge_csv_types(relationship_types.get(key), _csv_type(value))
+    relationship_keys = sorted(relationship_types)
+    relationship_header = [":START_ID", ":END_ID"] + \
+                          ["{}:{}".format(key, relationship_types[key]) for key in relationship_keys] + [":TYPE"]
+    relationships = _ShardedFile(relationships_path, shard_size, compress, relationship_header, csv_writer)
+    try:
+        for r_id in graph_store.relationships():
+            start, end = _endpoints(graph_store, r_id)
+            properties = graph_store.relationship_properties(r_id)
+            relationships.write([ustr(start), ustr(end)] +
+                                [_csv_value(properties.get(key), array_delimiter) for key in relationship_keys] +
+                                [_type_name(graph_store.relationship_type(r_id))])
+    finally:
+        relationships.close()
+
+    return nodes.finish(), relationships.finish()
+
+
+def write_jsonl(graph_store, path, shard_size=None, compress=False):
+    """ Write the nodes and then the relationships of a graph store (or
+    graph structure) to a JSON Lines file. Each node is written as::
+
+        {"type": "node", "id": "...", "labels": [...], "properties": {...}}
+
+    and each relationship as::
+
+        {"type": "relationship", "id": "...", "label": "...",
+         "start": "...", "end": "...", "properties": {...}}
+
+    Keys are written as strings, and bytes values as lists of integers.
+    Sharding and compression are as for :func:`.write_csv`.
+
+    :returns: the list of file paths written
+    :raises ValueError: if a relationship does not have exactly two nodes
+    """
+    graph_store = graph_store.__graph_store__()
+    encoder = json.JSONEncoder(sort_keys=True, default=_json_value)
+    out = _ShardedFile(path, shard_size, compress)
+    try:
+        for n_id in graph_store.nodes():
+            out.write(encoder.encode({
+                "type": "node",
+                "id": ustr(n_id),
+                "labels": sorted(graph_store.node_labels(n_id)),
+                "properties": dict(graph_store.node_properties(n_id)),
+            }) + "\n")
+        for r_id in graph_store.relationships():
+            start, end = _endpoints(graph_store, r_id)
+            out.write(encoder.encode({
+                "type": "relationship",
+                "id": ustr(r_id),
+                "label": _type_name(graph_store.relationship_type(r_id)),
+                "start": ustr(start),
+                "end": ustr(end),
+                "properties": dict(graph_store.relationship_properties(r_id)),
+            }) + "\n")
+    finally:
+        out.close()
+    return out.finish()
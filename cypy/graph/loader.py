@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Bulk loading of nodes and relationships from CSV files.
+
+Files are read in the format accepted by ``neo4j-admin import``. The
+first row of each file is a header that names every column and
+optionally gives its type, for example::
+
+    id:ID(Person),name,age:int,tags:string[],:LABEL
+    p1,Alice,33,x;y,Person;Employee
+
+    :START_ID(Person),:END_ID(Person),since:int,:TYPE
+    p1,p2,1999,KNOWS
+
+Property columns may be typed as ``string``, ``char``, ``int``,
+``long``, ``short``, ``byte``, ``float``, ``double`` or ``boolean``,
+optionally followed by ``[]`` for an array, and default to ``string``.
+``ID``, ``START_ID`` and ``END_ID`` columns may name an ID group, which
+scopes the IDs within them. Columns typed as ``IGNORE`` are skipped,
+as are empty fields.
+
+Rows are streamed from each file and added to the graph store in large
+batches. Node IDs are not used as store keys; instead, the loader keeps
+a table that maps each ``(group, ID)`` pair to the key of the node
+created for it, through which relationship endpoints are resolved.
+"""
+
+import csv
+from collections import namedtuple
+from io import open as io_open
+
+from cypy.compat import unicode_types, ustr, utf8_types
+
+_Column = namedtuple("_Column", ["name", "kind", "coerce", "group"])
+
+_SPECIAL_KINDS = {"ID", "START_ID", "END_ID", "LABEL", "TYPE", "IGNORE"}
+
+
+def _boolean(value):
+    return value.lower() == "true"
+
+
+_COERCERS = {
+    "string": ustr,
+    "char": ustr,
+    "int": int,
+    "long": int,
+    "short": int,
+    "byte": int,
+    "float": float,
+    "double": float,
+    "boolean": _boolean,
+}
+
+
+def _array(coerce, array_delimiter):
+
+    def coerce_array(value):
+        return [coerce(item) for item in value.split(array_delimiter)]
+
+    return coerce_array
+
+
+def _parse_header(fields, array_delimiter):
+    columns = []
+    for field in fields:
+        if ":" in field:
+            name, spec = field.rsplit(":", 1)
+        else:
+            name, spec = field, ""
+        group = None
+        if spec.endswith(")") and "(" in spec:
+            spec, group = spec[:-1].split("(", 1)
+        if spec.upper() in _SPECIAL_KINDS:
+            columns.append(_Column(ustr(name) or None, spec.upper(), None, group))
+            continue
+        p_type = spec.lower() or "string"
+        is_array = p_type.endswith("[]")
+        if is_array:
+            p_type = p_type[:-2]
+        try:
+            coerce = _COERCERS[p_type]
+        except KeyError:
+            raise ValueError("Unknown type {!r} for column {!r}".format(spec, field))
+        if is_array:
+            coerce = _array(coerce, array_delimiter)
+        columns.append(_Column(ustr(name), "PROPERTY", coerce, None))
+    return columns
+
+
+if utf8_types:
+
+    # Python 2: the csv module only reads byte strings, so files are
+    # read as bytes (or text lines encoded) and each field is decoded
+    # from UTF-8 after parsing.
+
+    def _open_csv(path):
+        return io_open(path, "rb")
+
+    def _csv_rows(f, delimiter, quotechar):
+        lines = (line.encode("utf-8") if isinstance(line, unicode_types) else line for line in f)
+        reader = csv.reader(lines, delimiter=str(delimiter), quotechar=str(quotechar))
+        for row in reader:
+            yield reader.line_num, [field.decode("utf-8") for field in row]
+
+else:
+
+    def _open_csv(path):
+        return io_open(path, "r", newline="", encoding="utf-8")
+
+    def _csv_rows(f, delimiter, quotechar):
+        reader = csv.reader(f, delimiter=delimiter, quotechar=quotechar)
+        for row in reader:
+            yield reader.line_num, row
+
+
+class CSVLoader(object):
+    """ Loader for node and relationship CSV files.
+
+    Nodes and relationships are added to `graph_store`, which may be any
+    mutable graph store (or graph structure backed by one), in batches of
+    `batch_size` rows. The remaining arguments describe the CSV dialect.
+
+    Node files should be loaded before the relationship files that refer
+    to them. All IDs seen so far are held in :attr:`.id_map`.
+    """
+
+    default_batch_size = 10000
+
+    def __init__(self, graph_store, batch_size=None, delimiter=",", array_delimiter=";", quotechar='"'):
+        self.graph_store = graph_store.__graph_store__()
+        self.batch_size = batch_size or self.default_batch_size
+        self.delimiter = delimiter
+        self.array_delimiter = array_delimiter
+        self.quotechar = quotechar
+        #: Dictionary of node keys by ``(group, ID)`` pair.
+        self.id_map = {}
+
+    def _rows(self, f):
+        # Yield (line number, header) and then (line number, row)
+        # for every row in a file or path.
+        if not hasattr(f, "read"):
+            with _open_csv(f) as f:
+                for row in self._rows(f):
+                    yield row
+            return
+        for row in _csv_rows(f, self.delimiter, self.quotechar):
+            yield row
+
+    def _read(self, f, row_handler, flush):
+        rows = self._rows(f)
+        try:
+            _, header = next(rows)
+        except StopIteration:
+            return 0
+        columns = _parse_header(header, self.array_delimiter)
+        width = len(columns)
+        count = 0
+        pending = 0
+        handle = row_handler(columns)
+        for line, row in rows:
+            if not row:
+                continue
+            if len(row) != width:
+                raise ValueError("Line {}: expected {} fields, found {}".format(line, width, len(row)))
+            try:
+                handle(row)
+            except (TypeError, ValueError) as error:
+                raise ValueError("Line {}: {}".format(line, error))
+            pending += 1
+            if pending >= self.batch_size:
+                flush()
+                count += pending
+                pending = 0
+        flush()
+        return count + pending
+
+    def _properties(self, columns):
+        return [(i, column.name, column.coerce) for i, column in enumerate(columns) if column.kind == "PROPERTY"]
+
+    def load_nodes(self, f, labels=()):
+        """ Load nodes from a CSV file, given as a path or as a file
+        object opened in text mode with ``newline=""``. Every node is
+        given the `labels` supplied in addition to any listed in the
+        file.
+
+        :returns: the number of nodes loaded
+        :raises ValueError: if the file is malformed or repeats an ID
+        """
+        labels = frozenset(labels)
+        id_map = self.id_map
+        array_delimiter = self.array_delimiter
+        entries = []
+        ids = []
+        pending_ids = set()
+
+        def row_handler(columns):
+            properties_columns = self._properties(columns)
+            label_columns = [i for i, column in enumerate(columns) if column.kind == "LABEL"]
+            id_columns = [(i, column) for i, column in enumerate(columns) if column.kind == "ID"]
+            if len(id_columns) > 1:
+                raise ValueError("Node file has more than one ID column")
+            id_index, id_column = id_columns[0] if id_columns else (None, None)
+            group = id_column.group if id_column else None
+            id_name = id_column.name if id_column else None
+
+            def handle(row):
+                properties = {}
+                for i, name, coerce in properties_columns:
+                    value = row[i]
+                    if value != "":
+                        properties[name] = coerce(value)
+                n_labels = labels
+                for i in label_columns:
+                    if row[i]:
+                        n_labels = n_labels.union(ustr(label) for label in row[i].split(array_delimiter))
+                if id_index is not None:
+                    key = (group, row[id_index])
+                    if key in id_map or key in pending_ids:
+                        raise ValueError("Duplicate node ID {!r}".format(row[id_index]))
+                    pending_ids.add(key)
+                    ids.append(key)
+                    if id_name:
+                        properties[id_name] = ustr(row[id_index])
+                else:
+                    ids.append(None)
+                entries.append((n_labels, properties))
+
+            return handle
+
+        def flush():
+            for key, n_id in zip(ids, self.graph_store.add_nodes(entries)):
+                if key is not None:
+                    id_map[key] = n_id
+            del entries[:]
+            del ids[:]
+            pending_ids.clear()
+
+        return self._read(f, row_handler, flush)
+
+    def load_relationships(self, f, r_type=None):
+        """ Load relationships from a CSV file, given as a path or as a
+        file object opened in text mode with ``newline=""``. Rows
+        without a type are given `r_type`.
+
+        :returns: the number of relationships loaded
+        :raises ValueError: if the file is malformed or refers to an
+            unknown node ID
+        """
+        id_map = self.id_map
+        entries = []
+
+        def row_handler(columns):
+            properties_columns = self._properties(columns)
+            endpoints = []
+            for kind in ("START_ID", "END_ID"):
+                found = [(i, column.group) for i, column in enumerate(columns) if column.kind == kind]
+                if len(found) != 1:
+                    raise ValueError("Relationship file must have exactly one {} column".format(kind))
+                endpoints.append(found[0])
+            (start_index, start_group), (end_index, end_group) = endpoints
+            type_index = next((i for i, column in enumerate(columns) if column.kind == "TYPE"), None)
+
+            def handle(row):
+                properties = {}
+                for i, name, coerce in properties_columns:
+                    value = row[i]
+                    if value != "":
+                        properties[name] = coerce(value)
+                try:
+                    n_ids = (id_map[(start_group, row[start_index])], id_map[(end_group, row[end_index])])
+                except KeyError as error:
+                    raise ValueError("Unknown node ID {!r}".format(error.args[0][1]))
+                t = ustr(row[type_index]) if type_index is not None and row[type_index] else r_type
+                if t is None:
+                    raise ValueError("No relationship type")
+                entries.append((t, n_ids, properties))
+
+            return handle
+
+        def flush():
+            self.graph_store.add_relationships(entries)
+            del entries[:]
+
+        return self._read(f, row_handler, flush)
+
+
+def load(graph_store, nodes=(), relationships=(), **kwargs):
+    """ Load a set of node and relationship CSV files into a graph store
+    and return the :class:`.CSVLoader` used, whose :attr:`.CSVLoader.id_map`
+    maps file IDs to node keys. Node files are loaded first. Additional
+    keyword arguments are passed to the :class:`.CSVLoader`.
+    """
+    loader = CSVLoader(graph_store, **kwargs)
+    for f in nodes:
+        loader.load_nodes(f)
+    for f in relationships:
+        loader.load_relationships(f)
+    return loader
@@ -0,0 +1,537 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Binary graph images, for read-only access to graph stores without
+loading them into memory.
+
+A graph image is a flat binary encoding of a graph store, written by
+:func:`.write`. A :class:`.MappedGraphStore` reads from an image held
+in any buffer, such as a memory-mapped file, and decodes each entry
+only when it is accessed. Opening an image therefore costs the same
+regardless of its size, and processes that map the same file share its
+pages through the operating system's page cache.
+
+An image starts with an eight byte signature and the position and
+length of a catalog, which is written last. The catalog locates the
+following sections, all positions being absolute byte offsets and all
+integers little-endian:
+
+- a symbol table, holding every label, relationship type and property
+  key, which entries refer to by number
+- node and relationship key tables, sorted by encoded key, so that an
+  entry can be found by binary search
+- node and relationship entry tables, parallel to the key tables
+- label and type indexes, mapping each symbol to the sorted positions
+  of the nodes or relationships that carry it
+- an adjacency index, mapping each node position to the positions of
+  its relationships
+- property indexes, each holding the distinct index values in order,
+  with the positions of the nodes that carry each value
+
+Keys, symbols and property values use the encoding of
+:func:`cypy.graph.persistence.pack`.
+"""
+
+import mmap
+from bisect import bisect_left
+from struct import Struct
+
+from cypy.collections import FrozenSortedSet
+from cypy.graph.persistence import Unpacker, pack
+from cypy.graph.store import GraphStore, FrozenGraphStore, NodeEntry, RelationshipEntry, PropertyRecord, \
+    enumerate_nodes
+
+try:
+    from collections.abc import Mapping, Sequence, Set
+except ImportError:
+    from collections import Mapping, Sequence, Set
+
+
+IMAGE_SIGNATURE = b"CYPYGRF1"
+
+_HEADER = Struct("<QQ")
+_OFFSET = Struct("<Q")
+_POSITION = Struct("<I")
+_ADJACENCY = Struct("<Ii")
+
+
+class ImageError(ValueError):
+    """ Raised when a buffer does not hold a valid graph image.
+    """
+
+
+def _packed(value):
+    data = bytearray()
+    pack(value, data)
+    return bytes(data)
+
+
+class _ImageWriter(object):
+
+    def __init__(self, f):
+        self._file = f
+        self._position = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self._position += len(data)
+
+    def write_array(self, struct, values):
+        # Return the position of an array of fixed-width values.
+        position = self._position
+        self.write(b"".join(struct.pack(*value) if isinstance(value, tuple) else struct.pack(value)
+                            for value in values))
+        return position
+
+    def write_table(self, blobs):
+        # Return the position of the offsets of a table of blobs. There
+        # is one offset more than the number of blobs, marking the end
+        # of the last.
+        offsets = []
+        for blob in blobs:
+            offsets.append(self._position)
+            self.write(blob)
+        offsets.append(self._position)
+        return self.write_array(_OFFSET, offsets)
+
+    def write_groups(self, groups):
+        # Return the positions of the offsets and contents of a list of
+        # groups of positions, as used by the label and type indexes.
+        offsets = [0]
+        for group in groups:
+            offsets.append(offsets[-1] + len(group))
+        offsets_position = self.write_array(_OFFSET, offsets)
+        return offsets_position, self.write_array(_POSITION, (p for group in groups for p in group))
+
+
+def write(graph_store, f):
+    """ Write an image of `graph_store` to the binary file object `f`.
+    The store may be of any kind, and its property indexes are included
+    in the image.
+
+    :raises TypeError: if any key or value cannot be encoded
+    """
+    writer = _ImageWriter(f)
+    writer.write(IMAGE_SIGNATURE)
+    writer.write(_HEADER.pack(0, 0))
+
+    symbols = []
+    symbol_ids = {}
+
+    def symbol(value):
+        try:
+            return symbol_ids[value]
+        except KeyError:
+            symbol_ids[value] = len(symbols)
+            symbols.append(value)
+            return symbol_ids[value]
+
+    # Entries are sorted by encoded key, which is unique, so that the
+    # entries themselves are never compared.
+    nodes = sorted((_packed(key), key, entry) for key, entry in graph_store._nodes.items())
+    node_positions = {key: i for i, (_, key, _) in enumerate(nodes)}
+    relationships = sorted((_packed(key), key, entry) for key, entry in graph_store._relationships.items())
+    relationship_positions = {key: i for i, (_, key, _) in enumerate(relationships)}
+
+    node_keys = writer.write_table(packed_key for packed_key, _, _ in nodes)
+    node_entries = writer.write_table(
+        _packed(([symbol(label) for label in labels],
+                 {symbol(p_key): value for p_key, value in properties.items()}))
+        for _, _, (labels, properties) in nodes)
+
+    relationship_keys = writer.write_table(packed_key for packed_key, _, _ in relationships)
+    relationship_entries = writer.write_table(
+        _packed((symbol(r_type), [node_positions[n_id] for n_id in n_ids],
+                 {symbol(p_key): value for p_key, value in properties.items()}))
+        for _, _, (r_type, n_ids, properties) in relationships)
+
+    for label in graph_store._nodes_by_label:
+        symbol(label)
+    for r_type in graph_store._relationships_by_type:
+        symbol(r_type)
+    for n_label, p_key in graph_store._nodes_by_property:
+        symbol(n_label)
+        symbol(p_key)
+    label_groups = [[] for _ in symbols]
+    for label, n_ids in graph_store._nodes_by_label.items():
+        label_groups[symbol_ids[label]] = sorted(node_positions[n_id] for n_id in n_ids)
+    type_groups = [[] for _ in symbols]
+    for r_type, r_ids in graph_store._relationships_by_type.items():
+        type_groups[symbol_ids[r_type]] = sorted(relationship_positions[r_id] for r_id in r_ids)
+    label_index = writer.write_groups(label_groups)
+    type_index = writer.write_groups(type_groups)
+
+    adjacency = [[] for _ in nodes]
+    for r, (_, _, (_, n_ids, _)) in enumerate(relationships):
+        for n_index, n_id in enumerate_nodes(n_ids):
+            adjacency[node_positions[n_id]].append((r, n_index))
+    offsets = [0]
+    for pairs in adjacency:
+        offsets.append(offsets[-1] + len(pairs))
+    adjacency_index = (writer.write_array(_OFFSET, offsets),
+                       writer.write_array(_ADJACENCY, (pair for pairs in adjacency for pair in pairs)))
+
+    property_indexes = []
+    for (n_label, p_key), index in graph_store._nodes_by_property.items():
+        values = sorted(index)
+        ordered = (n_label, p_key) in graph_store._nodes_by_property_order
+        property_indexes.append((symbol(n_label), symbol(p_key), ordered, len(values),
+                                 writer.write_table(_packed(value) for value in values),
+                                 writer.write_groups([sorted(node_positions[n_id] for n_id in index[value])
+                                                      for value in values])))
+
+    catalog = _packed({
+        "symbols": symbols,
+        "nodes": (len(nodes), node_keys, node_entries),
+        "relationships": (len(relationships), relationship_keys, relationship_entries),
+        "label_index": label_index,
+        "type_index": type_index,
+        "adjacency_index": adjacency_index,
+        "property_indexes": property_indexes,
+    })
+    catalog_position = writer._position
+    writer.write(catalog)
+    f.seek(len(IMAGE_SIGNATURE))
+    f.write(_HEADER.pack(catalog_position, len(catalog)))
+    f.seek(0, 2)
+
+
+class _Array(Sequence):
+    # Fixed-width values in a buffer, read one at a time.
+
+    def __init__(self, buffer, position, count, struct):
+        self._buffer = buffer
+        self._position = position
+        self._count = count
+        self._struct = struct
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        value = self._struct.unpack_from(self._buffer, self._position + i * self._struct.size)
+        return value if len(value) > 1 else value[0]
+
+
+class _Table(Sequence):
+    # A table of blobs in a buffer, each of which decodes to one value.
+
+    def __init__(self, image, position, count):
+        self._image = image
+        self._offsets = _Array(image.buffer, position, count + 1, _OFFSET)
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        return self._image.unpack(self.raw(i))
+
+    def raw(self, i):
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return bytes(self._image.buffer[self._offsets[i]:self._offsets[i + 1]])
+
+    def find(self, value):
+        # Return the position of a value in a table sorted by encoding,
+        # or -1 if it is absent.
+        try:
+            data = _packed(value)
+        except TypeError:
+            return -1
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(middle) < data:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self.raw(low) == data:
+            return low
+        return -1
+
+
+class _Groups(object):
+    # Sorted groups of positions, such as the nodes with each label.
+
+    def __init__(self, buffer, position, count):
+        offsets_position, data_position = position
+        self._offsets = _Array(buffer, offsets_position, count + 1, _OFFSET)
+        self._buffer = buffer
+        self._data_position = data_position
+
+    def __getitem__(self, i):
+        start = self._offsets[i]
+        return _Array(self._buffer, self._data_position + start * _POSITION.size,
+                      self._offsets[i + 1] - start, _POSITION)
+
+
+class _KeySet(Set):
+    # The keys at a sorted group of positions in a key table.
+
+    def __init__(self, keys, positions):
+        self._keys = keys
+        self._positions = positions
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return frozenset(iterable)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __iter__(self):
+        keys = self._keys
+        for position in self._positions:
+            yield keys[position]
+
+    def __contains__(self, key):
+        position = self._keys.find(key)
+        if position < 0:
+            return False
+        positions = self._positions
+        i = bisect_left(positions, position)
+        return i < len(positions) and positions[i] == position
+
+
+class _Entries(Mapping):
+    # Node or relationship entries by key.
+
+    def __init__(self, keys, entries, entry):
+        self._keys = keys
+        self._entries = entries
+        self._entry = entry
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        return self._keys.find(key) >= 0
+
+    def __getitem__(self, key):
+        position = self._keys.find(key)
+        if position < 0:
+            raise KeyError(key)
+        return self._entry(self._entries[position])
+
+
+class _SymbolIndex(Mapping):
+    # Sets of keys by label or by relationship type.
+
+    def __init__(self, image, keys, groups):
+        self._image = image
+        self._keys = keys
+        self._groups = groups
+        self._symbols = [i for i in range(len(image.symbols)) if len(groups[i])]
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def __iter__(self):
+        for i in self._symbols:
+            yield self._image.symbols[i]
+
+    def __getitem__(self, value):
+        try:
+            i = self._image.symbol_ids[value]
+        except (KeyError, TypeError):
+            raise KeyError(value)
+        positions = self._groups[i]
+        if not positions:
+            raise KeyError(value)
+        return _KeySet(self._keys, positions)
+
+
+class _Adjacency(Mapping):
+    # Sets of (relationship key, index) pairs by node key.
+
+    def __init__(self, image, node_keys, relationship_keys, position):
+        offsets_position, data_position = position
+        self._node_keys = node_keys
+        self._relationship_keys = relationship_keys
+        self._offsets = _Array(image.buffer, offsets_position, len(node_keys) + 1, _OFFSET)
+        self._pairs = _Array(image.buffer, data_position, self._offsets[len(node_keys)], _ADJACENCY)
+
+    def _range(self, i):
+        return range(self._offsets[i], self._offsets[i + 1])
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        for i in range(len(self._node_keys)):
+            if self._offsets[i] != self._offsets[i + 1]:
+                yield self._node_keys[i]
+
+    def __getitem__(self, n_id):
+        position = self._node_keys.find(n_id)
+        if position < 0 or self._offsets[position] == self._offsets[position + 1]:
+            raise KeyError(n_id)
+        relationship_keys = self._relationship_keys
+        return frozenset((relationship_keys[r], n_index)
+                         for r, n_index in (self._pairs[j] for j in self._range(position)))
+
+
+class _PropertyIndex(Mapping):
+    # Sets of node keys by index value, for one property index.
+
+    def __init__(self, values, node_keys, groups):
+        self.values = values
+        self._node_keys = node_keys
+        self._groups = groups
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, value):
+        values = self.values
+        try:
+            i = bisect_left(values, value)
+        except TypeError:
+            raise KeyError(value)
+        if i < len(values) and values[i] == value:
+            return _KeySet(self._node_keys, self._groups[i])
+        raise KeyError(value)
+
+
+class _PropertyOrder(FrozenSortedSet):
+    # The distinct values of a property index, in order.
+
+    def __init__(self, values):
+        self._values = values
+
+
+class _Image(object):
+
+    def __init__(self, buffer, relationship_types=None):
+        if bytes(buffer[:len(IMAGE_SIGNATURE)]) != IMAGE_SIGNATURE:
+            raise ImageError("Buffer does not hold a graph image")
+        self.buffer = buffer
+        self._unpacker = Unpacker(relationship_types)
+        position, size = _HEADER.unpack_from(buffer, len(IMAGE_SIGNATURE))
+        if position == 0 or position + size > len(buffer):
+            raise ImageError("Graph image is incomplete")
+        self.catalog = self.unpack(bytes(buffer[position:position + size]))
+        self.symbols = self.catalog["symbols"]
+        self.symbol_ids = {value: i for i, value in enumerate(self.symbols)}
+
+    def unpack(self, data):
+        value, _ = self._unpacker.unpack(bytearray(data))
+        return value
+
+
+class MappedGraphStore(FrozenGraphStore):
+    """ Immutable graph store that reads directly from a graph image
+    held in `buffer`.
+
+    Nothing is decoded up front other than the symbol table. Each node
+    or relationship entry is decoded when accessed, and keys are found
+    by binary search of the image, so memory use is independent of the
+    size of the graph. Counts by label and type are taken from the
+    image without decoding. The store can be wrapped in a
+    :class:`cypy.graph.FrozenGraph`, or used as the basis of a
+    :meth:`.union`, without being copied.
+
+    Relationship types held as classes are decoded as described for
+    :class:`cypy.graph.persistence.Unpacker`.
+
+    :raises ImageError: if `buffer` does not hold a graph image
+    """
+
+    @classmethod
+    def open(cls, path, relationship_types=None):
+        """ Memory-map the graph image file at `path` and return a
+        store that reads from it.
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, relationship_types)
+
+    def __init__(self, buffer, relationship_types=None):
+        image = self._image = _Image(buffer, relationship_types)
+        catalog = image.catalog
+        symbol_count = len(image.symbols)
+        node_count, node_keys, node_entries = catalog["nodes"]
+        node_keys = _Table(image, node_keys, node_count)
+        node_entries = _Table(image, node_entries, node_count)
+        relationship_count, relationship_keys, relationship_entries = catalog["relationships"]
+        relationship_keys = _Table(image, relationship_keys, relationship_count)
+        relationship_entries = _Table(image, relationship_entries, relationship_count)
+        symbols = image.symbols
+
+        def node_entry(entry):
+            labels, properties = entry
+            return NodeEntry(frozenset(symbols[i] for i in labels),
+                             PropertyRecord((symbols[i], value) for i, value in properties.items()))
+
+        def relationship_entry(entry):
+            r_type, nodes, properties = entry
+            return RelationshipEntry(symbols[r_type], tuple(node_keys[i] for i in nodes),
+                                     PropertyRecord((symbols[i], value) for i, value in properties.items()))
+
+        nodes_by_property = {}
+        nodes_by_property_order = {}
+        for n_label, p_key, ordered, count, values, groups in catalog["property_indexes"]:
+            pair = (symbols[n_label], symbols[p_key])
+            index = _PropertyIndex(_Table(image, values, count), node_keys, _Groups(buffer, groups, count))
+            nodes_by_property[pair] = index
+            if ordered:
+                nodes_by_property_order[pair] = _PropertyOrder(index.values)
+
+        GraphStore.__init__(self,
+                            nodes=_Entries(node_keys, node_entries, node_entry),
+                            relationships=_Entries(relationship_keys, relationship_entries, relationship_entry),
+                            nodes_by_label=_SymbolIndex(image, node_keys,
+                                                        _Groups(buffer, catalog["label_index"], symbol_count)),
+                            relationships_by_type=_SymbolIndex(image, relationship_keys,
+                                                               _Groups(buffer, catalog["type_index"], symbol_count)),
+                            relationships_by_node=_Adjacency(image, node_keys, relationship_keys,
+                                                             catalog["adjacency_index"]),
+                            nodes_by_property=nodes_by_property,
+                            nodes_by_property_order=nodes_by_property_order)
+
+    def __eq__(self, other):
+        # Mapped and unmapped frozen stores with the same contents are
+        # equal, whichever is compared with the other.
+        if self is other:
+            return True
+        elif isinstance(other, FrozenGraphStore):
+            if self._hash is not None and other._hash is not None and self._hash != other._hash:
+                return False
+            return self._nodes == other._nodes and self._relationships == other._relationships
+        else:
+            return False
+
+    __hash__ = FrozenGraphStore.__hash__
+
+    def close(self):
+        """ Release the buffer, if it can be closed. The store must not
+        be used afterwards.
+        """
+        close = getattr(self._image.buffer, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,640 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Pattern matching over graph stores.
+
+Patterns can be described either with :class:`.NodePattern`,
+:class:`.RelationshipPattern` and :class:`.PathPattern` objects or by a
+small subset of Cypher, parsed by :func:`.parse`::
+
+    >>> from cypy.graph import Graph
+    >>> g = Graph()
+    >>> for record in g.match("MATCH (a:Person)-[:KNOWS]->(b:Person) WHERE b.age > 30 RETURN a, b"):
+    ...     print(record["a"], record["b"])
+
+Matching starts from whichever node pattern is expected to yield the
+fewest candidates, using property and label indexes where available,
+and expands along relationships through the relationship indexes.
+Results are produced lazily as :class:`.Record` objects.
+"""
+
+from collections import namedtuple
+import re
+
+from cypy.compat import unicode_types, utf8_types
+from cypy.data import Record
+from cypy.graph.store import index_value
+
+
+__all__ = ["NodePattern", "RelationshipPattern", "PathPattern", "Predicate", "Query", "match", "parse"]
+
+
+OUTGOING = 1
+INCOMING = -1
+UNDIRECTED = 0
+
+
+class NodePattern(object):
+    """ Pattern that matches a node with all of the given `labels` and
+    `properties`. Node patterns with the same `name` must match the same
+    node.
+    """
+
+    def __init__(self, name=None, labels=(), properties=None):
+        self.name = name
+        self.labels = frozenset(labels)
+        self.properties = dict(properties or {})
+
+    def __repr__(self):
+        return "{}({!r}, {!r}, {!r})".format(self.__class__.__name__, self.name, sorted(self.labels), self.properties)
+
+
+class RelationshipPattern(object):
+    """ Pattern that matches a relationship of the given `type` (or of any
+    type, if :const:`None`) that has all of the given `properties`.
+
+    The `direction` is :const:`OUTGOING` (left to right),
+    :const:`INCOMING` (right to left) or :const:`UNDIRECTED`.
+    """
+
+    def __init__(self, name=None, type=None, properties=None, direction=OUTGOING):
+        self.name = name
+        self.type = type
+        self.properties = dict(properties or {})
+        self.direction = direction
+
+    def __repr__(self):
+        return "{}({!r}, {!r}, {!r}, {!r})".format(self.__class__.__name__, self.name, self.type,
+                                                   self.properties, self.direction)
+
+
+class PathPattern(object):
+    """ Pattern that matches a path, described by alternating node and
+    relationship patterns, starting and ending with a node pattern.
+    """
+
+    def __init__(self, *elements):
+        if len(elements) % 2 == 0:
+            raise ValueError("Path patterns must alternate node and relationship patterns")
+        for i, element in enumerate(elements):
+            expected = NodePattern if i % 2 == 0 else RelationshipPattern
+            if not isinstance(element, expected):
+                raise TypeError("Element {} of path pattern is not a {}".format(i, expected.__name__))
+        self.elements = tuple(elements)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, ", ".join(map(repr, self.elements)))
+
+
+#: A filter on a property of a matched entity, such as
+#: ``Predicate("b", "age", ">", 30)``. Operators are those of Cypher:
+#: ``=``, ``<>``, ``<``, ``<=``, ``>``, ``>=``, ``IN``, ``STARTS WITH``,
+#: ``ENDS WITH``, ``CONTAINS``, ``IS NULL`` and ``IS NOT NULL``. The
+#: value is ignored for the last two.
+Predicate = namedtuple("Predicate", ["name", "key", "operator", "value"])
+
+#: A parsed query, as returned by :func:`.parse`.
+Query = namedtuple("Query", ["patterns", "where", "returns"])
+
+
+def _compare(test):
+    def compare(value, operand):
+        if value is None or operand is None:
+            return None
+        value = index_value(value)
+        operand = index_value(operand)
+        if value[0] != operand[0]:
+            return None
+        return test(value, operand)
+    return compare
+
+
+def _string_test(test):
+    def string_test(value, operand):
+        if isinstance(value, unicode_types + utf8_types) and isinstance(operand, unicode_types + utf8_types):
+            return test(value, operand)
+        return None
+    return string_test
+
+
+def _in(value, operand):
+    if value is None or operand is None:
+        return None
+    value = index_value(value)
+    return any(index_value(item) == value for item in operand)
+
+
+operators = {
+    "=": lambda value, operand: (None if value is None or operand is None
+                                 else index_value(value) == index_value(operand)),
+    "<>": lambda value, operand: (None if value is None or operand is None
+                                  else index_value(value) != index_value(operand)),
+    "<": _compare(lambda value, operand: value < operand),
+    "<=": _compare(lambda value, operand: value <= operand),
+    ">": _compare(lambda value, operand: value > operand),
+    ">=": _compare(lambda value, operand: value >= operand),
+    "IN": _in,
+    "STARTS WITH": _string_test(lambda value, operand: value.startswith(operand)),
+    "ENDS WITH": _string_test(lambda value, operand: value.endswith(operand)),
+    "CONTAINS": _string_test(lambda value, operand: operand in value),
+    "IS NULL": lambda value, _: value is None,
+    "IS NOT NULL": lambda value, _: value is not None,
+}
+
+
+def type_name(r_type):
+    """ Return the name of a relationship type, which may be held in a
+    store either as a string or as a :class:`.Relationship` subclass.
+    """
+    if isinstance(r_type, unicode_types + utf8_types):
+        return r_type
+    return getattr(r_type, "__name__", r_type)
+
+
+class _Edge(object):
+
+    def __init__(self, name, pattern, left, right):
+        self.name = name
+        self.pattern = pattern
+        self.left = left
+        self.right = right
+
+
+class _Plan(object):
+    """ Compiled form of a set of path patterns and predicates.
+    """
+
+    def __init__(self, store, patterns, where):
+        self.store = store
+        self.nodes = {}
+        self.edges = []
+        self.names = []
+        anonymous = [0]
+
+        def name_of(pattern):
+            if pattern.name is None:
+                anonymous[0] += 1
+                return " {}".format(anonymous[0])
+            if pattern.name not in self.names:
+                self.names.append(pattern.name)
+            return pattern.name
+
+        for path in patterns:
+            names = [name_of(element) for element in path.elements]
+            for name, node in zip(names[0::2], path.elements[0::2]):
+                try:
+                    existing = self.nodes[name]
+                except KeyError:
+                    self.nodes[name] = NodePattern(name, node.labels, node.properties)
+                else:
+                    existing.labels |= node.labels
+                    existing.properties.update(node.properties)
+            for i, relationship in enumerate(path.elements[1::2]):
+                self.edges.append(_Edge(names[2 * i + 1], relationship, names[2 * i], names[2 * i + 2]))
+        for predicate in where:
+            if predicate.operator not in operators:
+                raise ValueError("Unsupported operator {!r}".format(predicate.operator))
+            if predicate.name not in self.nodes and predicate.name not in [edge.name for edge in self.edges]:
+                raise ValueError("Unknown variable {!r} in predicate".format(predicate.name))
+        self.where = list(where)
+        self.types = {}
+        for r_type in store.relationship_types():
+            self.types.setdefault(type_name(r_type), []).append(r_type)
+        self.steps = self._plan()
+
+    def _estimate(self, name):
+        store = self.store
+        pattern = self.nodes[name]
+        indexes = store.node_indexes()
+        estimates = [store.node_count()]
+        for label in pattern.labels:
+            estimates.append(store.node_count(label))
+            for key, value in self._equalities(name):
+                if (label, key) in indexes:
+                    estimates.append(sum(1 for _ in store.nodes_by_property(label, key, value)))
+        return min(estimates)
+
+    def _equalities(self, name):
+        for key, value in self.nodes[name].properties.items():
+            yield key, value
+        for predicate in self.where:
+            if predicate.name == name and predicate.operator == "=":
+                yield predicate.key, predicate.value
+
+    def _edge_cost(self, edge, bound):
+        if edge.left in bound and edge.right in bound:
+            return 0
+        r_type = edge.pattern.type
+        if r_type is None:
+            return self.store.relationship_count()
+        return sum(self.store.relationship_count(t) for t in self.types.get(type_name(r_type), ()))
+
+    def _plan(self):
+        # Greedily choose the cheapest next step: an expansion along a
+        # relationship from a bound node if there is one, otherwise a
+        # scan for the most selective unbound node.
+        steps = []
+        bound = set()
+        edges = list(self.edges)
+        predicates = list(self.where)
+        while edges or len(bound) < len(self.nodes):
+            candidates = [edge for edge in edges if edge.left in bound or edge.right in bound]
+            if candidates:
+                edge = min(candidates, key=lambda e: self._edge_cost(e, bound))
+                edges.remove(edge)
+                from_left = edge.left in bound
+                target = edge.right if from_left else edge.left
+                step = ("expand", edge, from_left, target in bound)
+                bound.add(edge.name)
+                bound.add(target)
+            else:
+                name = min((name for name in self.nodes if name not in bound), key=self._estimate)
+                step = ("scan", name)
+                bound.add(name)
+            applicable = [predicate for predicate in predicates if predicate.name in bound]
+            for predicate in applicable:
+                predicates.remove(predicate)
+            steps.append(step + (applicable,))
+        return steps
+
+    def _scan(self, name, predicates):
+        store = self.store
+        pattern = self.nodes[name]
+        indexes = store.node_indexes()
+        ordered_indexes = store.ordered_node_indexes()
+        for label in pattern.labels:
+            for key, value in self._equalities(name):
+                if (label, key) in indexes:
+                    return list(store.nodes_by_property(label, key, value))
+        for label in pattern.labels:
+            for predicate in predicates:
+                if (label, predicate.key) not in ordered_indexes:
+                    continue
+                if predicate.operator in ("<", "<=", ">", ">="):
+                    bound = "lower" if predicate.operator[0] == ">" else "upper"
+                    inclusive = predicate.operator.endswith("=")
+                    kwargs = {bound: predicate.value, "include_" + bound: inclusive}
+                    return list(store.nodes_by_property_range(label, predicate.key, **kwargs))
+                elif predicate.operator == "STARTS WITH" and isinstance(predicate.value, unicode_types + utf8_types):
+                    return list(store.nodes_by_property_prefix(label, predicate.key, predicate.value))
+        return list(store.nodes(*pattern.labels))
+
+    def _node_matches(self, name, n_id):
+        pattern = self.nodes[name]
+        labels = self.store.node_labels(n_id)
+        if labels is None or not pattern.labels.issubset(labels):
+            return False
+        properties = self.store.node_properties(n_id)
+        return all(operators["="](properties.get(key), value) for key, value in pattern.properties.items())
+
+    def _expand(self, edge, from_left, n_id):
+        store = self.store
+        pattern = edge.pattern
+        if pattern.type is None:
+            r_types = [None]
+        else:
+            r_types = self.types.get(type_name(pattern.type), [])
+        outgoing = pattern.direction == OUTGOING
+        for r_type in r_types:
+            if pattern.direction == UNDIRECTED:
+                r_ids = store.relationships(r_type, {n_id})
+            elif outgoing == from_left:
+                r_ids = store.relationships(r_type, (n_id, None))
+            else:
+                r_ids = store.relationships(r_type, (None, n_id))
+            for r_id in list(r_ids):
+                n_ids = store.relationship_nodes(r_id)
+                if pattern.direction == UNDIRECTED:
+                    other = n_ids[-1] if n_ids[0] == n_id else n_ids[0]
+                elif outgoing == from_left:
+                    other = n_ids[-1]
+                else:
+                    other = n_ids[0]
+                properties = store.relationship_properties(r_id)
+                if all(operators["="](properties.get(key), value) for key, value in pattern.properties.items()):
+                    yield r_id, other
+
+    def _properties(self, name, entity_id):
+        if name in self.nodes:
+            return self.store.node_properties(entity_id)
+        else:
+            return self.store.relationship_properties(entity_id)
+
+    def _accept(self, predicates, binding):
+        for name, key, operator, value in predicates:
+            if not operators[operator](self._properties(name, binding[name]).get(key), value):
+                return False
+        return True
+
+    def execute(self, i=0, binding=None, used=None):
+        """ Generate a binding of names to entity keys for every match.
+        """
+        if binding is None:
+            binding = {}
+            used = set()
+        if i == len(self.steps):
+            yield dict(binding)
+            return
+        step = self.steps[i]
+        predicates = step[-1]
+        if step[0] == "scan":
+            name = step[1]
+            for n_id in self._scan(name, predicates):
+                if not self._node_matches(name, n_id):
+                    continue
+                binding[name] = n_id
+                if self._accept(predicates, binding):
+                    for result in self.execute(i + 1, binding, used):
+                        yield result
+            binding.pop(name, None)
+        else:
+            _, edge, from_left, target_bound = step[:4]
+            source, target = (edge.left, edge.right) if from_left else (edge.right, edge.left)
+            for r_id, other in list(self._expand(edge, from_left, binding[source])):
+                if r_id in used:
+                    # A relationship can only be matched once per result
+                    continue
+                if target_bound:
+                    if binding[target] != other:
+                        continue
+                elif not self._node_matches(target, other):
+                    continue
+                binding[edge.name] = r_id
+                binding[target] = other
+                used.add(r_id)
+                if self._accept(predicates, binding):
+                    for result in self.execute(i + 1, binding, used):
+                        yield result
+                used.discard(r_id)
+            binding.pop(edge.name, None)
+            if not target_bound:
+                binding.pop(target, None)
+
+
+def match(graph_structure, patterns, where=(), returns=None):
+    """ Match patterns against a graph structure.
+
+    :param graph_structure: graph structure to match against
+    :param patterns: a :class:`.PathPattern` or :class:`.NodePattern`,
+                     or a list of these; variables shared between
+                     patterns must match the same entities
+    :param where: sequence of :class:`.Predicate` filters, all of which
+                  must hold for a match
+    :param returns: names to return, either variables (``"a"``) or
+                    properties (``"a.name"``); by default, all named
+                    variables are returned
+    :return: iterator of :class:`.Record` objects, one per match
+    """
+    from cypy.graph import Node, relationship_type
+    store = graph_structure.__graph_store__()
+    if isinstance(patterns, (NodePattern, PathPattern)):
+        patterns = [patterns]
+    patterns = [pattern if isinstance(pattern, PathPattern) else PathPattern(pattern) for pattern in patterns]
+    where = [predicate if isinstance(predicate, Predicate) else Predicate(*predicate) for predicate in where]
+    plan = _Plan(store, patterns, where)
+    if returns is None:
+        returns = plan.names
+    fields = []
+    for item in returns:
+        name, _, key = item.partition(".")
+        if name not in plan.nodes and name not in [edge.name for edge in plan.edges]:
+            raise ValueError("Unknown variable {!r} in return".format(name))
+        fields.append((item, name, key or None))
+
+    def value(name, key, entity_id):
+        if key is not None:
+            return plan._properties(name, entity_id).get(key)
+        elif name in plan.nodes:
+            return Node.view(store, entity_id)
+        else:
+            r_type = store.relationship_type(entity_id)
+            if not hasattr(r_type, "view"):
+                r_type = relationship_type(r_type)
+            return r_type.view(store, entity_id)
+
+    for binding in plan.execute():
+        yield Record((item, value(name, key, binding[name])) for item, name, key in fields)
+
+
+_token = re.compile(r"""
+    \s+
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<number>\d+\.\d*(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?|\.\d+)
+  | (?P<parameter>\$\w+)
+  | (?P<name>`[^`]+`|[A-Za-z_]\w*)
+  | (?P<symbol><>|<=|>=|[()\[\]{}:,.\-<>=])
+""", re.VERBOSE)
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+    while position < len(query):
+        m = _token.match(query, position)
+        if m is None:
+            raise ValueError("Unexpected character {!r} at position {}".format(query[position], position))
+        position = m.end()
+        if m.lastgroup is not None:
+            tokens.append((m.lastgroup, m.group(m.lastgroup)))
+    return tokens
+
+
+class _Parser(object):
+
+    escapes = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+    def __init__(self, query, parameters):
+        self.tokens = _tokenize(query)
+        self.position = 0
+        self.parameters = parameters or {}
+
+    def peek(self, offset=0):
+        try:
+            return self.tokens[self.position + offset]
+        except IndexError:
+            return None, None
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError("Unexpected end of query")
+        self.position += 1
+        return token
+
+    def keyword(self, *words):
+        for i, word in enumerate(words):
+            kind, text = self.peek(i)
+            if kind != "name" or text.upper() != word:
+                return False
+        self.position += len(words)
+        return True
+
+    def symbol(self, text):
+        if self.peek() == ("symbol", text):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.symbol(text):
+            raise ValueError("Expected {!r} but found {!r}".format(text, self.peek()[1]))
+
+    def name(self):
+        kind, text = self.next()
+        if kind != "name":
+            raise ValueError("Expected name but found {!r}".format(text))
+        return text[1:-1] if text.startswith("`") else text
+
+    def literal(self):
+        negative = self.symbol("-")
+        kind, text = self.next()
+        if kind == "number":
+            value = float(text) if any(c in text for c in ".eE") else int(text)
+            return -value if negative else value
+        elif negative:
+            raise ValueError("Expected number but found {!r}".format(text))
+        elif kind == "string":
+            return re.sub(r"\\(.)", lambda m: self.escapes.get(m.group(1), m.group(1)), text[1:-1])
+        elif kind == "parameter":
+            try:
+                return self.parameters[text[1:]]
+            except KeyError:
+                raise ValueError("Missing parameter {!r}".format(text[1:]))
+        elif kind == "name" and text.upper() in ("TRUE", "FALSE", "NULL"):
+            return {"TRUE": True, "FALSE": False, "NULL": None}[text.upper()]
+        elif (kind, text) == ("symbol", "["):
+            items = []
+            if not self.symbol("]"):
+                items.append(self.literal())
+                while self.symbol(","):
+                    items.append(self.literal())
+                self.expect("]")
+            return items
+        raise ValueError("Expected literal but found {!r}".format(text))
+
+    def properties(self):
+        properties = {}
+        if self.symbol("{"):
+            if not self.symbol("}"):
+                while True:
+                    key = self.name()
+                    self.expect(":")
+                    properties[key] = self.literal()
+                    if not self.symbol(","):
+                        break
+                self.expect("}")
+        return properties
+
+    def node(self):
+        self.expect("(")
+        name = None
+        if self.peek()[0] == "name":
+            name = self.name()
+        labels = []
+        while self.symbol(":"):
+            labels.append(self.name())
+        properties = self.properties()
+        self.expect(")")
+        return NodePattern(name, labels, properties)
+
+    def relationship(self):
+        incoming = self.symbol("<")
+        self.expect("-")
+        name = r_type = None
+        properties = {}
+        if self.symbol("["):
+            if self.peek()[0] == "name":
+                name = self.name()
+            if self.symbol(":"):
+                r_type = self.name()
+            properties = self.properties()
+            self.expect("]")
+        self.expect("-")
+        outgoing = self.symbol(">")
+        if incoming and outgoing:
+            raise ValueError("Relationship cannot point in both directions")
+        direction = INCOMING if incoming else OUTGOING if outgoing else UNDIRECTED
+        return RelationshipPattern(name, r_type, properties, direction)
+
+    def path(self):
+        elements = [self.node()]
+        while self.peek() in (("symbol", "-"), ("symbol", "<")):
+            elements.append(self.relationship())
+            elements.append(self.node())
+        return PathPattern(*elements)
+
+    def predicate(self):
+        name = self.name()
+        self.expect(".")
+        key = self.name()
+        if self.keyword("IS", "NOT", "NULL"):
+            return Predicate(name, key, "IS NOT NULL", None)
+        elif self.keyword("IS", "NULL"):
+            return Predicate(name, key, "IS NULL", None)
+        elif self.keyword("STARTS", "WITH"):
+            return Predicate(name, key, "STARTS WITH", self.literal())
+        elif self.keyword("ENDS", "WITH"):
+            return Predicate(name, key, "ENDS WITH", self.literal())
+        elif self.keyword("CONTAINS"):
+            return Predicate(name, key, "CONTAINS", self.literal())
+        elif self.keyword("IN"):
+            return Predicate(name, key, "IN", self.literal())
+        kind, text = self.next()
+        if kind != "symbol" or text not in operators:
+            raise ValueError("Expected operator but found {!r}".format(text))
+        return Predicate(name, key, text, self.literal())
+
+    def query(self):
+        if not self.keyword("MATCH"):
+            raise ValueError("Query must begin with MATCH")
+        patterns = [self.path()]
+        while self.symbol(","):
+            patterns.append(self.path())
+        where = []
+        if self.keyword("WHERE"):
+            where.append(self.predicate())
+            while self.keyword("AND"):
+                where.append(self.predicate())
+        returns = None
+        if self.keyword("RETURN"):
+            returns = []
+            while True:
+                item = self.name()
+                if self.symbol("."):
+                    item += "." + self.name()
+                returns.append(item)
+                if not self.symbol(","):
+                    break
+        if self.peek()[0] is not None:
+            raise ValueError("Unsupported syntax at {!r}".format(self.peek()[1]))
+        return Query(patterns, where, returns)
+
+
+def parse(query, parameters=None):
+    """ Parse a query in a subset of Cypher into a :class:`.Query`.
+
+    The subset supported is a single ``MATCH`` clause containing one or
+    more comma-separated path patterns, an optional ``WHERE`` clause of
+    predicates joined by ``AND`` and an optional ``RETURN`` clause of
+    variables and properties. Literal values may be given inline or as
+    ``$name`` references to `parameters`.
+
+    :raises ValueError: if the query is not in the supported subset
+    """
+    return _Parser(query, parameters).query()
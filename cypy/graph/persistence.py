@@ -0,0 +1,678 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Local disk persistence for mutable graph stores.
+
+A :class:`.Journal` makes a :class:`cypy.graph.store.MutableGraphStore`
+durable. Every change published to the store's change log is appended
+to a write-ahead log and, from time to time, the whole store is written
+to a snapshot file as a checkpoint. Opening a journal recovers the store
+by loading the latest snapshot and replaying the changes logged since.
+
+A journal directory holds a single ``snapshot`` file and any number of
+log segments, named ``wal.<number>``. Each file starts with an eight
+byte signature, followed by a series of frames. A frame holds a varint
+length, a payload of that length and a CRC-32 of the payload. Payloads
+use a compact binary encoding of the values that a store can hold. A
+damaged frame at the end of the latest log segment, as left by a crash
+part way through a write, is discarded on recovery.
+"""
+
+import os
+from struct import Struct
+from threading import RLock, Timer
+from time import time
+from uuid import UUID
+from zlib import crc32
+
+from cypy.compat import bytes_types, integer_types, unicode_types, utf8_types
+from cypy.graph import relationship_type
+from cypy.graph.changes import Change, NODE_CREATED, NODE_REMOVED, NODE_LABELS_ADDED, NODE_LABELS_REMOVED, \
+    NODE_PROPERTY_SET, RELATIONSHIP_CREATED, RELATIONSHIP_REMOVED, RELATIONSHIP_PROPERTY_SET, \
+    INDEX_CREATED, INDEX_DROPPED, CONSTRAINT_CREATED, CONSTRAINT_DROPPED
+from cypy.graph.store import GraphStore, MutableGraphStore, NodeEntry, RelationshipEntry
+
+
+WAL_SIGNATURE = b"CYPYWAL1"
+SNAPSHOT_SIGNATURE = b"CYPYSNP1"
+
+SNAPSHOT_FILE_NAME = "snapshot"
+SEGMENT_PREFIX = "wal."
+
+# Change types, numbered by their position for encoding. New types must
+# only ever be added at the end.
+_CHANGE_TYPES = (NODE_CREATED, NODE_REMOVED, NODE_LABELS_ADDED, NODE_LABELS_REMOVED, NODE_PROPERTY_SET,
+                 RELATIONSHIP_CREATED, RELATIONSHIP_REMOVED, RELATIONSHIP_PROPERTY_SET,
+                 INDEX_CREATED, INDEX_DROPPED, CONSTRAINT_CREATED, CONSTRAINT_DROPPED)
+_CHANGE_TYPE_CODES = {change_type: code for code, change_type in enumerate(_CHANGE_TYPES)}
+
+# Value tags.
+_NULL, _FALSE, _TRUE, _INT, _FLOAT, _STRING, _BYTES, _LIST, _TUPLE, _SET, _MAP, _UUID, _TYPE = range(13)
+
+# Snapshot frame kinds.
+_HEADER, _NODES, _RELATIONSHIPS, _END = range(4)
+
+_DOUBLE = Struct(">d")
+_CRC = Struct(">I")
+
+_SNAPSHOT_BATCH_SIZE = 1024
+
+# Type of decoded binary data. On Python 2, native strings are UTF-8
+# text, so binary data is held in bytearrays, as for cypy.compat.
+_BINARY_TYPE = bytearray if utf8_types else bytes
+
+
+class JournalError(IOError):
+    """ Raised when a journal cannot be read.
+    """
+
+
+def _pack_uint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _unpack_uint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _pack_bytes(tag, data, out):
+    out.append(tag)
+    _pack_uint(len(data), out)
+    out.extend(data)
+
+
+def _pack_none(value, out):
+    out.append(_NULL)
+
+
+def _pack_bool(value, out):
+    out.append(_TRUE if value else _FALSE)
+
+
+def _pack_int(value, out):
+    out.append(_INT)
+    _pack_uint(value << 1 if value >= 0 else (-value << 1) - 1, out)
+
+
+def _pack_float(value, out):
+    out.append(_FLOAT)
+    out.extend(_DOUBLE.pack(value))
+
+
+def _pack_unicode(value, out):
+    _pack_bytes(_STRING, value.encode("utf-8"), out)
+
+
+def _pack_utf8(value, out):
+    # A native string on Python 2, held as UTF-8 text, which is checked
+    # here so that it can always be decoded.
+    value.decode("utf-8")
+    _pack_bytes(_STRING, value, out)
+
+
+def _pack_raw(value, out):
+    _pack_bytes(_BYTES, value, out)
+
+
+def _pack_uuid(value, out):
+    out.append(_UUID)
+    out.extend(value.bytes)
+
+
+def _pack_type(value, out):
+    _pack_bytes(_TYPE, value.__name__.encode("utf-8"), out)
+
+
+def _pack_map(value, out):
+    out.append(_MAP)
+    _pack_uint(len(value), out)
+    for key, item in value.items():
+        pack(key, out)
+        pack(item, out)
+
+
+def _collection_packer(tag):
+
+    def pack_collection(value, out):
+        out.append(tag)
+        _pack_uint(len(value), out)
+        for item in value:
+            pack(item, out)
+
+    return pack_collection
+
+
+# Packers by type, in order of precedence, as bool is a subclass of int.
+_PACKERS = [
+    (bool, _pack_bool),
+    (integer_types, _pack_int),
+    (float, _pack_float),
+    (unicode_types, _pack_unicode),
+    (utf8_types, _pack_utf8),
+    (bytes_types, _pack_raw),
+    (UUID, _pack_uuid),
+    (type, _pack_type),
+    (dict, _pack_map),
+    (list, _collection_packer(_LIST)),
+    (tuple, _collection_packer(_TUPLE)),
+    ((set, frozenset), _collection_packer(_SET)),
+]
+
+# Packers by exact type, filled in as each new type is seen.
+_PACKERS_BY_TYPE = {type(None): _pack_none}
+
+
+def pack(value, out):
+    """ Append the binary encoding of `value` to the bytearray `out`.
+
+    Integers are zigzag encoded as varints, so need not fit into 64
+    bits. Relationship type classes are encoded by name. On Python 2, a
+    native string is encoded as UTF-8 text and decoded as a Unicode
+    string, and binary data must be held in a bytearray.
+
+    :raises TypeError: if `value` cannot be encoded
+    :raises UnicodeDecodeError: if a native string on Python 2 is not
+        valid UTF-8
+    """
+    value_type = type(value)
+    try:
+        packer = _PACKERS_BY_TYPE[value_type]
+    except KeyError:
+        for types, packer in _PACKERS:
+            if isinstance(value, types):
+                break
+        else:
+            raise TypeError("Values of type {} cannot be encoded".format(value_type.__name__))
+        _PACKERS_BY_TYPE[value_type] = packer
+    packer(value, out)
+
+
+class Unpacker(object):
+    """ Decoder for values encoded by :func:`.pack`.
+
+    Relationship types are decoded to the classes given by name in
+    `relationship_types`, or otherwise to classes created by
+    :func:`cypy.graph.relationship_type`. In the latter case, one class
+    is created for each name and used for every occurrence of that name.
+    """
+
+    def __init__(self, relationship_types=None):
+        self._relationship_types = dict(relationship_types or {})
+
+    def unpack(self, data, offset=0):
+        """ Decode one value from the bytearray `data`, starting at
+        `offset`, and return it with the offset of the next value.
+
+        :raises IndexError: if the data ends part way through the value
+        :raises ValueError: if the data holds an unknown tag
+        """
+        tag = data[offset]
+        offset += 1
+        if tag == _NULL:
+            return None, offset
+        elif tag == _TRUE:
+            return True, offset
+        elif tag == _FALSE:
+            return False, offset
+        elif tag == _INT:
+            n, offset = _unpack_uint(data, offset)
+            return (n >> 1) if not n & 1 else -((n + 1) >> 1), offset
+        elif tag == _FLOAT:
+            value, = _DOUBLE.unpack_from(data, offset)
+            return value, offset + 8
+        elif tag in (_STRING, _BYTES, _TYPE):
+            size, offset = _unpack_uint(data, offset)
+            end = offset + size
+            if end > len(data):
+                raise IndexError("Data ends within value")
+            raw = bytes(data[offset:end])
+            if tag == _BYTES:
+                return _BINARY_TYPE(raw), end
+            value = raw.decode("utf-8")
+            if tag == _TYPE:
+                value = self._relationship_type(value)
+            return value, end
+        elif tag == _UUID:
+            end = offset + 16
+            if end > len(data):
+                raise IndexError("Data ends within value")
+            return UUID(bytes=bytes(data[offset:end])), end
+        elif tag == _MAP:
+            size, offset = _unpack_uint(data, offset)
+            value = {}
+            for _ in range(size):
+                key, offset = self.unpack(data, offset)
+                value[key], offset = self.unpack(data, offset)
+            return value, offset
+        elif tag in (_LIST, _TUPLE, _SET):
+            size, offset = _unpack_uint(data, offset)
+            items = []
+            for _ in range(size):
+                item, offset = self.unpack(data, offset)
+                items.append(item)
+            if tag == _TUPLE:
+                return tuple(items), offset
+            elif tag == _SET:
+                return frozenset(items), offset
+            else:
+                return items, offset
+        else:
+            raise ValueError("Unknown tag {}".format(tag))
+
+    def _relationship_type(self, name):
+        try:
+            return self._relationship_types[name]
+        except KeyError:
+            r_type = self._relationship_types[name] = relationship_type(name)
+            return r_type
+
+
+def _frame(value):
+    payload = bytearray()
+    pack(value, payload)
+    frame = bytearray()
+    _pack_uint(len(payload), frame)
+    frame.extend(payload)
+    frame.extend(_CRC.pack(crc32(bytes(payload)) & 0xFFFFFFFF))
+    return frame
+
+
+def _read_frames(data, offset):
+    # Yield the payload and end offset of each intact frame, stopping
+    # at the end of the data or at the first damaged frame.
+    size = len(data)
+    while offset < size:
+        try:
+            length, start = _unpack_uint(data, offset)
+        except IndexError:
+            return
+        end = start + length + _CRC.size
+        if end > size:
+            return
+        payload = bytes(data[start:start + length])
+        if _CRC.unpack_from(data, start + length)[0] != crc32(payload) & 0xFFFFFFFF:
+            return
+        yield bytearray(payload), end
+        offset = end
+
+
+def _read_file(path, signature):
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    if data[:len(signature)] != signature:
+        raise JournalError("File {!r} is not a journal file of the expected kind".format(path))
+    return data
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Journal(object):
+    """ Write-ahead log and snapshot persistence for a
+    :class:`cypy.graph.store.MutableGraphStore`, kept in a local
+    directory. Use :meth:`.open` to recover a store and start
+    journalling its changes.
+
+    Changes are written in the batches in which the change log
+    publishes them, one batch per store operation, and each batch is
+    flushed to the operating system as it is written. Writes are made
+    durable with fsync. If `sync_interval` is zero, every batch is
+    synced before the operation that made it returns. Otherwise, batches
+    are committed as a group by a single fsync once `sync_interval`
+    seconds have passed since the last, either when a later batch is
+    written or by a background timer, trading the durability of recent
+    changes in the event of power loss for throughput. A process crash
+    loses nothing that has been flushed.
+
+    Batches are written as the change log publishes them, after the
+    store has applied the changes, so an error writing the journal
+    cannot undo a store operation. Instead, the journal stops writing
+    and is marked as failed: :meth:`.sync`, :meth:`.checkpoint` and
+    :meth:`.close` then raise :exc:`.JournalError`, and changes made
+    since the failure are not journalled.
+
+    A checkpoint is taken after every `checkpoint_interval` changes,
+    and can also be taken on demand with :meth:`.checkpoint`. A
+    checkpoint writes a snapshot of the store to disk and deletes the
+    log segments that it makes redundant, which bounds both disk usage
+    and recovery time. If `checkpoint_interval` is zero, checkpoints
+    are only taken on demand.
+    """
+
+    default_checkpoint_interval = 65536
+
+    @classmethod
+    def open(cls, directory, sync_interval=0.0, checkpoint_interval=None, relationship_types=None):
+        """ Open the journal in `directory`, creating the directory if
+        necessary, and return it. The recovered store is available as
+        :attr:`.store`; a store with no journal history starts empty.
+
+        Relationship types held as classes are recovered as described
+        for :class:`.Unpacker`, using `relationship_types` to map names
+        to classes.
+
+        :raises JournalError: if the journal is damaged beyond the
+            tail of the latest log segment
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        unpacker = Unpacker(relationship_types)
+        store = MutableGraphStore()
+        sequence = 0
+        snapshot_path = os.path.join(directory, SNAPSHOT_FILE_NAME)
+        if os.path.exists(snapshot_path):
+            sequence = cls._load_snapshot(snapshot_path, store, unpacker)
+        segments = cls._segments(directory)
+        for i, (_, path) in enumerate(segments):
+            sequence = cls._replay_segment(path, store, unpacker, sequence, last=(i == len(segments) - 1))
+        next_segment = segments[-1][0] + 1 if segments else 1
+        checkpoint_interval = cls.default_checkpoint_interval if checkpoint_interval is None else checkpoint_interval
+        return cls(directory, store, sequence, next_segment, sync_interval, checkpoint_interval)
+
+    @classmethod
+    def _segments(cls, directory):
+        segments = []
+        for name in os.listdir(directory):
+            if name.startswith(SEGMENT_PREFIX):
+                try:
+                    number = int(name[len(SEGMENT_PREFIX):])
+                except ValueError:
+                    continue
+                segments.append((number, os.path.join(directory, name)))
+        segments.sort()
+        return segments
+
+    @classmethod
+    def _load_snapshot(cls, path, store, unpacker):
+        data = _read_file(path, SNAPSHOT_SIGNATURE)
+        sequence = None
+        constraints = ()
+        nodes = {}
+        relationships = {}
+        for payload, _ in _read_frames(data, len(SNAPSHOT_SIGNATURE)):
+            (kind, content), _ = unpacker.unpack(payload)
+            if kind == _HEADER:
+                sequence, indexes, constraints = content
+                for n_label, p_key, ordered in indexes:
+                    store.create_index(n_label, p_key, ordered)
+            elif kind == _NODES:
+                for key, labels, properties in content:
+                    nodes[key] = NodeEntry(labels, properties)
+            elif kind == _RELATIONSHIPS:
+                for key, r_type, n_ids, properties in content:
+                    relationships[key] = RelationshipEntry(r_type, n_ids, properties)
+            elif kind == _END:
+                break
+        else:
+            raise JournalError("Snapshot {!r} is incomplete".format(path))
+        store.update(GraphStore(nodes, relationships))
+        for n_label, p_key in constraints:
+            store.create_uniqueness_constraint(n_label, p_key)
+        return sequence
+
+    @classmethod
+    def _replay_segment(cls, path, store, unpacker, sequence, last):
+        data = _read_file(path, WAL_SIGNATURE)
+        end = len(WAL_SIGNATURE)
+        for payload, end in _read_frames(data, end):
+            changes = []
+            for change_sequence, code, key, detail in unpacker.unpack(payload)[0]:
+                if change_sequence > sequence:
+                    changes.append(Change(change_sequence, _CHANGE_TYPES[code], key, detail))
+            if changes:
+                store.apply(changes)
+                sequence = changes[-1].sequence
+        if end < len(data):
+            if not last:
+                raise JournalError("Log segment {!r} is damaged at offset {}".format(path, end))
+            with open(path, "r+b") as f:
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
+        return sequence
+
+    def __init__(self, directory, store, sequence, next_segment, sync_interval, checkpoint_interval):
+        self._directory = directory
+        self._store = store
+        self._sync_interval = sync_interval
+        self._checkpoint_interval = checkpoint_interval
+        self._lock = RLock()
+        self._file = None
+        self._segment = next_segment
+        self._last_sync = time()
+        self._unsynced = False
+        self._timer = None
+        self._failure = None
+        self._changes_since_checkpoint = 0
+        self._checkpointing = False
+        self._open_segment()
+        self._change_log = store.change_log(sequence=sequence)
+        self._change_log.subscribe(self._write)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def store(self):
+        """ The store whose changes are journalled.
+        """
+        return self._store
+
+    @property
+    def directory(self):
+        """ The directory in which the journal is kept.
+        """
+        return self._directory
+
+    def closed(self):
+        """ Return :const:`True` if this journal has been closed.
+        """
+        return self._file is None
+
+    def failed(self):
+        """ Return :const:`True` if writing to this journal has failed.
+        """
+        return self._failure is not None
+
+    def _fail(self, error):
+        with self._lock:
+            if self._failure is None:
+                self._failure = error
+            self._cancel_timer()
+
+    def _check_failure(self):
+        if self._failure is not None:
+            raise JournalError("Journal failed: {}".format(self._failure))
+
+    def _open_segment(self):
+        path = os.path.join(self._directory, "{}{:06d}".format(SEGMENT_PREFIX, self._segment))
+        self._file = open(path, "wb")
+        self._file.write(WAL_SIGNATURE)
+        self._sync()
+        _fsync_directory(self._directory)
+
+    def _sync(self):
+        self._cancel_timer()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time()
+        self._unsynced = False
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _timed_sync(self):
+        # Sync a tail of batches for which no later batch has arrived.
+        with self._lock:
+            self._timer = None
+            if self._file is None or self._failure is not None or not self._unsynced:
+                return
+            try:
+                self._sync()
+            except (IOError, OSError) as error:
+                self._fail(error)
+
+    def _write(self, changes):
+        with self._lock:
+            if self._file is None or self._failure is not None:
+                return
+            try:
+                self._file.write(_frame([(change.sequence, _CHANGE_TYPE_CODES[change.type], change.key, change.detail)
+                                         for change in changes]))
+                self._file.flush()
+                self._unsynced = True
+                wait = self._last_sync + self._sync_interval - time()
+                if wait <= 0:
+                    self._sync()
+                elif self._timer is None:
+                    self._timer = Timer(wait, self._timed_sync)
+                    self._timer.daemon = True
+                    self._timer.start()
+            except (IOError, OSError) as error:
+                self._fail(error)
+                return
+            self._changes_since_checkpoint += len(changes)
+            due = (self._checkpoint_interval and not self._checkpointing and
+                   self._changes_since_checkpoint >= self._checkpoint_interval)
+        if due:
+            try:
+                self.checkpoint()
+            except (IOError, OSError) as error:
+                self._fail(error)
+
+    def sync(self):
+        """ Make all changes written so far durable.
+
+        :raises JournalError: if writing to the journal has failed
+        """
+        with self._lock:
+            self._check_failure()
+            if self._file is not None and self._unsynced:
+                self._sync()
+
+    def checkpoint(self):
+        """ Write a snapshot of the store to disk, then delete all log
+        segments holding only changes that the snapshot includes.
+
+        The store is locked only while a copy-on-write snapshot is
+        taken and the log moves on to a new segment. Writing the
+        snapshot file happens while the store remains open for changes.
+
+        :raises JournalError: if writing to the journal has failed
+        """
+        store = self._store
+        with self._lock:
+            if self._file is None:
+                raise ValueError("Journal is closed")
+            self._check_failure()
+            self._checkpointing = True
+        try:
+            with store._lock:
+                sequence = self._change_log.last_sequence(pending=True)
+                snapshot = store.snapshot()
+                constraints = store.uniqueness_constraints()
+                with self._lock:
+                    self._sync()
+                    self._file.close()
+                    obsolete = [path for number, path in self._segments(self._directory)
+                                if number <= self._segment]
+                    self._segment += 1
+                    self._open_segment()
+                    self._changes_since_checkpoint = 0
+            self._write_snapshot(snapshot, sequence, constraints)
+            for path in obsolete:
+                os.remove(path)
+        finally:
+            self._checkpointing = False
+
+    def _write_snapshot(self, snapshot, sequence, constraints):
+        ordered = snapshot.ordered_node_indexes()
+        indexes = [(n_label, p_key, (n_label, p_key) in ordered) for n_label, p_key in snapshot.node_indexes()]
+        path = os.path.join(self._directory, SNAPSHOT_FILE_NAME)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(SNAPSHOT_SIGNATURE)
+            f.write(_frame((_HEADER, (sequence, indexes, list(constraints)))))
+            batch = []
+            for key, (labels, properties) in snapshot._nodes.items():
+                batch.append((key, labels, dict(properties.items())))
+                if len(batch) == _SNAPSHOT_BATCH_SIZE:
+                    f.write(_frame((_NODES, batch)))
+                    batch = []
+            if batch:
+                f.write(_frame((_NODES, batch)))
+                batch = []
+            for key, (r_type, n_ids, properties) in snapshot._relationships.items():
+                batch.append((key, r_type, n_ids, dict(properties.items())))
+                if len(batch) == _SNAPSHOT_BATCH_SIZE:
+                    f.write(_frame((_RELATIONSHIPS, batch)))
+                    batch = []
+            if batch:
+                f.write(_frame((_RELATIONSHIPS, batch)))
+            f.write(_frame((_END, None)))
+            f.flush()
+            os.fsync(f.fileno())
+        getattr(os, "replace", os.rename)(temp_path, path)
+        _fsync_directory(self._directory)
+
+    def close(self):
+        """ Stop journalling, sync all changes written and close the
+        log. Closing a closed journal has no effect.
+
+        :raises JournalError: if writing to the journal has failed;
+            the journal is closed regardless
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._change_log.unsubscribe(self._write)
+            try:
+                if self._failure is None:
+                    self._sync()
+            finally:
+                self._cancel_timer()
+                self._file.close()
+                self._file = None
+            self._check_failure()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Graph stores shared between processes through shared memory.
+
+One process publishes a graph store with :meth:`.SharedGraphStore.publish`,
+which copies a graph image (see :mod:`cypy.graph.mapped`) into a named
+shared memory block. Any number of other processes can then attach to
+the block by name with :meth:`.SharedGraphStore.attach` and read the
+graph in place, so that a single copy of the data serves them all.
+
+This requires :mod:`multiprocessing.shared_memory`, which is available
+from Python 3.8.
+"""
+
+from io import BytesIO
+
+from cypy.graph.mapped import MappedGraphStore, write
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+def _require_shared_memory():
+    if shared_memory is None:
+        raise RuntimeError("Shared memory is not supported by this version of Python")
+
+
+def _attach_block(name):
+    # Attach without registering the block with the resource tracker,
+    # which would otherwise destroy it when this process exits.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(block._name, "shared_memory")
+    except (ImportError, AttributeError):
+        pass
+    return block
+
+
+class SharedGraphStore(MappedGraphStore):
+    """ Immutable graph store held in a named block of shared memory.
+
+    The store reads from the block in place, exactly as a
+    :class:`cypy.graph.mapped.MappedGraphStore` reads from a mapped
+    file. Stores should be closed when no longer needed; the publishing
+    process should also :meth:`.unlink` the block once all processes
+    have finished with it.
+    """
+
+    @classmethod
+    def publish(cls, graph_store, name=None):
+        """ Copy an image of `graph_store` into a new shared memory
+        block and return a store that reads from it. The block is given
+        a unique name unless `name` is supplied.
+
+        :raises RuntimeError: if shared memory is not supported
+        :raises FileExistsError: if a block called `name` already exists
+        """
+        _require_shared_memory()
+        f = BytesIO()
+        write(graph_store, f)
+        data = f.getbuffer()
+        block = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+        try:
+            block.buf[:len(data)] = data
+        except Exception:
+            block.close()
+            block.unlink()
+            raise
+        finally:
+            data.release()
+        return cls(block)
+
+    @classmethod
+    def attach(cls, name, relationship_types=None):
+        """ Attach to the shared memory block called `name`, as created
+        by :meth:`.publish` in this or another process, and return a
+        store that reads from it.
+
+        :raises RuntimeError: if shared memory is not supported
+        :raises FileNotFoundError: if no block called `name` exists
+        """
+        _require_shared_memory()
+        return cls(_attach_block(name), relationship_types)
+
+    def __init__(self, block, relationship_types=None):
+        self._block = block
+        super(SharedGraphStore, self).__init__(block.buf, relationship_types)
+
+    @property
+    def name(self):
+        """ The name of the shared memory block, by which other
+        processes can attach to it.
+        """
+        return self._block.name
+
+    def close(self):
+        """ Detach from the shared memory block. The store must not be
+        used afterwards.
+        """
+        self._block.close()
+
+    def unlink(self):
+        """ Request that the shared memory block be destroyed once all
+        processes have closed it.
+        """
+        self._block.unlink()
@@ -0,0 +1,1002 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Graph storage in a local SQLite database, for graphs that are too large
+to hold in memory.
+
+A :class:`.SQLiteGraphStore` offers the same interface as a
+:class:`cypy.graph.store.MutableGraphStore`, but keeps all nodes,
+relationships, labels, types and property indexes in database tables,
+each with the indexes needed to serve its queries. Only a bounded
+number of recently used entries are held in memory.
+"""
+
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import RLock
+
+from cypy.collections import ReactiveSet, FrozenSortedSet
+from cypy.compat import ustr, utf8_types
+from cypy.graph.persistence import Unpacker, pack
+from cypy.graph.store import GraphStore, FrozenGraphStore, ConstraintError, NodeEntry, RelationshipEntry, \
+    PropertyDict, ReactivePropertyDict, enumerate_nodes, index_value
+
+try:
+    from collections.abc import Mapping, Sequence, Set
+except ImportError:
+    from collections import Mapping, Sequence, Set
+
+
+_SCHEMA = """\
+CREATE TABLE IF NOT EXISTS node (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key BLOB NOT NULL UNIQUE,
+    properties BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS node_label (
+    label TEXT NOT NULL,
+    node INTEGER NOT NULL,
+    PRIMARY KEY (label, node)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS node_label_by_node ON node_label (node);
+CREATE TABLE IF NOT EXISTS relationship (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key BLOB NOT NULL UNIQUE,
+    type BLOB NOT NULL,
+    nodes BLOB NOT NULL,
+    properties BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS relationship_by_type ON relationship (type);
+CREATE TABLE IF NOT EXISTS relationship_node (
+    node BLOB NOT NULL,
+    position INTEGER NOT NULL,
+    relationship INTEGER NOT NULL,
+    PRIMARY KEY (node, position, relationship)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS relationship_node_by_relationship ON relationship_node (relationship);
+CREATE TABLE IF NOT EXISTS property_index (
+    label TEXT NOT NULL,
+    key TEXT NOT NULL,
+    ordered INTEGER NOT NULL,
+    is_unique INTEGER NOT NULL,
+    PRIMARY KEY (label, key)
+);
+CREATE TABLE IF NOT EXISTS node_property (
+    label TEXT NOT NULL,
+    key TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    value NOT NULL,
+    node INTEGER NOT NULL,
+    PRIMARY KEY (label, key, rank, value, node)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS node_property_by_node ON node_property (node);
+"""
+
+_NODE_ID = "(SELECT id FROM node WHERE key = ?)"
+_RELATIONSHIP_ID = "(SELECT id FROM relationship WHERE key = ?)"
+
+
+if utf8_types:
+
+    # Python 2: SQLite reads native strings as text, so binary data is
+    # bound as buffers, and all text as Unicode.
+    _blob = buffer
+
+    class _Connection(sqlite3.Connection):
+
+        @staticmethod
+        def _parameters(parameters):
+            return [ustr(value) if isinstance(value, str) else value for value in parameters]
+
+        def execute(self, sql, parameters=()):
+            return sqlite3.Connection.execute(self, sql, self._parameters(parameters))
+
+        def executemany(self, sql, seq_of_parameters):
+            return sqlite3.Connection.executemany(self, sql, map(self._parameters, seq_of_parameters))
+
+else:
+
+    _blob = bytes
+    _Connection = sqlite3.Connection
+
+
+def _packed(value):
+    data = bytearray()
+    pack(value, data)
+    return _blob(data)
+
+
+def _sql_index_value(value):
+    # Convert an index value to a (rank, value) pair that SQLite orders
+    # in the same way within each rank. Lists and other values are held
+    # in encoded form, which supports equality but not ordering.
+    rank, value = value
+    if rank == 3:
+        return rank, int(value)
+    elif rank == 5:
+        return rank, 0
+    elif rank == 2:
+        return rank, _blob(value)
+    elif rank in (1, 4):
+        return rank, value
+    else:
+        return rank, _packed(value)
+
+
+class _Cache(object):
+    # A bounded mapping that discards the least recently used entries.
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        try:
+            value = self._entries.pop(key)
+        except (KeyError, TypeError):
+            return None
+        self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        if len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        try:
+            self._entries.pop(key, None)
+        except TypeError:
+            pass
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SQLiteGraphStore(GraphStore):
+    """ Mutable graph store held in a SQLite database.
+
+    The store is kept in the file `database`, or in memory by default.
+    Opening a database that already holds a store resumes it. Node and
+    relationship keys, relationship types and property values are held
+    in the compact binary encoding of
+    :func:`cypy.graph.persistence.pack`, so relationship types held as
+    classes are recovered as described for
+    :class:`cypy.graph.persistence.Unpacker`.
+
+    Up to `cache_size` node entries and as many relationship entries
+    are kept in memory once read. Entries are reactive, as for a
+    :class:`cypy.graph.store.MutableGraphStore`: changes to the labels
+    and properties that they hold are written through to the database.
+
+    Each operation runs in a single database transaction. Use
+    :meth:`.batch` to run several operations in one transaction, which
+    is much faster for many small operations. Property indexes and
+    uniqueness constraints are held as database indexes over a table
+    of property values. Every property index can serve range and prefix
+    queries, although only those created as ordered are reported as such.
+    Ordering of list values is by encoding rather than by element.
+    """
+
+    default_cache_size = 4096
+
+    def __init__(self, graph_store=None, database=":memory:", cache_size=None, relationship_types=None):
+        self._lock = RLock()
+        self._connection = sqlite3.connect(database, isolation_level=None, check_same_thread=False,
+                                           factory=_Connection)
+        self._connection.executescript(_SCHEMA)
+        self._depth = 0
+        self._unpacker = Unpacker(relationship_types)
+        cache_size = self.default_cache_size if cache_size is None else cache_size
+        self._node_cache = _Cache(cache_size)
+        self._relationship_cache = _Cache(cache_size)
+        self._indexes = {}
+        self._unique_node_properties = set()
+        for n_label, p_key, ordered, unique in self._query("SELECT label, key, ordered, is_unique "
+                                                           "FROM property_index"):
+            self._indexes[(n_label, p_key)] = bool(ordered)
+            if unique:
+                self._unique_node_properties.add((n_label, p_key))
+        self._nodes = _NodeView(self)
+        self._relationships = _RelationshipView(self)
+        self._nodes_by_label = _LabelView(self)
+        self._relationships_by_type = _TypeView(self)
+        self._relationships_by_node = _AdjacencyView(self)
+        self._nodes_by_property = _PropertyIndexView(self)
+        self._nodes_by_property_order = _PropertyOrderView(self)
+        if graph_store is not None:
+            self.update(graph_store)
+
+    def is_mutable(self):
+        return True
+
+    def close(self):
+        """ Close the database connection. The store must not be used
+        afterwards.
+        """
+        with self._lock:
+            self._connection.close()
+
+    # Database access
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _unpack(self, data):
+        value, _ = self._unpacker.unpack(bytearray(data))
+        return value
+
+    @contextmanager
+    def batch(self):
+        """ Return a context manager that runs all operations within it
+        in a single database transaction. If an exception is raised,
+        all of those operations are rolled back. Batches may be nested,
+        in which case only the outermost has any effect.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self._connection.execute("BEGIN")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._connection.execute("ROLLBACK")
+                    self._node_cache.clear()
+                    self._relationship_cache.clear()
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._connection.execute("COMMIT")
+
+    # Entries
+
+    def _node(self, n_id):
+        # Return the entry for a node, or None if it does not exist.
+        with self._lock:
+            entry = self._node_cache.get(n_id)
+            if entry is not None:
+                return entry
+            try:
+                packed_key = _packed(n_id)
+            except TypeError:
+                return None
+            row = self._connection.execute("SELECT id, properties FROM node WHERE key = ?",
+                                           (packed_key,)).fetchone()
+            if row is None:
+                return None
+            n_row, properties = row
+            labels = [label for label, in self._connection.execute("SELECT label FROM node_label WHERE node = ?",
+                                                                   (n_row,))]
+            entry = self._node_entry(n_id, n_row, labels, self._unpack(properties))
+            self._node_cache.put(n_id, entry)
+            return entry
+
+    def _node_entry(self, n_id, n_row, labels, properties):
+        ready = []
+
+        def is_live():
+            row = self._connection.execute("SELECT id FROM node WHERE key = ?", (_packed(n_id),)).fetchone()
+            return row is not None and row[0] == n_row
+
+        def add_labels(*labels_):
+            if not ready or not labels_:
+                return
+            with self._lock:
+                if not is_live():
+                    return
+                try:
+                    self._check_unique_node(n_id, labels_, properties)
+                except ConstraintError:
+                    set.difference_update(labels, labels_)
+                    raise
+                with self.batch():
+                    self._connection.executemany("INSERT OR IGNORE INTO node_label (label, node) VALUES (?, ?)",
+                                                 [(label, n_row) for label in labels_])
+                    self._index_node(n_row, labels_, properties)
+                self._node_cache.put(n_id, entry)
+
+        def remove_labels(*labels_):
+            if not labels_:
+                return
+            with self._lock:
+                if not is_live():
+                    return
+                with self.batch():
+                    self._connection.executemany("DELETE FROM node_label WHERE label = ? AND node = ?",
+                                                 [(label, n_row) for label in labels_])
+                    self._connection.executemany("DELETE FROM node_property WHERE label = ? AND node = ?",
+                                                 [(label, n_row) for label in labels_])
+                self._node_cache.put(n_id, entry)
+
+        def set_property(p_key, old_value, new_value):
+            if not is_live():
+                return
+            if new_value is not None and self._unique_node_properties:
+                for n_label in labels:
+                    self._check_unique_value(n_id, n_label, p_key, new_value)
+            updated = dict(properties)
+            if new_value is None:
+                del updated[p_key]
+            else:
+                updated[p_key] = new_value
+            with self.batch():
+                self._connection.execute("UPDATE node SET properties = ? WHERE id = ?", (_packed(updated), n_row))
+                pairs = [(n_label, p_key) for n_label in labels if (n_label, p_key) in self._indexes]
+                self._connection.executemany("DELETE FROM node_property WHERE label = ? AND key = ? AND node = ?",
+                                             [pair + (n_row,) for pair in pairs])
+                if new_value is not None:
+                    self._connection.executemany(
+                        "INSERT INTO node_property (label, key, rank, value, node) VALUES (?, ?, ?, ?, ?)",
+                        [pair + _sql_index_value(index_value(new_value)) + (n_row,) for pair in pairs])
+            self._node_cache.put(n_id, entry)
+
+        labels = ReactiveSet(labels, on_add=add_labels, on_remove=remove_labels)
+        properties = ReactivePropertyDict(properties, on_set=set_property, lock=self._lock)
+        entry = NodeEntry(labels, properties)
+        ready.append(True)
+        return entry
+
+    def _relationship(self, r_id):
+        # Return the entry for a relationship, or None if it does not exist.
+        with self._lock:
+            entry = self._relationship_cache.get(r_id)
+            if entry is not None:
+                return entry
+            try:
+                packed_key = _packed(r_id)
+            except TypeError:
+                return None
+            row = self._connection.execute("SELECT id, type, nodes, properties FROM relationship WHERE key = ?",
+                                           (packed_key,)).fetchone()
+            if row is None:
+                return None
+            r_row, r_type, n_ids, properties = row
+            entry = self._relationship_entry(r_id, r_row, self._unpack(r_type), self._unpack(n_ids),
+                                             self._unpack(properties))
+            self._relationship_cache.put(r_id, entry)
+            return entry
+
+    def _relationship_entry(self, r_id, r_row, r_type, n_ids, properties):
+
+        def set_property(p_key, old_value, new_value):
+            row = self._connection.execute("SELECT id FROM relationship WHERE key = ?", (_packed(r_id),)).fetchone()
+            if row is None or row[0] != r_row:
+                return
+            updated = dict(properties)
+            if new_value is None:
+                del updated[p_key]
+            else:
+                updated[p_key] = new_value
+            with self.batch():
+                self._connection.execute("UPDATE relationship SET properties = ? WHERE id = ?",
+                                         (_packed(updated), r_row))
+            self._relationship_cache.put(r_id, entry)
+
+        properties = ReactivePropertyDict(properties, on_set=set_property, lock=self._lock)
+        entry = RelationshipEntry(r_type, tuple(n_ids), properties)
+        return entry
+
+    # Indexes and constraints
+
+    def _index_node(self, n_row, labels, properties):
+        rows = []
+        for n_label in labels:
+            for (i_label, p_key) in self._indexes:
+                if i_label == n_label:
+                    value = properties.get(p_key)
+                    if value is not None:
+                        rows.append((n_label, p_key) + _sql_index_value(index_value(value)) + (n_row,))
+        self._connection.executemany("INSERT OR IGNORE INTO node_property (label, key, rank, value, node) "
+                                     "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def _indexed_nodes(self, n_label, p_key, value):
+        # Return the keys of all nodes in a property index with an
+        # index value equal to `value`.
+        rank, value = _sql_index_value(value)
+        if rank == 5:
+            return []
+        return [self._unpack(key) for key, in self._query(
+            "SELECT n.key FROM node_property p JOIN node n ON n.id = p.node "
+            "WHERE p.label = ? AND p.key = ? AND p.rank = ? AND p.value = ?", (n_label, p_key, rank, value))]
+
+    def _scan_label(self, n_label):
+        # Return (key, properties) for every node with a label.
+        return [(self._unpack(key), self._unpack(properties)) for key, properties in self._query(
+            "SELECT n.key, n.properties FROM node_label l JOIN node n ON n.id = l.node WHERE l.label = ?",
+            (n_label,))]
+
+    def _build_node_index(self, n_label, p_key):
+        data = {}
+        for n_id, properties in self._scan_label(n_label):
+            value = properties.get(p_key)
+            if value is not None:
+                data.setdefault(index_value(value), set()).add(n_id)
+        return data
+
+    def _check_unique_value(self, n_id, n_label, p_key, value, replaced=()):
+        if (n_label, p_key) in self._unique_node_properties:
+            for holder in self._indexed_nodes(n_label, p_key, index_value(value)):
+                if holder != n_id and holder not in replaced:
+                    raise ConstraintError("Node with label {!r} and property {!r} = {!r} "
+                                          "already exists".format(n_label, p_key, value))
+
+    def _check_unique_node(self, n_id, labels, properties):
+        for n_label, p_key in self._unique_node_properties:
+            if n_label in labels:
+                value = properties.get(p_key)
+                if value is not None:
+                    self._check_unique_value(n_id, n_label, p_key, value)
+
+    def _check_unique_nodes(self, nodes, replaced=()):
+        # Check a batch of (key, labels, properties) triples, each of
+        # which adds a new node or replaces an existing node.
+        if not self._unique_node_properties:
+            return
+        replaced = set(replaced)
+        replaced.update(n_id for n_id, _, _ in nodes)
+        seen = {}
+        for n_id, labels, properties in nodes:
+            for n_label, p_key in self._unique_node_properties:
+                if n_label in labels:
+                    value = properties.get(p_key)
+                    if value is None:
+                        continue
+                    self._check_unique_value(n_id, n_label, p_key, value, replaced)
+                    if seen.setdefault((n_label, p_key, index_value(value)), n_id) != n_id:
+                        raise ConstraintError("Node with label {!r} and property {!r} = {!r} "
+                                              "is duplicated".format(n_label, p_key, value))
+
+    def node_indexes(self):
+        return frozenset(self._indexes)
+
+    def ordered_node_indexes(self):
+        return frozenset(pair for pair, ordered in self._indexes.items() if ordered)
+
+    def create_index(self, n_label, p_key, ordered=False):
+        """ Create a property index, as for
+        :meth:`cypy.graph.store.MutableGraphStore.create_index`.
+        """
+        pair = (n_label, p_key)
+        with self.batch():
+            if pair in self._indexes:
+                if ordered and not self._indexes[pair]:
+                    self._connection.execute("UPDATE property_index SET ordered = 1 WHERE label = ? AND key = ?",
+                                             pair)
+                    self._indexes[pair] = True
+                return
+            self._connection.execute("INSERT INTO property_index (label, key, ordered, is_unique) "
+                                     "VALUES (?, ?, ?, 0)", (n_label, p_key, int(bool(ordered))))
+            rows = []
+            for n_id, properties in self._scan_label(n_label):
+                value = properties.get(p_key)
+                if value is not None:
+                    rows.append(pair + _sql_index_value(index_value(value)) + (_packed(n_id),))
+            self._connection.executemany("INSERT INTO node_property (label, key, rank, value, node) "
+                                         "VALUES (?, ?, ?, ?, " + _NODE_ID + ")", rows)
+            self._indexes[pair] = bool(ordered)
+
+    def drop_index(self, n_label, p_key):
+        """ Drop a property index, as for
+        :meth:`cypy.graph.store.MutableGraphStore.drop_index`.
+
+        :raises ConstraintError: if the index backs a uniqueness constraint
+        """
+        pair = (n_label, p_key)
+        with self.batch():
+            if pair in self._unique_node_properties:
+                raise ConstraintError("Index on :{}({}) backs a uniqueness constraint".format(n_label, p_key))
+            if pair in self._indexes:
+                self._connection.execute("DELETE FROM property_index WHERE label = ? AND key = ?", pair)
+                self._connection.execute("DELETE FROM node_property WHERE label = ? AND key = ?", pair)
+                del self._indexes[pair]
+
+    def uniqueness_constraints(self):
+        return frozenset(self._unique_node_properties)
+
+    def create_uniqueness_constraint(self, n_label, p_key):
+        """ Create a uniqueness constraint, as for
+        :meth:`cypy.graph.store.MutableGraphStore.create_uniqueness_constraint`.
+
+        :raises ConstraintError: if existing nodes already break the constraint
+        """
+        pair = (n_label, p_key)
+        with self.batch():
+            if pair in self._unique_node_properties:
+                return
+            for value, n_ids in self._build_node_index(n_label, p_key).items():
+                if len(n_ids) > 1:
+                    raise ConstraintError("Nodes with label {!r} and property {!r} = {!r} "
+                                          "already exist".format(n_label, p_key, value[1]))
+            self.create_index(n_label, p_key)
+            self._connection.execute("UPDATE property_index SET is_unique = 1 WHERE label = ? AND key = ?", pair)
+            self._unique_node_properties.add(pair)
+
+    def drop_uniqueness_constraint(self, n_label, p_key):
+        """ Drop a uniqueness constraint, leaving its index in place.
+        """
+        pair = (n_label, p_key)
+        with self.batch():
+            if pair in self._unique_node_properties:
+                self._connection.execute("UPDATE property_index SET is_unique = 0 WHERE label = ? AND key = ?",
+                                         pair)
+                self._unique_node_properties.remove(pair)
+
+    # Reads
+
+    def node_count(self, *n_labels):
+        if not n_labels:
+            return self._query("SELECT COUNT(*) FROM node")[0][0]
+        elif len(n_labels) == 1:
+            return self._query("SELECT COUNT(*) FROM node_label WHERE label = ?", n_labels)[0][0]
+        else:
+            return sum(1 for _ in self.nodes(*n_labels))
+
+    def _node_index_is_complete(self, n_label, p_key):
+        if (n_label, p_key) not in self._indexes:
+            return super(SQLiteGraphStore, self)._node_index_is_complete(n_label, p_key)
+        indexed = self._query("SELECT COUNT(*) FROM node_property WHERE label = ? AND key = ?", (n_label, p_key))
+        return indexed[0][0] >= self.node_count(n_label)
+
+    def nodes(self, *n_labels):
+        if n_labels:
+            n_labels = list(set(n_labels))
+            rows = self._query("SELECT key FROM node WHERE id IN (" +
+                               " INTERSECT ".join(["SELECT node FROM node_label WHERE label = ?"] * len(n_labels)) +
+                               ")", n_labels)
+        else:
+            rows = self._query("SELECT key FROM node")
+        return iter([self._unpack(key) for key, in rows])
+
+    def nodes_by_property(self, n_label, p_key, value):
+        if value is None:
+            return iter(())
+        key = index_value(value)
+        if (n_label, p_key) in self._indexes:
+            return iter(self._indexed_nodes(n_label, p_key, key))
+        return iter([n_id for n_id, properties in self._scan_label(n_label) if index_value(properties.get(p_key)) == key])
+
+    def nodes_by_property_range(self, n_label, p_key, lower=None, upper=None,
+                                include_lower=True, include_upper=True, descending=False):
+        if (n_label, p_key) not in self._indexes:
+            return super(SQLiteGraphStore, self).nodes_by_property_range(
+                n_label, p_key, lower, upper, include_lower, include_upper, descending)
+        conditions = ["p.label = ?", "p.key = ?"]
+        parameters = [n_label, p_key]
+        minimum = None if lower is None else _sql_index_value(index_value(lower))
+        maximum = None if upper is None else _sql_index_value(index_value(upper))
+        if minimum is not None and maximum is not None and minimum[0] != maximum[0]:
+            return iter(())
+        for bound, operator in ((minimum, ">=" if include_lower else ">"),
+                                (maximum, "<=" if include_upper else "<")):
+            if bound is not None:
+                conditions.append("p.rank = ? AND p.value {} ?".format(operator))
+                parameters.extend(bound)
+        order = " DESC" if descending else ""
+        rows = self._query("SELECT n.key FROM node_property p JOIN node n ON n.id = p.node WHERE " +
+                           " AND ".join(conditions) +
+                           " ORDER BY p.rank{0}, p.value{0}, p.node{0}".format(order), parameters)
+        return iter([self._unpack(key) for key, in rows])
+
+    def nodes_by_property_prefix(self, n_label, p_key, prefix):
+        if index_value(prefix)[0] != 1:
+            raise TypeError("Prefix must be a string")
+        if (n_label, p_key) not in self._indexes:
+            return super(SQLiteGraphStore, self).nodes_by_property_prefix(n_label, p_key, prefix)
+        rows = self._query("SELECT p.value, n.key FROM node_property p JOIN node n ON n.id = p.node "
+                           "WHERE p.label = ? AND p.key = ? AND p.rank = 1 AND p.value >= ? "
+                           "ORDER BY p.value, p.node", (n_label, p_key, prefix))
+        n_ids = []
+        for value, key in rows:
+            if not value.startswith(prefix):
+                break
+            n_ids.append(self._unpack(key))
+        return iter(n_ids)
+
+    def _relationship_query(self, select, r_type, n_ids):
+        conditions = []
+        parameters = []
+        if r_type is not None:
+            try:
+                parameters.append(_packed(r_type))
+            except TypeError:
+                return None
+            conditions.append("type = ?")
+        if not n_ids or (hasattr(n_ids, "__iter__") and all(n_id is None for n_id in n_ids)):
+            pass
+        elif isinstance(n_ids, Sequence):
+            for n_index, n_id in enumerate_nodes(n_ids):
+                if n_id is not None:
+                    conditions.append("id IN (SELECT relationship FROM relationship_node "
+                                      "WHERE node = ? AND position = ?)")
+                    parameters.extend([_packed(n_id), n_index])
+        elif isinstance(n_ids, Set):
+            for n_id in n_ids:
+                if n_id is not None:
+                    conditions.append("id IN (SELECT relationship FROM relationship_node WHERE node = ?)")
+                    parameters.append(_packed(n_id))
+        else:
+            raise TypeError("Nodes must be supplied as a Sequence or a Set")
+        sql = "SELECT {} FROM relationship".format(select)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self._query(sql, parameters)
+
+    def relationship_count(self, r_type=None, n_ids=()):
+        rows = self._relationship_query("COUNT(*)", r_type, n_ids)
+        return 0 if rows is None else rows[0][0]
+
+    def relationships(self, r_type=None, n_ids=()):
+        rows = self._relationship_query("key", r_type, n_ids)
+        return iter(()) if rows is None else iter([self._unpack(key) for key, in rows])
+
+    # Writes
+
+    def _put_nodes(self, nodes, new=False):
+        # Put a batch of (key, labels, properties) triples with distinct
+        # keys, replacing any existing nodes with those keys unless all
+        # are known to be `new`.
+        nodes = [(_packed(n_id), n_id, labels, properties) for n_id, labels, properties in nodes]
+        execute = self._connection.executemany
+        with self.batch():
+            if not new:
+                keys = [(packed_key,) for packed_key, _, _, _ in nodes]
+                execute("DELETE FROM node_label WHERE node = " + _NODE_ID, keys)
+                execute("DELETE FROM node_property WHERE node = " + _NODE_ID, keys)
+                execute("DELETE FROM node WHERE key = ?", keys)
+                for _, n_id, _, _ in nodes:
+                    self._node_cache.discard(n_id)
+            execute("INSERT INTO node (key, properties) VALUES (?, ?)",
+                    [(packed_key, _packed(dict(properties))) for packed_key, _, _, properties in nodes])
+            execute("INSERT INTO node_label (label, node) VALUES (?, " + _NODE_ID + ")",
+                    [(label, packed_key) for packed_key, _, labels, _ in nodes for label in labels])
+            if self._indexes:
+                rows = []
+                for packed_key, _, labels, properties in nodes:
+                    for n_label, p_key in self._indexes:
+                        if n_label in labels:
+                            value = properties.get(p_key)
+                            if value is not None:
+                                rows.append((n_label, p_key) + _sql_index_value(index_value(value)) +
+                                            (packed_key,))
+                execute("INSERT INTO node_property (label, key, rank, value, node) "
+                        "VALUES (?, ?, ?, ?, " + _NODE_ID + ")", rows)
+
+    def _put_relationships(self, relationships, new=False):
+        # Put a batch of (key, type, node keys, properties) tuples with
+        # distinct keys, replacing any existing relationships with those
+        # keys unless all are known to be `new`.
+        relationships = [(_packed(r_id), r_id, r_type, tuple(n_ids), properties)
+                         for r_id, r_type, n_ids, properties in relationships]
+        execute = self._connection.executemany
+        with self.batch():
+            if not new:
+                self._remove_relationships([r_id for _, r_id, _, _, _ in relationships])
+            execute("INSERT INTO relationship (key, type, nodes, properties) VALUES (?, ?, ?, ?)",
+                    [(packed_key, _packed(r_type), _packed(n_ids), _packed(dict(properties)))
+                     for packed_key, _, r_type, n_ids, properties in relationships])
+            execute("INSERT OR IGNORE INTO relationship_node (node, position, relationship) "
+                    "VALUES (?, ?, " + _RELATIONSHIP_ID + ")",
+                    [(_packed(n_id), n_index, packed_key)
+                     for packed_key, _, _, n_ids, _ in relationships
+                     for n_index, n_id in enumerate_nodes(n_ids)])
+
+    def _remove_relationships(self, r_ids):
+        keys = []
+        for r_id in r_ids:
+            try:
+                keys.append((_packed(r_id),))
+            except TypeError:
+                continue
+            self._relationship_cache.discard(r_id)
+        with self.batch():
+            self._connection.executemany("DELETE FROM relationship_node WHERE relationship = " + _RELATIONSHIP_ID,
+                                         keys)
+            self._connection.executemany("DELETE FROM relationship WHERE key = ?", keys)
+
+    def update(self, graph_store):
+        if not isinstance(graph_store, GraphStore):
+            raise TypeError("Argument is not a graph store")
+        nodes = [(n_id, frozenset(labels), PropertyDict(properties))
+                 for n_id, (labels, properties) in graph_store._nodes.items()]
+        relationships = [(r_id, r_type, n_ids, PropertyDict(properties))
+                         for r_id, (r_type, n_ids, properties) in graph_store._relationships.items()]
+        with self.batch():
+            self._check_unique_nodes(nodes)
+            for n_label, p_key in graph_store._nodes_by_property:
+                self.create_index(n_label, p_key, (n_label, p_key) in graph_store._nodes_by_property_order)
+            self._put_nodes(nodes)
+            self._put_relationships(relationships)
+
+    def snapshot(self):
+        """ Return a :class:`.FrozenGraphStore` holding a copy of the
+        current contents of this store, including its indexes.
+        """
+        with self._lock:
+            return FrozenGraphStore(self)
+
+    def add_nodes(self, entries):
+        nodes = [(self.new_node_key(), frozenset(labels), PropertyDict(properties)) for labels, properties in entries]
+        with self.batch():
+            self._check_unique_nodes(nodes)
+            self._put_nodes(nodes, new=True)
+        return [n_id for n_id, _, _ in nodes]
+
+    def _match_node(self, n_label, key_properties, lookups):
+        if not key_properties:
+            for key, in self._query("SELECT n.key FROM node_label l JOIN node n ON n.id = l.node "
+                                    "WHERE l.label = ? LIMIT 1", (n_label,)):
+                return self._unpack(key)
+            return None
+        key_values = {key: index_value(value) for key, value in key_properties.items()}
+        for p_key in sorted(key_properties):
+            if (n_label, p_key) in self._indexes:
+                n_ids = self._indexed_nodes(n_label, p_key, key_values[p_key])
+                break
+        else:
+            p_key = min(key_properties)
+            n_ids = self._merge_lookup(n_label, p_key, lookups).get(key_values[p_key], ())
+        for n_id in n_ids:
+            properties = self._node(n_id).properties
+            if all(index_value(properties.get(key)) == value for key, value in key_values.items()):
+                return n_id
+        return None
+
+    def merge_nodes(self, entries):
+        """ Match or create nodes, as for
+        :meth:`cypy.graph.store.MutableGraphStore.merge_nodes`, except
+        that the batch is atomic: if any entry fails, none is applied.
+        """
+        entries = self._merge_node_entries(entries)
+        n_ids = []
+        lookups = {}
+        with self.batch():
+            for n_label, key_properties, properties in entries:
+                n_id = self._match_node(n_label, key_properties, lookups)
+                if n_id is None:
+                    n_id = self.new_node_key()
+                    node_properties = PropertyDict(key_properties)
+                    node_properties.update(properties)
+                    node = (n_id, frozenset([n_label]), node_properties)
+                    self._check_unique_nodes([node])
+                    self._put_nodes([node], new=True)
+                    if lookups:
+                        self._track_merge(lookups, n_id, {n_label}, {}, node_properties)
+                else:
+                    node = self._node(n_id)
+                    if lookups:
+                        old_properties = {p_key: node.properties.get(p_key) for _, p_key in lookups}
+                        node.properties.update(properties)
+                        self._track_merge(lookups, n_id, node.labels, old_properties, node.properties)
+                    else:
+                        node.properties.update(properties)
+                n_ids.append(n_id)
+        return n_ids
+
+    def remove_nodes(self, n_ids):
+        with self.batch():
+            for n_id in list(n_ids):
+                try:
+                    packed_key = _packed(n_id)
+                except TypeError:
+                    continue
+                self._remove_relationships([self._unpack(key) for key, in self._connection.execute(
+                    "SELECT r.key FROM relationship_node rn JOIN relationship r ON r.id = rn.relationship "
+                    "WHERE rn.node = ?", (packed_key,)).fetchall()])
+                self._connection.execute("DELETE FROM node_label WHERE node = " + _NODE_ID, (packed_key,))
+                self._connection.execute("DELETE FROM node_property WHERE node = " + _NODE_ID, (packed_key,))
+                self._connection.execute("DELETE FROM node WHERE key = ?", (packed_key,))
+                self._node_cache.discard(n_id)
+
+    def add_relationships(self, entries):
+        relationships = [(self.new_relationship_key(), r_type, n_ids, PropertyDict(properties))
+                         for r_type, n_ids, properties in entries]
+        with self.batch():
+            self._put_relationships(relationships, new=True)
+        return [r_id for r_id, _, _, _ in relationships]
+
+    def merge_relationships(self, entries):
+        """ Match or create relationships, as for
+        :meth:`cypy.graph.store.MutableGraphStore.merge_relationships`.
+        """
+        r_ids = []
+        with self.batch():
+            for r_type, n_ids, r_properties in entries:
+                n_ids = tuple(n_ids)
+                for r_id in self.relationships(r_type, n_ids):
+                    relationship = self._relationship(r_id)
+                    if relationship.nodes == n_ids:
+                        relationship.properties.update(r_properties)
+                        break
+                else:
+                    r_id = self.new_relationship_key()
+                    self._put_relationships([(r_id, r_type, n_ids, PropertyDict(r_properties))], new=True)
+                r_ids.append(r_id)
+        return r_ids
+
+    def remove_relationships(self, r_ids):
+        self._remove_relationships(list(r_ids))
+
+
+class _NodeView(Mapping):
+    # Node entries by key.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+
+    def __len__(self):
+        return self._graph_store.node_count()
+
+    def __iter__(self):
+        return self._graph_store.nodes()
+
+    def __contains__(self, n_id):
+        return self._graph_store._node(n_id) is not None
+
+    def __getitem__(self, n_id):
+        entry = self._graph_store._node(n_id)
+        if entry is None:
+            raise KeyError(n_id)
+        return entry
+
+
+class _RelationshipView(Mapping):
+    # Relationship entries by key.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+
+    def __len__(self):
+        return self._graph_store.relationship_count()
+
+    def __iter__(self):
+        return self._graph_store.relationships()
+
+    def __contains__(self, r_id):
+        return self._graph_store._relationship(r_id) is not None
+
+    def __getitem__(self, r_id):
+        entry = self._graph_store._relationship(r_id)
+        if entry is None:
+            raise KeyError(r_id)
+        return entry
+
+
+class _LabelView(Mapping):
+    # Sets of node keys by label.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+
+    def _labels(self):
+        return [label for label, in self._graph_store._query("SELECT DISTINCT label FROM node_label")]
+
+    def __len__(self):
+        return len(self._labels())
+
+    def __iter__(self):
+        return iter(self._labels())
+
+    def __getitem__(self, n_label):
+        n_ids = frozenset(self._graph_store.nodes(n_label))
+        if not n_ids:
+            raise KeyError(n_label)
+        return n_ids
+
+
+class _TypeView(Mapping):
+    # Sets of relationship keys by type.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+
+    def _types(self):
+        graph_store = self._graph_store
+        return [graph_store._unpack(r_type) for r_type, in graph_store._query("SELECT DISTINCT type "
+                                                                              "FROM relationship")]
+
+    def __len__(self):
+        return len(self._types())
+
+    def __iter__(self):
+        return iter(self._types())
+
+    def __getitem__(self, r_type):
+        r_ids = frozenset(self._graph_store.relationships(r_type))
+        if not r_ids:
+            raise KeyError(r_type)
+        return r_ids
+
+
+class _AdjacencyView(Mapping):
+    # Sets of (relationship key, index) pairs by node key.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+
+    def _nodes(self):
+        graph_store = self._graph_store
+        return [graph_store._unpack(n_id) for n_id, in graph_store._query("SELECT DISTINCT node "
+                                                                          "FROM relationship_node")]
+
+    def __len__(self):
+        return len(self._nodes())
+
+    def __iter__(self):
+        return iter(self._nodes())
+
+    def __getitem__(self, n_id):
+        graph_store = self._graph_store
+        try:
+            packed_key = _packed(n_id)
+        except TypeError:
+            raise KeyError(n_id)
+        pairs = frozenset((graph_store._unpack(r_id), n_index) for r_id, n_index in graph_store._query(
+            "SELECT r.key, rn.position FROM relationship_node rn JOIN relationship r ON r.id = rn.relationship "
+            "WHERE rn.node = ?", (packed_key,)))
+        if not pairs:
+            raise KeyError(n_id)
+        return pairs
+
+
+class _PropertyIndexView(Mapping):
+    # Property indexes by (label, property key) pair.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+
+    def __len__(self):
+        return len(self._graph_store._indexes)
+
+    def __iter__(self):
+        return iter(list(self._graph_store._indexes))
+
+    def __getitem__(self, pair):
+        if pair not in self._graph_store._indexes:
+            raise KeyError(pair)
+        return self._graph_store._build_node_index(*pair)
+
+
+class _PropertyOrderView(Mapping):
+    # Ordered index values by (label, property key) pair.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+
+    def _pairs(self):
+        return [pair for pair, ordered in self._graph_store._indexes.items() if ordered]
+
+    def __len__(self):
+        return len(self._pairs())
+
+    def __iter__(self):
+        return iter(self._pairs())
+
+    def __getitem__(self, pair):
+        if not self._graph_store._indexes.get(pair):
+            raise KeyError(pair)
+        return FrozenSortedSet(self._graph_store._build_node_index(*pair))
@@ -23,17 +23,149 @@ Low-level graph data storage classes.
 from collections import namedtuple, Sequence, Set
 from functools import reduce
 from operator import and_ as and_operator
-from threading import RLock
+from threading import Condition, Lock
 from uuid import UUID, uuid4
+from weakref import WeakValueDictionary
 
-from cypy.collections import ReactiveSet, iter_items
-from cypy.compat import atomic_types
+from cypy.collections import ReactiveSet, SortedSet, FrozenSortedSet, PersistentMap, PersistentSet, iter_items
+from cypy.compat import atomic_types, bytes_types, integer_types, unicode_types, utf8_types
 from cypy.data import Value, Record
+from cypy.graph.changes import ChangeLog, NODE_CREATED, NODE_REMOVED, NODE_LABELS_ADDED, NODE_LABELS_REMOVED, \
+    NODE_PROPERTY_SET, RELATIONSHIP_CREATED, RELATIONSHIP_REMOVED, RELATIONSHIP_PROPERTY_SET, \
+    INDEX_CREATED, INDEX_DROPPED, CONSTRAINT_CREATED, CONSTRAINT_DROPPED
+
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident
 
 
 NodeEntry = namedtuple("NodeEntry", ["labels", "properties"])
 RelationshipEntry = namedtuple("RelationshipEntry", ["type", "nodes", "properties"])
 
+#: Changes to the labels and properties of a node, as reported by
+#: :meth:`.GraphStore.diff`. Properties set are held as a dictionary of
+#: new values and properties removed as a set of keys.
+NodeDelta = namedtuple("NodeDelta", ["labels_added", "labels_removed", "properties_set", "properties_removed"])
+
+#: Changes to the properties of a relationship, as reported by
+#: :meth:`.GraphStore.diff`.
+RelationshipDelta = namedtuple("RelationshipDelta", ["properties_set", "properties_removed"])
+
+#: The difference between two graph stores, as returned by
+#: :meth:`.GraphStore.diff`. Keys of entries added and removed are held
+#: in sets, and deltas for entries changed in dictionaries by key.
+GraphStoreDiff = namedtuple("GraphStoreDiff", ["nodes_added", "nodes_removed", "nodes_changed",
+                                               "relationships_added", "relationships_removed",
+                                               "relationships_changed"])
+
+
+class ConstraintError(ValueError):
+    """ Raised when a change to a graph store would violate a constraint.
+    """
+
+
+class ConcurrentModificationError(RuntimeError):
+    """ Raised when a graph store is changed while being iterated.
+    """
+
+
+class ReadWriteLock(object):
+    """ A reentrant lock that can be held either by any number of
+    readers or by a single writer.
+
+    Using the lock itself as a context manager acquires it for writing;
+    :meth:`.read` returns a context manager that acquires it for
+    reading. A writer may also acquire the lock for reading, but a
+    reader may not upgrade to writing. Waiting writers take priority
+    over new readers, so a steady stream of reads cannot starve them.
+
+    If an `on_release` callback is given, it is called each time the
+    write lock is fully released, after other threads can acquire it.
+    """
+
+    def __init__(self, on_release=None):
+        self._on_release = on_release
+        self._condition = Condition(Lock())
+        self._readers = {}
+        self._writer = None
+        self._writer_count = 0
+        self._writers_waiting = 0
+        self._reader = _ReadLock(self)
+
+    def __enter__(self):
+        self.acquire_write()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release_write()
+
+    def read(self):
+        """ Return a context manager that holds this lock for reading.
+        """
+        return self._reader
+
+    def acquire_read(self):
+        ident = get_ident()
+        with self._condition:
+            if self._writer == ident or ident in self._readers:
+                self._readers[ident] = self._readers.get(ident, 0) + 1
+                return
+            while self._writer is not None or self._writers_waiting:
+                self._condition.wait()
+            self._readers[ident] = 1
+
+    def release_read(self):
+        ident = get_ident()
+        with self._condition:
+            count = self._readers[ident] - 1
+            if count:
+                self._readers[ident] = count
+            else:
+                del self._readers[ident]
+                if not self._readers:
+                    self._condition.notify_all()
+
+    def acquire_write(self):
+        ident = get_ident()
+        with self._condition:
+            if self._writer == ident:
+                self._writer_count += 1
+                return
+            if ident in self._readers:
+                raise RuntimeError("Cannot acquire a write lock while holding a read lock")
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = ident
+            self._writer_count = 1
+
+    def release_write(self):
+        with self._condition:
+            self._writer_count -= 1
+            released = not self._writer_count
+            if released:
+                self._writer = None
+                self._condition.notify_all()
+        if released and self._on_release is not None:
+            self._on_release()
+
+
+class _ReadLock(object):
+
+    def __init__(self, lock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_read()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._lock.release_read()
+
 
 class PropertyValue(Value):
     """
@@ -167,6 +299,76 @@ class PropertyDict(dict):
             self[key] = value
 
 
+class ReactivePropertyDict(PropertyDict):
+    """ A :class:`.PropertyDict` that can trigger a callback for each
+    value changed.
+
+    The `on_set` callback is called with the key, the old value and the
+    new value immediately *before* the change is applied, so an exception
+    raised by the callback leaves the dictionary untouched. Removal of a
+    value is reported as a change to :const:`None`. Unlike
+    :class:`.ReactiveSet`, no callbacks are triggered for the initial
+    values. If a `lock` is supplied, it is held across both the callback
+    and the change.
+    """
+
+    def __init__(self, iterable=None, on_set=None, lock=None):
+        self._on_set = None
+        self._lock = None
+        PropertyDict.__init__(self, iterable)
+        self._on_set = on_set
+        self._lock = lock
+
+    def __setitem__(self, key, value):
+        if value is not None:
+            value = self.value_class.coerce(value)
+        if self._lock is None:
+            self._set(key, value)
+        else:
+            with self._lock:
+                self._set(key, value)
+
+    def _set(self, key, value):
+        old_value = dict.get(self, key)
+        if value is None and old_value is None:
+            return
+        if callable(self._on_set):
+            self._on_set(key, old_value, value)
+        if value is None:
+            dict.__delitem__(self, key)
+        else:
+            dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self[key] = None
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = dict.get(self, key)
+            self[key] = None
+            return value
+        elif default:
+            return default[0]
+        else:
+            raise KeyError(key)
+
+    def popitem(self):
+        for key in self:
+            return key, self.pop(key)
+        raise KeyError("popitem(): dictionary is empty")
+
+    def clear(self):
+        for key in list(self):
+            self[key] = None
+
+
 class GraphStructure(object):
     """ A graph data storage object that is backed by a :class:`.GraphStore`.
 
@@ -174,6 +376,8 @@ class GraphStructure(object):
     storage objects to interact via a common store format.
     """
 
+    __slots__ = ()
+
     _store = None
 
     def __graph_store__(self):
@@ -192,13 +396,15 @@ class GraphStructure(object):
         return hash(self.__graph_store__())
 
     def is_mutable(self):
-        return self._store.is_mutable()
+        return self.__graph_store__().is_mutable()
 
 
 class GraphStore(GraphStructure):
     """ Low-level container for graph data.
 
     Internally, this object consists of five stores: two primary and three secondary.
+    Secondary stores that are not supplied on construction are built
+    from the primary stores on first use.
     """
 
     # (a:Person {name: 'Alice'})-[r:KNOWS {since: 1999}]->(b:Person {name: 'Bob')
@@ -225,35 +431,65 @@ class GraphStore(GraphStructure):
     _relationships = None
 
     # Nodes indexed by label.
-    # This is a secondary store.
+    # This is a secondary store, built on first use (see __getattr__).
     #
     # _nodes_by_label = {
     #     <label>: {<node_key>, <node_key>, ...}
     #     "Person": {"a", "b"},
     # }
     #
-    _nodes_by_label = None
 
     # Relationships indexed by type.
-    # This is a secondary store.
+    # This is a secondary store, built on first use (see __getattr__).
     #
-    # {
+    # _relationships_by_type = {
     #     <type>: {<relationship_key>, <relationship_key>, ...},
     #     "KNOWS": {"r"},
     # }
     #
-    _relationships_by_type = None
 
     # Relationships indexed by node.
-    # This is a secondary store.
+    # This is a secondary store, built on first use (see __getattr__).
     #
-    # {
+    # _relationships_by_node = {
     #     <node_key>: {(<relationship_key>, <index>), (<relationship_key>, <index>), ...},
     #     "a": {("r", 0)},
     #     "b": {("r", -1)},
     # }
     #
-    _relationships_by_node = None
+
+    # Nodes indexed by label and property value.
+    # This is a secondary store, maintained only for those
+    # (label, property key) pairs for which an index has been declared.
+    # Values are held in the form returned by index_value.
+    #
+    # {
+    #     (<label>, <property_key>): {<value>: {<node_key>, <node_key>, ...}},
+    #     ("Person", "name"): {(1, "Alice"): {"a"}, (1, "Bob"): {"b"}},
+    # }
+    #
+    _nodes_by_property = None
+
+    # Distinct property values in order, for those (label, property key)
+    # pairs with an ordered index. Each ordered index is backed by an
+    # entry in _nodes_by_property for the same pair.
+    # This is a secondary store.
+    #
+    # {
+    #     (<label>, <property_key>): SortedSet([<value>, <value>, ...]),
+    #     ("Person", "age"): SortedSet([(4, 33), (4, 44)]),
+    # }
+    #
+    _nodes_by_property_order = None
+
+    # The content hash, covering every node, relationship, label and
+    # property, if known. Stores that do not maintain or cache the hash
+    # compute it in full on each call to __hash__.
+    _hash = None
+
+    # Entity views of this store, held weakly and keyed by (<class>, <key>),
+    # if the identity map has been enabled.
+    _views = None
 
     def __graph_store__(self):
         return self
@@ -275,32 +511,93 @@ class GraphStore(GraphStructure):
                  relationships=None,
                  nodes_by_label=None,
                  relationships_by_type=None,
-                 relationships_by_node=None):
-        self._nodes = nodes or {}
-        self._relationships = relationships or {}
-        if nodes_by_label is None:
-            self._build_nodes_by_label()
-        else:
+                 relationships_by_node=None,
+                 nodes_by_property=None,
+                 nodes_by_property_order=None):
+        self._nodes = {} if nodes is None else nodes
+        self._relationships = {} if relationships is None else relationships
+        # Secondary stores that are not supplied are left to be built
+        # on first use.
+        if nodes_by_label is not None:
             self._nodes_by_label = nodes_by_label
-        if relationships_by_type is None:
-            self._build_relationships_by_type()
-        else:
+        if relationships_by_type is not None:
             self._relationships_by_type = relationships_by_type
-        if relationships_by_node is None:
-            self._build_relationships_by_node()
-        else:
+        if relationships_by_node is not None:
             self._relationships_by_node = relationships_by_node
+        self._nodes_by_property = {} if nodes_by_property is None else nodes_by_property
+        self._nodes_by_property_order = {} if nodes_by_property_order is None else nodes_by_property_order
 
     def is_mutable(self):
         raise NotImplementedError()
 
+    def enable_identity_map(self):
+        """ Keep a weak identity map of the node and relationship views
+        of this store, so that while a view of an entry remains in use,
+        any further view of that entry with the same class is the same
+        object. This saves allocations when the same entries are
+        selected repeatedly.
+        """
+        if self._views is None:
+            self._views = WeakValueDictionary()
+
     def dump(self):
         n = [node_str(key, labels, properties) for key, (labels, properties) in self._nodes.items()]
         r = [relationship_str(key, type, n, properties) for key, (type, n, properties) in self._relationships.items()]
         return "{}\n{}".format("\n".join(n), "\n".join(r))
 
+    def diff(self, other):
+        """ Compare this store with `other`, which may be a graph store
+        of any kind, and return a :class:`.GraphStoreDiff` describing
+        the changes that would turn the contents of this store into
+        those of `other`. A relationship whose type or nodes differ is
+        reported as removed and added, rather than as changed.
+
+        Entries are matched by key, and entries that are identical
+        objects in both stores are skipped without comparison. Where
+        both stores are frozen, structure that they share is skipped
+        altogether, so that comparing a store with another derived from
+        it costs time in proportion to the difference between them.
+        Mutable stores should not be changed during the comparison.
+        """
+        if not isinstance(other, GraphStore):
+            raise TypeError("Argument is not a graph store")
+        nodes_added = set()
+        nodes_removed = set()
+        nodes_changed = {}
+        for n_id, old, new in _entry_differences(self._nodes, other._nodes):
+            if old is None:
+                nodes_added.add(n_id)
+            elif new is None:
+                nodes_removed.add(n_id)
+            else:
+                delta = _node_delta(old, new)
+                if delta is not None:
+                    nodes_changed[n_id] = delta
+        relationships_added = set()
+        relationships_removed = set()
+        relationships_changed = {}
+        for r_id, old, new in _entry_differences(self._relationships, other._relationships):
+            if old is None:
+                relationships_added.add(r_id)
+            elif new is None:
+                relationships_removed.add(r_id)
+            elif old.type != new.type or tuple(old.nodes) != tuple(new.nodes):
+                relationships_removed.add(r_id)
+                relationships_added.add(r_id)
+            else:
+                delta = _properties_delta(old.properties, new.properties)
+                if delta is not None:
+                    relationships_changed[r_id] = RelationshipDelta(*delta)
+        return GraphStoreDiff(frozenset(nodes_added), frozenset(nodes_removed), nodes_changed,
+                              frozenset(relationships_added), frozenset(relationships_removed),
+                              relationships_changed)
+
     def __eq__(self, other):
-        if isinstance(other, self.__class__):
+        if self is other:
+            return True
+        elif isinstance(other, self.__class__):
+            if self._hash is not None and other._hash is not None and self._hash != other._hash:
+                return False
             return self._nodes == other._nodes and self._relationships == other._relationships
         else:
             return False
@@ -309,32 +606,100 @@ class GraphStore(GraphStructure):
         return not self.__eq__(other)
 
     def __hash__(self):
+        if self._hash is None:
+            return self._content_hash()
+        return self._hash
+
+    def _content_hash(self):
+        # Compute the content hash in full.
         value = 0
-        for node in self._nodes:
-            value ^= hash(node)
-        for relationship in self._relationships:
-            value ^= hash(relationship)
+        for n_id, (labels, properties) in self._nodes.items():
+            value ^= _node_hash(n_id, labels, properties)
+        for r_id, (r_type, n_ids, properties) in self._relationships.items():
+            value ^= _relationship_hash(r_id, r_type, n_ids, properties)
         return value
 
+    def __getattr__(self, name):
+        # Called only for attributes not otherwise found, which includes
+        # any lazy secondary store not yet built. Each is built from the
+        # primary stores at most once, under a lock, and then held as an
+        # ordinary instance attribute, so later access costs nothing
+        # extra.
+        try:
+            build = _LAZY_STORES[name]
+        except KeyError:
+            raise AttributeError("{!r} object has no attribute {!r}".format(type(self).__name__, name))
+        with _lazy_store_lock:
+            try:
+                return self.__dict__[name]
+            except KeyError:
+                value = self.__dict__[name] = getattr(self, build)()
+                return value
+
+    def _built_stores(self):
+        # Return those lazy secondary stores that have already been
+        # built, as keyword arguments for __init__.
+        return {name[1:]: self.__dict__[name] for name in _LAZY_STORES if name in self.__dict__}
+
     def _build_nodes_by_label(self):
         data = {}
         for node, (labels, _) in self._nodes.items():
             for label in labels:
                 data.setdefault(label, set()).add(node)
-        self._nodes_by_label = data
+        return data
 
     def _build_relationships_by_type(self):
         data = {}
         for r_id, (r_type, _, _) in self._relationships.items():
             data.setdefault(r_type, set()).add(r_id)
-        self._relationships_by_type = data
+        return data
 
     def _build_relationships_by_node(self):
         data = {}
         for r_id, (_, n_ids, _) in self._relationships.items():
             for n_index, n_id in enumerate_nodes(n_ids):
                 data.setdefault(n_id, set()).add((r_id, n_index))
-        self._relationships_by_node = data
+        return data
+
+    def _build_node_index(self, n_label, p_key):
+        data = {}
+        for n_id in self._nodes_by_label.get(n_label, ()):
+            value = self._nodes[n_id].properties.get(p_key)
+            if value is not None:
+                data.setdefault(index_value(value), set()).add(n_id)
+        return data
+
+    @classmethod
+    def _merge_node_entries(cls, entries):
+        # Check and normalise a batch of (label, key properties,
+        # properties) entries for merging before any is applied.
+        checked = []
+        for n_label, key_properties, properties in entries:
+            if any(value is None for value in dict(key_properties).values()):
+                raise ValueError("Cannot merge node on a null property value")
+            checked.append((n_label, PropertyDict(key_properties), properties))
+        return checked
+
+    def _merge_lookup(self, n_label, p_key, lookups):
+        # Return a temporary property index for a pair that has no
+        # index, built once for a merge batch and kept up to date with
+        # the nodes that the batch creates and updates.
+        try:
+            return lookups[(n_label, p_key)]
+        except KeyError:
+            lookup = lookups[(n_label, p_key)] = self._build_node_index(n_label, p_key)
+            return lookup
+
+    @classmethod
+    def _track_merge(cls, lookups, n_id, labels, old_properties, new_properties):
+        for (n_label, p_key), lookup in lookups.items():
+            if n_label in labels:
+                old_value = old_properties.get(p_key)
+                if old_value is not None:
+                    discard_value(lookup, index_value(old_value), n_id)
+                new_value = new_properties.get(p_key)
+                if new_value is not None:
+                    lookup.setdefault(index_value(new_value), set()).add(n_id)
 
     def node_count(self, *n_labels):
         """ Count and return the number of nodes in this store.
@@ -389,6 +754,102 @@ class GraphStore(GraphStructure):
         else:
             return node_entry.properties
 
+    def node_indexes(self):
+        """ Return the set of (label, property key) pairs for which a
+        property index exists in this store.
+        """
+        return frozenset(self._nodes_by_property.keys())
+
+    def ordered_node_indexes(self):
+        """ Return the set of (label, property key) pairs for which an
+        ordered property index exists in this store.
+        """
+        return frozenset(self._nodes_by_property_order.keys())
+
+    def nodes_by_property(self, n_label, p_key, value):
+        """ Return an iterator over the keys of all nodes that carry the
+        label `n_label` and have a property `p_key` equal to `value`.
+
+        If an index exists for the (label, property key) pair, this is a
+        constant time lookup; otherwise all nodes with the label are
+        scanned.
+        """
+        if value is None:
+            return iter(())
+        key = index_value(value)
+        try:
+            index = self._nodes_by_property[(n_label, p_key)]
+        except KeyError:
+            return (n_id for n_id in self.nodes(n_label)
+                    if index_value(self._nodes[n_id].properties.get(p_key)) == key)
+        else:
+            return iter(index.get(key, ()))
+
+    def _ordered_node_index(self, n_label, p_key):
+        # Return the property index and ordered values for a pair,
+        # building temporary ones if no ordered index exists.
+        pair = (n_label, p_key)
+        try:
+            return self._nodes_by_property[pair], self._nodes_by_property_order[pair]
+        except KeyError:
+            index = self._build_node_index(n_label, p_key)
+            return index, FrozenSortedSet(index)
+
+    def _node_index_is_complete(self, n_label, p_key):
+        # Return true if every node with the label `n_label` has a value
+        # for `p_key`. Each distinct value is held by at least one node,
+        # so where values are all distinct, counting them is enough.
+        index, ordered = self._ordered_node_index(n_label, p_key)
+        count = self.node_count(n_label)
+        return len(ordered) >= count or sum(map(len, index.values())) >= count
+
+    def nodes_by_property_range(self, n_label, p_key, lower=None, upper=None,
+                                include_lower=True, include_upper=True, descending=False):
+        """ Return an iterator over the keys of all nodes that carry the
+        label `n_label` and have a property `p_key` between `lower` and
+        `upper`, in order of that property value.
+
+        As in Cypher, only values of the same type as the bounds are
+        compared, so a numeric range will never contain strings. If
+        neither bound is given, all nodes with a value for the property
+        are returned in Cypher ``ORDER BY`` order, so the first `k`
+        items of the iterator are the top `k` nodes.
+
+        If an ordered index exists for the (label, property key) pair,
+        no more nodes are visited than are returned; otherwise all nodes
+        with the label are scanned and sorted.
+        """
+        index, ordered = self._ordered_node_index(n_label, p_key)
+        minimum = None if lower is None else index_value(lower)
+        maximum = None if upper is None else index_value(upper)
+        inclusive = (include_lower, include_upper)
+        if minimum is not None and maximum is not None:
+            if minimum[0] != maximum[0]:
+                return iter(())
+        elif minimum is not None:
+            maximum = (minimum[0] + 1,)
+            inclusive = (include_lower, False)
+        elif maximum is not None:
+            minimum = (maximum[0],)
+            inclusive = (True, include_upper)
+        values = ordered.irange(minimum, maximum, inclusive, reverse=descending)
+        return (n_id for value in values for n_id in index[value])
+
+    def nodes_by_property_prefix(self, n_label, p_key, prefix):
+        """ Return an iterator over the keys of all nodes that carry the
+        label `n_label` and have a string property `p_key` that starts
+        with `prefix`, in order of that property value.
+        """
+        index, ordered = self._ordered_node_index(n_label, p_key)
+        minimum = index_value(prefix)
+        if minimum[0] != 1:
+            raise TypeError("Prefix must be a string")
+        for value in ordered.irange(minimum, (minimum[0] + 1,), (True, False)):
+            if not value[1].startswith(prefix):
+                break
+            for n_id in index[value]:
+                yield n_id
+
     def relationship_count(self, r_type=None, n_ids=()):
         """ Count relationships filtered by type and endpoint.
         """
@@ -459,6 +920,14 @@ class GraphStore(GraphStructure):
 
 
 class FrozenGraphStore(GraphStore):
+    """ Immutable graph store.
+
+    All five stores, and the sets within the secondary stores, are
+    persistent collections. A store derived from another, such as by
+    :meth:`.union`, therefore shares all unchanged structure with its
+    source, and costs time and memory in proportion to the difference
+    only.
+    """
 
     @classmethod
     def node_entry(cls, entry):
@@ -472,156 +941,1207 @@ class FrozenGraphStore(GraphStore):
 
     def __init__(self, graph_store=None):
         if graph_store is None:
-            super(FrozenGraphStore, self).__init__()
+            super(FrozenGraphStore, self).__init__(nodes=_EMPTY_MAP,
+                                                   relationships=_EMPTY_MAP,
+                                                   nodes_by_label=_EMPTY_MAP,
+                                                   relationships_by_type=_EMPTY_MAP,
+                                                   relationships_by_node=_EMPTY_MAP,
+                                                   nodes_by_property=_EMPTY_MAP,
+                                                   nodes_by_property_order=_EMPTY_MAP)
         elif isinstance(graph_store, FrozenGraphStore):
             super(FrozenGraphStore, self).__init__(nodes=graph_store._nodes,
                                                    relationships=graph_store._relationships,
-                                                   nodes_by_label=graph_store._nodes_by_label,
-                                                   relationships_by_type=graph_store._relationships_by_type,
-                                                   relationships_by_node=graph_store._relationships_by_node)
+                                                   nodes_by_property=graph_store._nodes_by_property,
+                                                   nodes_by_property_order=graph_store._nodes_by_property_order,
+                                                   **graph_store._built_stores())
+            self._hash = graph_store._hash
         elif isinstance(graph_store, GraphStore):
-            super(FrozenGraphStore, self).__init__()
-            self._nodes.update((key, self.node_entry(entry))
-                               for key, entry in graph_store._nodes.items())
-            self._nodes_by_label.update((label, frozenset(nodes))
-                                        for label, nodes in graph_store._nodes_by_label.items())
-            self._relationships.update((key, self.relationship_entry(entry))
-                                       for key, entry in graph_store._relationships.items())
-            self._relationships_by_type.update((type_, frozenset(relationships))
-                                               for type_, relationships in graph_store._relationships_by_type.items())
-            self._relationships_by_node.update((node, frozenset(relationships))
-                                               for node, relationships in graph_store._relationships_by_node.items())
+            super(FrozenGraphStore, self).__init__(
+                nodes=PersistentMap((key, self.node_entry(entry))
+                                    for key, entry in graph_store._nodes.items()),
+                relationships=PersistentMap((key, self.relationship_entry(entry))
+                                            for key, entry in graph_store._relationships.items()),
+                nodes_by_property=PersistentMap((pair, PersistentMap((value, frozenset(nodes))
+                                                                     for value, nodes in index.items()))
+                                                for pair, index in graph_store._nodes_by_property.items()),
+                nodes_by_property_order=PersistentMap((pair, FrozenSortedSet(values))
+                                                      for pair, values in graph_store._nodes_by_property_order.items()))
+            if isinstance(graph_store, MutableGraphStore):
+                self._hash = graph_store._hash
         else:
             raise TypeError("Argument is not a graph store")
 
+    @classmethod
+    def _from_entries(cls, nodes, relationships=()):
+        # Build a store directly from (key, entry) pairs, with entries
+        # already in frozen form and no property indexes.
+        graph_store = cls.__new__(cls)
+        GraphStore.__init__(graph_store,
+                            nodes=PersistentMap(nodes),
+                            relationships=PersistentMap(relationships),
+                            nodes_by_property=_EMPTY_MAP,
+                            nodes_by_property_order=_EMPTY_MAP)
+        return graph_store
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = self._content_hash()
+        return self._hash
+
+    def _build_nodes_by_label(self):
+        return PersistentMap((label, PersistentSet(n_ids))
+                             for label, n_ids in super(FrozenGraphStore, self)._build_nodes_by_label().items())
+
+    def _build_relationships_by_type(self):
+        return PersistentMap((r_type, PersistentSet(r_ids))
+                             for r_type, r_ids in super(FrozenGraphStore, self)._build_relationships_by_type().items())
+
+    def _build_relationships_by_node(self):
+        return PersistentMap((n_id, frozenset(r_ids))
+                             for n_id, r_ids in super(FrozenGraphStore, self)._build_relationships_by_node().items())
+
     def is_mutable(self):
         return False
 
+    def union(self, *graph_stores):
+        """ Return a new store containing all nodes, relationships and
+        property indexes from this store and from `graph_stores`. Where
+        a key occurs more than once, the entry from the last store in
+        which it occurs is kept.
+
+        The largest frozen store among those supplied is taken as the
+        starting point for the union, and the entries from the others
+        are added to it. The result shares all unchanged structure with
+        that store.
+        """
+        graph_stores = (self,) + graph_stores
+        for graph_store in graph_stores:
+            if not isinstance(graph_store, GraphStore):
+                raise TypeError("Argument is not a graph store")
+        bases = [i for i, graph_store in enumerate(graph_stores)
+                 if isinstance(graph_store, FrozenGraphStore) and isinstance(graph_store._nodes, PersistentMap)]
+        if not bases:
+            # None of the stores is built from persistent collections.
+            graph_stores = (FrozenGraphStore(),) + graph_stores
+            bases = [0]
+        base = max(bases, key=lambda i: len(graph_stores[i]._nodes) + len(graph_stores[i]._relationships))
+        # Build any lazy secondary stores of the base, so that the union
+        # shares them rather than building its own in full.
+        for name in _LAZY_STORES:
+            getattr(graph_stores[base], name)
+        editor = _FrozenGraphStoreEditor(graph_stores[base])
+        for graph_store in graph_stores:
+            for n_label, p_key in graph_store._nodes_by_property:
+                editor.create_index(n_label, p_key, (n_label, p_key) in graph_store._nodes_by_property_order)
+        for graph_store in graph_stores[base + 1:]:
+            editor.update(graph_store)
+        for graph_store in reversed(graph_stores[:base]):
+            editor.update(graph_store, replace=False)
+        return editor.build()
+
+
+_EMPTY_MAP = PersistentMap()
+_EMPTY_SET = PersistentSet()
+
+# Secondary stores built on first use, with the names of the methods
+# that build them.
+_LAZY_STORES = {
+    "_nodes_by_label": "_build_nodes_by_label",
+    "_relationships_by_type": "_build_relationships_by_type",
+    "_relationships_by_node": "_build_relationships_by_node",
+}
+
+_lazy_store_lock = Lock()
+
+
+class _SetMapEditor(object):
+    # Batched changes to a persistent map of sets, as used for the
+    # secondary stores of a FrozenGraphStore. The sets are either
+    # persistent sets or, where many small sets are expected, plain
+    # frozensets, which are cheaper to build but copied in full on
+    # change.
+
+    @classmethod
+    def lazy(cls, graph_store, name, persistent_sets=True):
+        # Return an editor for a lazy secondary store of a graph store,
+        # or None if that store has not been built.
+        try:
+            mapping = graph_store.__dict__[name]
+        except KeyError:
+            return None
+        else:
+            return cls(mapping, persistent_sets)
+
+    def __init__(self, mapping, persistent_sets=True):
+        self._mapping = mapping
+        self._persistent_sets = persistent_sets
+        self._sets = {}
+        self.keys_changed = False
+
+    def _set(self, key):
+        try:
+            return self._sets[key]
+        except KeyError:
+            if self._persistent_sets:
+                elements = self._mapping.get(key, _EMPTY_SET).evolver()
+            else:
+                elements = set(self._mapping.get(key, ()))
+            self._sets[key] = elements
+            return elements
+
+    def add(self, key, element):
+        elements = self._set(key)
+        if not elements:
+            self.keys_changed = True
+        elements.add(element)
+
+    def discard(self, key, element):
+        elements = self._set(key)
+        elements.discard(element)
+        if not elements:
+            self.keys_changed = True
+
+    def persistent(self):
+        if not self._sets:
+            return self._mapping
+        mapping = self._mapping.evolver()
+        for key, elements in self._sets.items():
+            if not elements:
+                mapping.discard(key)
+            elif self._persistent_sets:
+                mapping[key] = elements.persistent()
+            else:
+                mapping[key] = frozenset(elements)
+        return mapping.persistent()
+
+
+class _FrozenGraphStoreEditor(object):
+    # Batched changes to a FrozenGraphStore, used to build a new store
+    # that shares all unchanged structure with the original. Entries
+    # must already be in frozen form.
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+        self._nodes = graph_store._nodes.evolver()
+        self._relationships = graph_store._relationships.evolver()
+        # Lazy secondary stores are maintained only if already built
+        # for the original store, and are otherwise left to be built
+        # for the new store on first use.
+        self._nodes_by_label = _SetMapEditor.lazy(graph_store, "_nodes_by_label")
+        self._relationships_by_type = _SetMapEditor.lazy(graph_store, "_relationships_by_type")
+        self._relationships_by_node = _SetMapEditor.lazy(graph_store, "_relationships_by_node", persistent_sets=False)
+        self._nodes_by_property = {pair: _SetMapEditor(index, persistent_sets=False)
+                                   for pair, index in graph_store._nodes_by_property.items()}
+        self._ordered = set(graph_store._nodes_by_property_order)
+        # The content hash is maintained only if already known for the
+        # original store.
+        self._hash = graph_store._hash
+
+    def create_index(self, n_label, p_key, ordered=False):
+        # Indexes must be created before any entries are changed, as
+        # they are built from the original store.
+        pair = (n_label, p_key)
+        if pair not in self._nodes_by_property:
+            index = self._graph_store._build_node_index(n_label, p_key)
+            self._nodes_by_property[pair] = _SetMapEditor(PersistentMap(
+                (value, frozenset(n_ids)) for value, n_ids in index.items()), persistent_sets=False)
+            self._nodes_by_property[pair].keys_changed = True
+        if ordered and pair not in self._ordered:
+            self._ordered.add(pair)
+            self._nodes_by_property[pair].keys_changed = True
+
+    def _index_node(self, n_id, entry, update):
+        labels, properties = entry
+        if self._nodes_by_label is not None:
+            for n_label in labels:
+                update(self._nodes_by_label, n_label, n_id)
+        for (n_label, p_key), index in self._nodes_by_property.items():
+            if n_label in labels:
+                value = properties.get(p_key)
+                if value is not None:
+                    update(index, index_value(value), n_id)
+
+    def put_node(self, n_id, entry, replace=True):
+        old_entry = self._nodes.get(n_id)
+        if old_entry is not None:
+            if not replace or _identical_entries(old_entry, entry):
+                return
+            self._index_node(n_id, old_entry, _SetMapEditor.discard)
+            if self._hash is not None:
+                self._hash ^= _node_hash(n_id, *old_entry)
+        self._nodes[n_id] = entry
+        self._index_node(n_id, entry, _SetMapEditor.add)
+        if self._hash is not None:
+            self._hash ^= _node_hash(n_id, *entry)
+
+    def _index_relationship(self, r_id, entry, update):
+        if self._relationships_by_type is not None:
+            update(self._relationships_by_type, entry.type, r_id)
+        if self._relationships_by_node is not None:
+            for n_index, n_id in enumerate_nodes(entry.nodes):
+                update(self._relationships_by_node, n_id, (r_id, n_index))
+
+    def remove_node(self, n_id):
+        old_entry = self._nodes.get(n_id)
+        if old_entry is not None:
+            self._index_node(n_id, old_entry, _SetMapEditor.discard)
+            del self._nodes[n_id]
+            if self._hash is not None:
+                self._hash ^= _node_hash(n_id, *old_entry)
+
+    def put_relationship(self, r_id, entry, replace=True):
+        old_entry = self._relationships.get(r_id)
+        if old_entry is not None:
+            if not replace or _identical_entries(old_entry, entry):
+                return
+            self._index_relationship(r_id, old_entry, _SetMapEditor.discard)
+            if self._hash is not None:
+                self._hash ^= _relationship_hash(r_id, *old_entry)
+        self._relationships[r_id] = entry
+        self._index_relationship(r_id, entry, _SetMapEditor.add)
+        if self._hash is not None:
+            self._hash ^= _relationship_hash(r_id, *entry)
+
+    def remove_relationship(self, r_id):
+        old_entry = self._relationships.get(r_id)
+        if old_entry is not None:
+            self._index_relationship(r_id, old_entry, _SetMapEditor.discard)
+            del self._relationships[r_id]
+            if self._hash is not None:
+                self._hash ^= _relationship_hash(r_id, *old_entry)
+
+    def update(self, graph_store, replace=True):
+        # Put all entries from another store of any kind.
+        frozen = isinstance(graph_store, FrozenGraphStore)
+        for n_label, p_key in graph_store._nodes_by_property:
+            self.create_index(n_label, p_key, (n_label, p_key) in graph_store._nodes_by_property_order)
+        for n_id, entry in graph_store._nodes.items():
+            self.put_node(n_id, entry if frozen else FrozenGraphStore.node_entry(entry), replace)
+        for r_id, entry in graph_store._relationships.items():
+            self.put_relationship(r_id, entry if frozen else FrozenGraphStore.relationship_entry(entry), replace)
+
+    def stores(self):
+        nodes_by_property = _EMPTY_MAP.evolver()
+        nodes_by_property_order = self._graph_store._nodes_by_property_order.evolver()
+        for pair, index in self._nodes_by_property.items():
+            nodes_by_property[pair] = values = index.persistent()
+            if pair in self._ordered and index.keys_changed:
+                nodes_by_property_order[pair] = FrozenSortedSet(values)
+        stores = {
+            "nodes": self._nodes.persistent(),
+            "relationships": self._relationships.persistent(),
+            "nodes_by_property": nodes_by_property.persistent(),
+            "nodes_by_property_order": nodes_by_property_order.persistent(),
+        }
+        for name in ("nodes_by_label", "relationships_by_type", "relationships_by_node"):
+            editor = getattr(self, "_" + name)
+            if editor is not None:
+                stores[name] = editor.persistent()
+        return stores
+
+    def build(self):
+        graph_store = FrozenGraphStore.__new__(FrozenGraphStore)
+        GraphStore.__init__(graph_store, **self.stores())
+        graph_store._hash = self._hash
+        return graph_store
+
 
 class MutableGraphStore(GraphStore):
 
+    # Uniqueness constraints, as (label, property key) pairs. Each
+    # constraint is enforced by lookup in the property index for the
+    # same pair.
+    #
+    # {(<label>, <property_key>), ...}
+    #
+    _unique_node_properties = None
+
+    # The most recent snapshot, if any, together with the keys of all
+    # nodes and relationships changed since it was taken.
+    _snapshot = None
+    _dirty_nodes = None
+    _dirty_relationships = None
+
+    # Change counters for groups of stores, used to detect changes
+    # during iteration. Each counter is incremented before the
+    # corresponding stores are changed.
+    #
+    # {
+    #     "nodes": <count>,           # _nodes
+    #     "labels": <count>,          # _nodes_by_label
+    #     "relationships": <count>,   # _relationships and its secondary stores
+    #     "properties": <count>,      # _nodes_by_property and _nodes_by_property_order
+    # }
+    #
+    _versions = None
+
+    # The change log, if change capture has been started.
+    _change_log = None
+
     def node_entry(self, key, entry):
 
+        def is_live():
+            # Entries that have been removed or replaced should no
+            # longer affect the secondary stores.
+            live_entry = self._nodes.get(key)
+            return live_entry is not None and live_entry.labels is labels
+
         def add_labels(*labels_):
-            for label in labels_:
-                self._nodes_by_label.setdefault(label, set()).add(key)
+            if not is_live():
+                # This includes the initial labels of a new entry, which
+                # are indexed when the entry is put.
+                return
+            with self._lock:
+                if is_live():
+                    try:
+                        self._check_unique_node(key, labels_, properties)
+                    except ConstraintError:
+                        set.difference_update(labels, labels_)
+                        raise
+                    self._add_node_to_indexes(key, labels_, properties)
+                    for label in labels_:
+                        self._hash ^= _label_hash(key, label)
+                    self._touch_node(key)
+                    self._record(NODE_LABELS_ADDED, key, frozenset(labels_))
 
         def remove_labels(*labels_):
-            for label in labels_:
-                try:
-                    self._nodes_by_label[label].discard(key)
-                except KeyError:
-                    pass
+            with self._lock:
+                if is_live():
+                    self._remove_node_from_indexes(key, labels_, properties)
+                    for label in labels_:
+                        self._hash ^= _label_hash(key, label)
+                    self._touch_node(key)
+                    self._record(NODE_LABELS_REMOVED, key, frozenset(labels_))
+
+        def set_property(p_key, old_value, new_value):
+            if is_live():
+                if new_value is not None and self._unique_node_properties:
+                    for label in labels:
+                        self._check_unique_value(key, label, p_key, new_value)
+                self._update_node_property_indexes(key, labels, p_key, old_value, new_value)
+                if old_value is not None:
+                    self._hash ^= _property_hash("node", key, p_key, old_value)
+                if new_value is not None:
+                    self._hash ^= _property_hash("node", key, p_key, new_value)
+                self._touch_node(key)
+                self._record(NODE_PROPERTY_SET, key, (p_key, new_value))
 
         labels, properties = entry
-        return NodeEntry(ReactiveSet(labels, on_add=add_labels, on_remove=remove_labels), PropertyDict(properties))
+        labels = ReactiveSet(labels, on_add=add_labels, on_remove=remove_labels)
+        properties = ReactivePropertyDict(properties, on_set=set_property, lock=self._lock)
+        return NodeEntry(labels, properties)
+
+    def relationship_entry(self, key, entry):
+
+        def set_property(p_key, old_value, new_value):
+            live_entry = self._relationships.get(key)
+            if live_entry is not None and live_entry.properties is properties:
+                if old_value is not None:
+                    self._hash ^= _property_hash("relationship", key, p_key, old_value)
+                if new_value is not None:
+                    self._hash ^= _property_hash("relationship", key, p_key, new_value)
+                self._touch_relationship(key)
+                self._record(RELATIONSHIP_PROPERTY_SET, key, (p_key, new_value))
 
-    @classmethod
-    def relationship_entry(cls, entry):
         type_, nodes, properties = entry
-        return RelationshipEntry(type_, tuple(nodes), PropertyDict(properties))
+        properties = ReactivePropertyDict(properties, on_set=set_property, lock=self._lock)
+        return RelationshipEntry(type_, tuple(nodes), properties)
 
     def __init__(self, graph_store=None):
-        super(MutableGraphStore, self).__init__()
-        self._lock = RLock()
+        super(MutableGraphStore, self).__init__(nodes_by_label={}, relationships_by_type={}, relationships_by_node={})
+        self._lock = ReadWriteLock(on_release=self._publish_changes)
+        self._versions = {"nodes": 0, "labels": 0, "relationships": 0, "properties": 0}
+        self._unique_node_properties = set()
+        self._dirty_nodes = set()
+        self._dirty_relationships = set()
+        self._hash = 0
         if graph_store is not None:
             self.update(graph_store)
 
     def is_mutable(self):
         return True
 
-    def _update_nodes(self, nodes):
-        self._nodes.update((key, self.node_entry(key, entry)) for key, entry in nodes.items())
+    def change_log(self, retention=None, sequence=0):
+        """ Return the :class:`.ChangeLog` for this store, starting
+        change capture if necessary. Only changes made after capture
+        starts are recorded. The `retention` limit and starting
+        `sequence` number apply only when capture starts.
+        """
+        with self._lock:
+            if self._change_log is None:
+                self._change_log = ChangeLog(retention, sequence)
+            return self._change_log
+
+    def apply(self, changes):
+        """ Apply a sequence of :class:`.Change` records, such as those
+        captured from another store, to this store. All changes are
+        applied under a single lock, in order, and are themselves
+        recorded if change capture has been started.
+
+        :raises ConstraintError: if a change would violate a constraint,
+            in which case earlier changes remain applied
+        :raises ValueError: if a change type is not recognised
+        """
+        with self._lock:
+            for change in changes:
+                change_type, key, detail = change.type, change.key, change.detail
+                if change_type == NODE_CREATED:
+                    node_entry = self.node_entry(key, detail)
+                    self._check_unique_node(key, node_entry.labels, node_entry.properties)
+                    self._put_node(key, node_entry)
+                elif change_type == NODE_REMOVED:
+                    self._remove_node(key)
+                elif change_type == NODE_LABELS_ADDED:
+                    labels = self._nodes[key].labels
+                    labels |= set(detail)
+                elif change_type == NODE_LABELS_REMOVED:
+                    labels = self._nodes[key].labels
+                    labels -= set(detail)
+                elif change_type == NODE_PROPERTY_SET:
+                    p_key, value = detail
+                    self._nodes[key].properties[p_key] = value
+                elif change_type == RELATIONSHIP_CREATED:
+                    self._put_relationship(key, self.relationship_entry(key, detail))
+                elif change_type == RELATIONSHIP_REMOVED:
+                    self._remove_relationship(key)
+                elif change_type == RELATIONSHIP_PROPERTY_SET:
+                    p_key, value = detail
+                    self._relationships[key].properties[p_key] = value
+                elif change_type == INDEX_CREATED:
+                    self.create_index(key[0], key[1], detail)
+                elif change_type == INDEX_DROPPED:
+                    self.drop_index(*key)
+                elif change_type == CONSTRAINT_CREATED:
+                    self.create_uniqueness_constraint(*key)
+                elif change_type == CONSTRAINT_DROPPED:
+                    self.drop_uniqueness_constraint(*key)
+                else:
+                    raise ValueError("Unknown change type {!r}".format(change_type))
+
+    def _record(self, change_type, key, detail=None):
+        if self._change_log is not None:
+            self._change_log.append(change_type, key, detail)
+
+    def _publish_changes(self):
+        if self._change_log is not None:
+            self._change_log.publish()
+
+    def read_lock(self):
+        """ Return a context manager that holds off all writers, so that
+        a sequence of reads can be made against an unchanging store.
+        Readers do not block one another. Attempting to write from
+        within the context raises :exc:`RuntimeError`.
+
+        Reads made outside such a context do not block, but any
+        iterator returned by this store fails fast with a
+        :exc:`.ConcurrentModificationError` if the stores it depends
+        upon are changed before it is exhausted. Use :meth:`.snapshot`
+        for a long-lived, isolated view.
+        """
+        return self._lock.read()
+
+    def _checked(self, iterable, *stores):
+        # Wrap an iterable over one or more groups of stores in an
+        # iterator that fails fast on change. This is not a generator,
+        # so that versions are recorded when the iterator is created,
+        # under the caller's read lock, rather than when first read.
+        versions = self._versions
+        expected = [versions[store] for store in stores]
+        iterator = iter(iterable)
+
+        def check():
+            if [versions[store] for store in stores] != expected:
+                raise ConcurrentModificationError("Graph store changed during iteration")
+
+        def checked():
+            while True:
+                check()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                except RuntimeError:
+                    # Raised by a set or dict changed by another thread
+                    # between the check and the step.
+                    check()
+                    raise
+                yield item
+
+        return checked()
 
-    def _update_relationships(self, relationships):
-        self._relationships.update((key, self.relationship_entry(entry)) for key, entry in relationships.items())
+    def node_count(self, *n_labels):
+        with self._lock.read():
+            return super(MutableGraphStore, self).node_count(*n_labels)
 
-    def _update_nodes_by_label(self, labels):
-        for label, nodes in labels.items():
-            self._nodes_by_label.setdefault(label, set()).update(nodes)
+    def nodes(self, *n_labels):
+        with self._lock.read():
+            if n_labels:
+                return self._checked(super(MutableGraphStore, self).nodes(*n_labels), "labels")
+            else:
+                return self._checked(super(MutableGraphStore, self).nodes(), "nodes")
 
-    def _update_relationships_by_type(self, relationships_by_type):
-        for type_, relationships in relationships_by_type.items():
-            self._relationships_by_type.setdefault(type_, set()).update(relationships)
+    def nodes_by_property(self, n_label, p_key, value):
+        with self._lock.read():
+            return self._checked(super(MutableGraphStore, self).nodes_by_property(n_label, p_key, value),
+                                 "labels", "properties")
+
+    def _node_index_is_complete(self, n_label, p_key):
+        with self._lock.read():
+            return super(MutableGraphStore, self)._node_index_is_complete(n_label, p_key)
+
+    def nodes_by_property_range(self, n_label, p_key, lower=None, upper=None,
+                                include_lower=True, include_upper=True, descending=False):
+        with self._lock.read():
+            return self._checked(super(MutableGraphStore, self).nodes_by_property_range(
+                n_label, p_key, lower, upper, include_lower, include_upper, descending), "labels", "properties")
+
+    def nodes_by_property_prefix(self, n_label, p_key, prefix):
+        with self._lock.read():
+            return self._checked(super(MutableGraphStore, self).nodes_by_property_prefix(n_label, p_key, prefix),
+                                 "labels", "properties")
+
+    def relationship_count(self, r_type=None, n_ids=()):
+        with self._lock.read():
+            return super(MutableGraphStore, self).relationship_count(r_type, n_ids)
+
+    def relationships(self, r_type=None, n_ids=()):
+        with self._lock.read():
+            return self._checked(super(MutableGraphStore, self).relationships(r_type, n_ids), "relationships")
+
+    def _add_node_to_indexes(self, n_id, labels, properties):
+        if labels:
+            self._versions["labels"] += 1
+        for label in labels:
+            self._nodes_by_label.setdefault(label, set()).add(n_id)
+        if self._nodes_by_property:
+            for (n_label, p_key), index in self._nodes_by_property.items():
+                if n_label in labels:
+                    value = properties.get(p_key)
+                    if value is not None:
+                        self._add_to_node_index((n_label, p_key), index, value, n_id)
+
+    def _remove_node_from_indexes(self, n_id, labels, properties):
+        if labels:
+            self._versions["labels"] += 1
+        for label in labels:
+            discard_value(self._nodes_by_label, label, n_id)
+        if self._nodes_by_property:
+            for (n_label, p_key), index in self._nodes_by_property.items():
+                if n_label in labels:
+                    value = properties.get(p_key)
+                    if value is not None:
+                        self._discard_from_node_index((n_label, p_key), index, value, n_id)
+
+    def _update_node_property_indexes(self, n_id, labels, p_key, old_value, new_value):
+        for label in labels:
+            pair = (label, p_key)
+            try:
+                index = self._nodes_by_property[pair]
+            except KeyError:
+                continue
+            if old_value is not None:
+                self._discard_from_node_index(pair, index, old_value, n_id)
+            if new_value is not None:
+                self._add_to_node_index(pair, index, new_value, n_id)
+
+    def _add_to_node_index(self, pair, index, value, n_id):
+        self._versions["properties"] += 1
+        value = index_value(value)
+        try:
+            index[value].add(n_id)
+        except KeyError:
+            index[value] = {n_id}
+            try:
+                self._nodes_by_property_order[pair].add(value)
+            except KeyError:
+                pass
+
+    def _discard_from_node_index(self, pair, index, value, n_id):
+        value = index_value(value)
+        try:
+            n_ids = index[value]
+        except KeyError:
+            return
+        self._versions["properties"] += 1
+        n_ids.discard(n_id)
+        if not n_ids:
+            del index[value]
+            try:
+                self._nodes_by_property_order[pair].discard(value)
+            except KeyError:
+                pass
 
-    def _update_relationships_by_node(self, relationships_by_node):
-        for n_id, entry in relationships_by_node.items():
-            self._relationships_by_node.setdefault(n_id, set()).update(entry)
+    def _check_unique_value(self, n_id, n_label, p_key, value, replaced=()):
+        pair = (n_label, p_key)
+        if pair in self._unique_node_properties:
+            for holder in self._nodes_by_property[pair].get(index_value(value), ()):
+                if holder != n_id and holder not in replaced:
+                    raise ConstraintError("Node with label {!r} and property {!r} = {!r} "
+                                          "already exists".format(n_label, p_key, value))
+
+    def _check_unique_node(self, n_id, labels, properties):
+        for n_label, p_key in self._unique_node_properties:
+            if n_label in labels:
+                value = properties.get(p_key)
+                if value is not None:
+                    self._check_unique_value(n_id, n_label, p_key, value)
+
+    def _check_unique_nodes(self, nodes, removed=()):
+        # Check a batch of (key, entry) pairs, each of which either adds
+        # a new node or replaces the existing node with the same key,
+        # alongside the removal of any existing nodes in `removed`.
+        if not self._unique_node_properties:
+            return
+        replaced = {n_id for n_id, _ in nodes if n_id in self._nodes}
+        replaced.update(removed)
+        seen = {}
+        for n_id, (labels, properties) in nodes:
+            for n_label, p_key in self._unique_node_properties:
+                if n_label in labels:
+                    value = properties.get(p_key)
+                    if value is None:
+                        continue
+                    self._check_unique_value(n_id, n_label, p_key, value, replaced)
+                    if seen.setdefault((n_label, p_key, index_value(value)), n_id) != n_id:
+                        raise ConstraintError("Node with label {!r} and property {!r} = {!r} "
+                                              "is duplicated".format(n_label, p_key, value))
+
+    def _touch_node(self, n_id):
+        if self._snapshot is not None:
+            self._dirty_nodes.add(n_id)
+
+    def _touch_relationship(self, r_id):
+        if self._snapshot is not None:
+            self._dirty_relationships.add(r_id)
+
+    def _indexes_changed(self):
+        # Called when an index is created or dropped, which neither
+        # iterators nor snapshots can track by key.
+        self._versions["properties"] += 1
+        self._snapshot = None
+        self._dirty_nodes.clear()
+        self._dirty_relationships.clear()
+
+    def _put_node(self, n_id, node_entry):
+        self._touch_node(n_id)
+        self._versions["nodes"] += 1
+        old_entry = self._nodes.get(n_id)
+        if old_entry is not None:
+            self._remove_node_from_indexes(n_id, old_entry.labels, old_entry.properties)
+            self._hash ^= _node_hash(n_id, old_entry.labels, old_entry.properties)
+        self._nodes[n_id] = node_entry
+        self._add_node_to_indexes(n_id, node_entry.labels, node_entry.properties)
+        self._hash ^= _node_hash(n_id, node_entry.labels, node_entry.properties)
+        self._record(NODE_CREATED, n_id, (frozenset(node_entry.labels), dict(node_entry.properties)))
+
+    def _put_nodes(self, nodes):
+        # Put a batch of (key, entry) pairs with distinct keys. New nodes
+        # are added to the label store a label at a time.
+        new_nodes = []
+        for n_id, node_entry in nodes:
+            if n_id in self._nodes:
+                self._put_node(n_id, node_entry)
+            else:
+                new_nodes.append((n_id, node_entry))
+        if not new_nodes:
+            return
+        self._versions["nodes"] += 1
+        self._versions["labels"] += 1
+        if self._snapshot is not None:
+            self._dirty_nodes.update(n_id for n_id, _ in new_nodes)
+        n_ids_by_label = {}
+        for n_id, node_entry in new_nodes:
+            for label in node_entry.labels:
+                n_ids_by_label.setdefault(label, []).append(n_id)
+            self._hash ^= _node_hash(n_id, node_entry.labels, node_entry.properties)
+        self._nodes.update(new_nodes)
+        if self._change_log is not None:
+            for n_id, node_entry in new_nodes:
+                self._record(NODE_CREATED, n_id, (frozenset(node_entry.labels), dict(node_entry.properties)))
+        for label, n_ids in n_ids_by_label.items():
+            self._nodes_by_label.setdefault(label, set()).update(n_ids)
+        for (n_label, p_key), index in self._nodes_by_property.items():
+            for n_id in n_ids_by_label.get(n_label, ()):
+                value = self._nodes[n_id].properties.get(p_key)
+                if value is not None:
+                    self._add_to_node_index((n_label, p_key), index, value, n_id)
+
+    def _remove_node(self, n_id):
+        if n_id in self._nodes:
+            self._versions["nodes"] += 1
+        try:
+            node_entry = self._nodes.pop(n_id)
+        except KeyError:
+            return
+        self._touch_node(n_id)
+        self._remove_node_from_indexes(n_id, node_entry.labels, node_entry.properties)
+        self._hash ^= _node_hash(n_id, node_entry.labels, node_entry.properties)
+        for r_id, _ in list(self._relationships_by_node.get(n_id, ())):
+            self._remove_relationship(r_id)
+        self._record(NODE_REMOVED, n_id)
+
+    def _put_relationship(self, r_id, relationship_entry):
+        self._touch_relationship(r_id)
+        self._versions["relationships"] += 1
+        if r_id in self._relationships:
+            self._remove_relationship(r_id)
+        r_type, n_ids, properties = relationship_entry
+        self._relationships[r_id] = relationship_entry
+        self._hash ^= _relationship_hash(r_id, r_type, n_ids, properties)
+        self._relationships_by_type.setdefault(r_type, set()).add(r_id)
+        for n_index, n_id in enumerate_nodes(n_ids):
+            self._relationships_by_node.setdefault(n_id, set()).add((r_id, n_index))
+        self._record(RELATIONSHIP_CREATED, r_id, (r_type, n_ids, dict(relationship_entry.properties)))
+
+    def _put_relationships(self, relationships):
+        # Put a batch of (key, entry) pairs with distinct keys. New
+        # relationships are added to the type store a type at a time.
+        new_relationships = []
+        for r_id, relationship_entry in relationships:
+            if r_id in self._relationships:
+                self._put_relationship(r_id, relationship_entry)
+            else:
+                new_relationships.append((r_id, relationship_entry))
+        if not new_relationships:
+            return
+        self._versions["relationships"] += 1
+        if self._snapshot is not None:
+            self._dirty_relationships.update(r_id for r_id, _ in new_relationships)
+        r_ids_by_type = {}
+        relationships_by_node = self._relationships_by_node
+        for r_id, (r_type, n_ids, properties) in new_relationships:
+            r_ids_by_type.setdefault(r_type, []).append(r_id)
+            self._hash ^= _relationship_hash(r_id, r_type, n_ids, properties)
+            for n_index, n_id in enumerate_nodes(n_ids):
+                relationships_by_node.setdefault(n_id, set()).add((r_id, n_index))
+        self._relationships.update(new_relationships)
+        if self._change_log is not None:
+            for r_id, (r_type, n_ids, properties) in new_relationships:
+                self._record(RELATIONSHIP_CREATED, r_id, (r_type, n_ids, dict(properties)))
+        for r_type, r_ids in r_ids_by_type.items():
+            self._relationships_by_type.setdefault(r_type, set()).update(r_ids)
+
+    def _remove_relationship(self, r_id):
+        if r_id in self._relationships:
+            self._versions["relationships"] += 1
+        try:
+            r_type, n_ids, properties = self._relationships.pop(r_id)
+        except KeyError:
+            return
+        self._touch_relationship(r_id)
+        self._hash ^= _relationship_hash(r_id, r_type, n_ids, properties)
+        discard_value(self._relationships_by_type, r_type, r_id)
+        for n_index, n_id in enumerate_nodes(n_ids):
+            discard_value(self._relationships_by_node, n_id, (r_id, n_index))
+        self._record(RELATIONSHIP_REMOVED, r_id)
 
     def update(self, graph_store):
         if isinstance(graph_store, GraphStore):
+            nodes = [(key, self.node_entry(key, entry)) for key, entry in graph_store._nodes.items()]
             with self._lock:
-                self._update_nodes(graph_store._nodes)
-                self._update_relationships(graph_store._relationships)
-                self._update_nodes_by_label(graph_store._nodes_by_label)
-                self._update_relationships_by_type(graph_store._relationships_by_type)
-                self._update_relationships_by_node(graph_store._relationships_by_node)
+                self._check_unique_nodes(nodes)
+                for n_label, p_key in graph_store._nodes_by_property:
+                    self.create_index(n_label, p_key, (n_label, p_key) in graph_store._nodes_by_property_order)
+                self._put_nodes(nodes)
+                self._put_relationships([(key, self.relationship_entry(key, entry))
+                                         for key, entry in graph_store._relationships.items()])
         else:
             raise TypeError("Argument is not a graph store")
 
+    def snapshot(self):
+        """ Return a :class:`.FrozenGraphStore` holding the current
+        contents of this store, including its indexes.
+
+        The snapshot is consistent, as it is taken under the store lock,
+        and unaffected by any later change to this store. Snapshots are
+        copy-on-write: once the first has been taken, this store records
+        which entries change, and the next snapshot is derived from the
+        last by copying only those entries. Taking a snapshot of an
+        unchanged store costs nothing. Creating or dropping an index
+        causes the next snapshot to be taken in full.
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = FrozenGraphStore(self)
+            elif self._dirty_nodes or self._dirty_relationships:
+                editor = _FrozenGraphStoreEditor(self._snapshot)
+                for n_id in self._dirty_nodes:
+                    node_entry = self._nodes.get(n_id)
+                    if node_entry is None:
+                        editor.remove_node(n_id)
+                    else:
+                        editor.put_node(n_id, FrozenGraphStore.node_entry(node_entry))
+                for r_id in self._dirty_relationships:
+                    relationship_entry = self._relationships.get(r_id)
+                    if relationship_entry is None:
+                        editor.remove_relationship(r_id)
+                    else:
+                        editor.put_relationship(r_id, FrozenGraphStore.relationship_entry(relationship_entry))
+                self._snapshot = editor.build()
+            self._dirty_nodes.clear()
+            self._dirty_relationships.clear()
+            return self._snapshot
+
+    def create_index(self, n_label, p_key, ordered=False):
+        """ Create a property index over all nodes with the label
+        `n_label`, keyed on the values of property `p_key`. The index
+        is maintained as nodes, labels and properties change, and is
+        used by :meth:`.nodes_by_property`.
+
+        An `ordered` index additionally keeps the distinct property
+        values sorted, for use by :meth:`.nodes_by_property_range` and
+        :meth:`.nodes_by_property_prefix`. Creating an index that
+        already exists has no effect, other than to make it ordered if
+        requested.
+        """
+        pair = (n_label, p_key)
+        with self._lock:
+            created = pair not in self._nodes_by_property
+            if created:
+                self._nodes_by_property[pair] = self._build_node_index(n_label, p_key)
+            if ordered and pair not in self._nodes_by_property_order:
+                self._nodes_by_property_order[pair] = SortedSet(self._nodes_by_property[pair])
+                created = True
+            if created:
+                self._indexes_changed()
+                self._record(INDEX_CREATED, pair, pair in self._nodes_by_property_order)
+
+    def drop_index(self, n_label, p_key):
+        """ Drop a property index. Dropping an index that does not
+        exist has no effect.
+
+        :raises ConstraintError: if the index backs a uniqueness constraint
+        """
+        pair = (n_label, p_key)
+        with self._lock:
+            if pair in self._unique_node_properties:
+                raise ConstraintError("Index on :{}({}) backs a uniqueness constraint".format(n_label, p_key))
+            if pair in self._nodes_by_property:
+                del self._nodes_by_property[pair]
+                self._nodes_by_property_order.pop(pair, None)
+                self._indexes_changed()
+                self._record(INDEX_DROPPED, pair)
+
+    def uniqueness_constraints(self):
+        """ Return the set of (label, property key) pairs for which a
+        uniqueness constraint exists in this store.
+        """
+        return frozenset(self._unique_node_properties)
+
+    def create_uniqueness_constraint(self, n_label, p_key):
+        """ Require that no two nodes with the label `n_label` share the
+        same value for property `p_key`.
+
+        The constraint is enforced in constant time by a property index,
+        which is created if it does not already exist. Any subsequent
+        node addition, update, label addition or property assignment
+        that would break the constraint raises a :class:`.ConstraintError`
+        and leaves the store unchanged.
+
+        :raises ConstraintError: if existing nodes already break the constraint
+        """
+        pair = (n_label, p_key)
+        with self._lock:
+            if pair in self._unique_node_properties:
+                return
+            index = self._nodes_by_property.get(pair)
+            if index is None:
+                index = self._build_node_index(n_label, p_key)
+            for value, n_ids in index.items():
+                if len(n_ids) > 1:
+                    raise ConstraintError("Nodes with label {!r} and property {!r} = {!r} "
+                                          "already exist".format(n_label, p_key, value[1]))
+            if pair not in self._nodes_by_property:
+                self._nodes_by_property[pair] = index
+                self._indexes_changed()
+                self._record(INDEX_CREATED, pair, False)
+            self._unique_node_properties.add(pair)
+            self._record(CONSTRAINT_CREATED, pair)
+
+    def drop_uniqueness_constraint(self, n_label, p_key):
+        """ Drop a uniqueness constraint, leaving its index in place.
+        Dropping a constraint that does not exist has no effect.
+        """
+        pair = (n_label, p_key)
+        with self._lock:
+            if pair in self._unique_node_properties:
+                self._unique_node_properties.remove(pair)
+                self._record(CONSTRAINT_DROPPED, pair)
+
     def add_nodes(self, entries):
         n_ids = []
-        nodes = {}
-        nodes_by_label = {}
+        nodes = []
         for entry in entries:
             n_id = self.new_node_key()
-            mutable_entry = self.node_entry(n_id, entry)
-            nodes[n_id] = mutable_entry
-            for label in mutable_entry.labels:
-                nodes_by_label.setdefault(label, set()).add(n_id)
+            nodes.append((n_id, self.node_entry(n_id, entry)))
             n_ids.append(n_id)
         with self._lock:
-            self._update_nodes(nodes)
-            self._update_nodes_by_label(nodes_by_label)
+            self._check_unique_nodes(nodes)
+            self._put_nodes(nodes)
+        return n_ids
+
+    def _match_node(self, n_label, key_properties, lookups):
+        if not key_properties:
+            for n_id in self._nodes_by_label.get(n_label, ()):
+                return n_id
+            return None
+        for p_key in sorted(key_properties):
+            index = self._nodes_by_property.get((n_label, p_key))
+            if index is not None:
+                break
+        else:
+            p_key = min(key_properties)
+            index = self._merge_lookup(n_label, p_key, lookups)
+        key_values = {key: index_value(value) for key, value in key_properties.items()}
+        for n_id in index.get(key_values[p_key], ()):
+            properties = self._nodes[n_id].properties
+            if all(index_value(properties.get(key)) == value for key, value in key_values.items()):
+                return n_id
+        return None
+
+    def merge_nodes(self, entries):
+        """ Match or create nodes.
+
+        Each entry is a (label, key properties, properties) triple. If
+        a node exists with that label and all the key properties, its
+        other properties are updated; otherwise a new node is created
+        with the label, the key properties and the other properties.
+        Entries are processed in order, so later entries in a batch can
+        match nodes created by earlier ones.
+
+        Lookups use a property index for the label and one of the key
+        properties. If no such index exists, a temporary one is built
+        on the key property that sorts first and is discarded when the
+        batch is done.
+
+        All entries are checked for null key property values before
+        any is applied. The batch is not otherwise atomic: if an entry
+        would break a uniqueness constraint, the entries before it
+        remain applied.
+
+        :return: list of node keys, one for each entry
+        :raises ValueError: if a key property value is :const:`None`
+        :raises ConstraintError: if an entry would break a uniqueness constraint
+        """
+        entries = self._merge_node_entries(entries)
+        n_ids = []
+        lookups = {}
+        with self._lock:
+            for n_label, key_properties, properties in entries:
+                n_id = self._match_node(n_label, key_properties, lookups)
+                if n_id is None:
+                    n_id = self.new_node_key()
+                    node_properties = dict(key_properties)
+                    node_properties.update(properties)
+                    node = (n_id, self.node_entry(n_id, ([n_label], node_properties)))
+                    self._check_unique_nodes([node])
+                    self._put_node(*node)
+                    if lookups:
+                        self._track_merge(lookups, n_id, {n_label}, {}, node_properties)
+                else:
+                    node = self._nodes[n_id]
+                    if lookups:
+                        old_properties = {p_key: node.properties.get(p_key) for _, p_key in lookups}
+                        node.properties.update(properties)
+                        self._track_merge(lookups, n_id, node.labels, old_properties, node.properties)
+                    else:
+                        node.properties.update(properties)
+                n_ids.append(n_id)
         return n_ids
 
     def remove_nodes(self, n_ids):
         with self._lock:
             for n_id in list(n_ids):
-                # Remove from _nodes
-                try:
-                    n_labels, n_properties = self._nodes[n_id]
-                except KeyError:
-                    continue
-                else:
-                    del self._nodes[n_id]
-                # Remove from _nodes_by_label
-                for n_label in n_labels:
-                    discard_value(self._nodes_by_label, n_label, n_id)
-                # Remove relationships
-                try:
-                    self.remove_relationships(r_id for r_id, _ in self._relationships_by_node[n_id])
-                except KeyError:
-                    pass
+                self._remove_node(n_id)
 
     def add_relationships(self, entries):
+        r_ids = []
+        relationships = []
+        for entry in entries:
+            r_id = self.new_relationship_key()
+            relationships.append((r_id, self.relationship_entry(r_id, entry)))
+            r_ids.append(r_id)
+        with self._lock:
+            self._put_relationships(relationships)
+        return r_ids
+
+    def merge_relationships(self, entries):
+        """ Match or create relationships.
+
+        Each entry is a (type, node keys, properties) triple. If a
+        relationship of that type already connects those nodes in that
+        order, its properties are updated; otherwise a new relationship
+        is created. Lookups use the relationship type and node indexes.
+
+        :return: list of relationship keys, one for each entry
+        """
         r_ids = []
         with self._lock:
             for r_type, n_ids, r_properties in entries:
-                r_id = self.new_relationship_key()
-                mutable_entry = self.relationship_entry((r_type, n_ids, r_properties))
-                self._relationships[r_id] = mutable_entry
-                self._relationships_by_type.setdefault(r_type, set()).add(r_id)
-                for n_index, n_id in enumerate_nodes(n_ids):
-                    self._relationships_by_node.setdefault(n_id, set()).add((r_id, n_index))
+                n_ids = tuple(n_ids)
+                for r_id in self.relationships(r_type, n_ids):
+                    if self._relationships[r_id].nodes == n_ids:
+                        self._relationships[r_id].properties.update(r_properties)
+                        break
+                else:
+                    r_id = self.new_relationship_key()
+                    self._put_relationship(r_id, self.relationship_entry(r_id, (r_type, n_ids, r_properties)))
                 r_ids.append(r_id)
         return r_ids
 
     def remove_relationships(self, r_ids):
         with self._lock:
             for r_id in list(r_ids):
-                # Remove from _relationships
-                try:
-                    r_type, n_ids, r_properties = self._relationships[r_id]
-                except KeyError:
-                    continue
+                self._remove_relationship(r_id)
+
+    def transaction(self):
+        """ Begin a :class:`.Transaction` against this store.
+        """
+        return Transaction(self)
+
+
+class Transaction(object):
+    """ A batch of changes to a :class:`.MutableGraphStore`, applied
+    atomically on commit.
+
+    Changes are buffered, in order, and are not visible in the store
+    until :meth:`.commit` is called. At that point the whole batch is
+    checked against the store's uniqueness constraints and then applied
+    under a single acquisition of the store lock, so other threads see
+    either none of it or all of it. Nodes and relationships added in one
+    call are indexed together, which makes a transaction a faster way to
+    make many small changes than calling the store for each.
+
+    Used as a context manager, a transaction commits on normal exit and
+    rolls back if an exception is raised.
+    """
+
+    def __init__(self, graph_store):
+        self._graph_store = graph_store
+        self._operations = []
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._closed:
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def _check_open(self):
+        if self._closed:
+            raise ValueError("Transaction closed")
+
+    def closed(self):
+        """ Return :const:`True` if this transaction has been committed
+        or rolled back.
+        """
+        return self._closed
+
+    def add_nodes(self, entries):
+        """ Add nodes from (labels, properties) entries.
+
+        :return: list of keys for the new nodes
+        """
+        self._check_open()
+        graph_store = self._graph_store
+        nodes = []
+        for entry in entries:
+            n_id = graph_store.new_node_key()
+            nodes.append((n_id, graph_store.node_entry(n_id, entry)))
+        self._operations.append(("add_nodes", nodes))
+        return [n_id for n_id, _ in nodes]
+
+    def add_relationships(self, entries):
+        """ Add relationships from (type, node keys, properties) entries.
+        Node keys may be those returned by :meth:`.add_nodes` earlier
+        in this transaction.
+
+        :return: list of keys for the new relationships
+        """
+        self._check_open()
+        graph_store = self._graph_store
+        relationships = []
+        for entry in entries:
+            r_id = graph_store.new_relationship_key()
+            relationships.append((r_id, graph_store.relationship_entry(r_id, entry)))
+        self._operations.append(("add_relationships", relationships))
+        return [r_id for r_id, _ in relationships]
+
+    def remove_nodes(self, n_ids):
+        """ Remove nodes, along with their relationships.
+        """
+        self._check_open()
+        self._operations.append(("remove_nodes", list(n_ids)))
+
+    def remove_relationships(self, r_ids):
+        """ Remove relationships.
+        """
+        self._check_open()
+        self._operations.append(("remove_relationships", list(r_ids)))
+
+    def _check(self):
+        # Check the net effect of the transaction against the store's
+        # uniqueness constraints.
+        graph_store = self._graph_store
+        if not graph_store._unique_node_properties:
+            return
+        added = {}
+        removed = set()
+        for operation, arg in self._operations:
+            if operation == "add_nodes":
+                added.update(arg)
+            elif operation == "remove_nodes":
+                for n_id in arg:
+                    if added.pop(n_id, None) is None and n_id in graph_store._nodes:
+                        removed.add(n_id)
+        graph_store._check_unique_nodes(list(added.items()), removed)
+
+    def commit(self):
+        """ Check and apply all changes in this transaction, then close
+        it. If the check fails, the store is left unchanged and the
+        transaction remains open.
+
+        :raises ConstraintError: if the changes would break a uniqueness constraint
+        """
+        self._check_open()
+        graph_store = self._graph_store
+        with graph_store._lock:
+            self._check()
+            # Additions of new keys commute with one another, so each
+            # run of additions between removals is applied as a single
+            # batch of nodes followed by a single batch of relationships.
+            nodes = []
+            relationships = []
+            for operation, arg in self._operations + [(None, None)]:
+                if operation == "add_nodes":
+                    nodes.extend(arg)
+                elif operation == "add_relationships":
+                    relationships.extend(arg)
                 else:
-                    del self._relationships[r_id]
-                # Remove from _relationships_by_type
-                discard_value(self._relationships_by_type, r_type, r_id)
-                # Remove from _relationships_by_node
-                for n_index, n_id in enumerate_nodes(n_ids):
-                    discard_value(self._relationships_by_node, n_id, (r_id, n_index))
+                    graph_store._put_nodes(nodes)
+                    graph_store._put_relationships(relationships)
+                    nodes = []
+                    relationships = []
+                    if operation == "remove_nodes":
+                        for n_id in arg:
+                            graph_store._remove_node(n_id)
+                    elif operation == "remove_relationships":
+                        for r_id in arg:
+                            graph_store._remove_relationship(r_id)
+        self._operations = []
+        self._closed = True
+
+    def rollback(self):
+        """ Discard all changes in this transaction, then close it.
+        """
+        self._check_open()
+        self._operations = []
+        self._closed = True
 
 
 def enumerate_nodes(iterable):
@@ -652,6 +2172,132 @@ def discard_value(collection, key, value):
             del collection[key]
 
 
+def index_value(value):
+    """ Return a hashable and orderable equivalent of a property value,
+    suitable for use as a key within a property index.
+
+    The value is paired with a rank for its type, so that values of
+    different types never compare equal and are ordered as they would
+    be by Cypher's ``ORDER BY``: lists, then strings, then booleans,
+    then numbers.
+    """
+    if isinstance(value, list):
+        return 0, tuple(map(index_value, value))
+    elif isinstance(value, unicode_types + utf8_types):
+        return 1, value
+    elif isinstance(value, bytes_types):
+        return 2, bytes(value)
+    elif isinstance(value, bool):
+        return 3, value
+    elif isinstance(value, integer_types + (float,)):
+        if value != value:
+            # NaN sorts after all other numbers
+            return 5, value
+        return 4, value
+    else:
+        return 6, value
+
+
+def _value_hash(value):
+    # Hash a property value consistently with equality, so that values
+    # that compare equal, such as 1 and 1.0, hash equally.
+    if isinstance(value, list):
+        return hash(tuple(map(_value_hash, value)))
+    elif isinstance(value, bytearray):
+        return hash(bytes(value))
+    else:
+        return hash(value)
+
+
+def _label_hash(n_id, label):
+    return hash(("label", n_id, label))
+
+
+def _property_hash(kind, key, p_key, value):
+    return hash((kind, key, p_key, _value_hash(value)))
+
+
+def _node_hash(n_id, labels, properties):
+    # The content hash of a store is the XOR of a term for each node and
+    # relationship, each label and each property, so that it can be
+    # updated as these are added and removed.
+    value = hash(("node", n_id))
+    for label in labels:
+        value ^= _label_hash(n_id, label)
+    for p_key, p_value in properties.items():
+        if p_value is not None:
+            value ^= _property_hash("node", n_id, p_key, p_value)
+    return value
+
+
+def _relationship_hash(r_id, r_type, n_ids, properties):
+    value = hash(("relationship", r_id, r_type, tuple(n_ids)))
+    for p_key, p_value in properties.items():
+        if p_value is not None:
+            value ^= _property_hash("relationship", r_id, p_key, p_value)
+    return value
+
+
+def _strict_value(value):
+    # Return an equivalent of a property value that compares equal only
+    # to values of the same type, unlike 1, 1.0 and True.
+    if isinstance(value, list):
+        return list, tuple(map(_strict_value, value))
+    return type(value), value
+
+
+def _identical_entries(old, new):
+    # Return true if two node or relationship entries are the same
+    # entry, or are equal with property values of the same types.
+    if old is new:
+        return True
+    if old != new:
+        return False
+    new_properties = new.properties
+    return all(_strict_value(value) == _strict_value(new_properties.get(key))
+               for key, value in old.properties.items())
+
+
+def _entry_differences(old, new):
+    # Yield (key, old entry, new entry) for every key whose entries are
+    # not identical in two primary stores, with None for a missing entry.
+    if isinstance(old, PersistentMap) and isinstance(new, PersistentMap):
+        for difference in old.diff(new):
+            yield difference
+        return
+    get = new.get
+    for key, old_entry in old.items():
+        new_entry = get(key)
+        if new_entry is None or not _identical_entries(old_entry, new_entry):
+            yield key, old_entry, new_entry
+    for key, new_entry in new.items():
+        if key not in old:
+            yield key, None, new_entry
+
+
+def _properties_delta(old, new):
+    # Return a pair of the properties set and the property keys removed
+    # between two sets of properties, or None if there are no changes.
+    old = dict(old.items())
+    properties_set = {}
+    for key, value in new.items():
+        old_value = old.pop(key, None)
+        if old_value is None or index_value(old_value) != index_value(value):
+            properties_set[key] = value
+    if properties_set or old:
+        return properties_set, frozenset(old)
+    return None
+
+
+def _node_delta(old, new):
+    labels_added = frozenset(new.labels) - old.labels
+    labels_removed = frozenset(old.labels) - new.labels
+    properties_delta = _properties_delta(old.properties, new.properties) or ({}, frozenset())
+    if labels_added or labels_removed or properties_delta[0] or properties_delta[1]:
+        return NodeDelta(labels_added, labels_removed, *properties_delta)
+    return None
+
+
 def key_str(key):
     if isinstance(key, UUID):
         return "#" + key.hex[-7:]
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from unittest import TestCase
+
+from cypy.graph.changes import ChangeLog, ChangeLogError, NODE_CREATED, NODE_REMOVED, NODE_LABELS_ADDED, \
+    NODE_LABELS_REMOVED, NODE_PROPERTY_SET, RELATIONSHIP_CREATED, RELATIONSHIP_REMOVED, RELATIONSHIP_PROPERTY_SET, \
+    INDEX_CREATED, INDEX_DROPPED, CONSTRAINT_CREATED, CONSTRAINT_DROPPED
+from cypy.graph.store import MutableGraphStore
+
+
+class ChangeLogTestCase(TestCase):
+
+    def test_sequence_numbers(self):
+        log = ChangeLog()
+        log.append(NODE_CREATED, "a", ({"X"}, {}))
+        log.append(NODE_REMOVED, "a")
+        assert log.last_sequence() == 0
+        log.publish()
+        assert log.last_sequence() == 2
+        assert [change.sequence for change in log.changes()] == [1, 2]
+        assert [change.type for change in log.changes(1)] == [NODE_REMOVED]
+        assert log.changes(2) == []
+
+    def test_starting_sequence(self):
+        log = ChangeLog(sequence=10)
+        assert log.last_sequence() == 10
+        log.append(NODE_REMOVED, "a")
+        assert log.last_sequence() == 10
+        assert log.last_sequence(pending=True) == 11
+        log.publish()
+        assert [change.sequence for change in log.changes(10)] == [11]
+
+    def test_bounded_retention(self):
+        log = ChangeLog(retention=3)
+        for i in range(5):
+            log.append(NODE_REMOVED, i)
+        log.publish()
+        assert len(log) == 3
+        assert [change.key for change in log.changes(2)] == [2, 3, 4]
+        with self.assertRaises(ChangeLogError):
+            log.changes(1)
+
+    def test_subscription(self):
+        log = ChangeLog()
+        batches = []
+        log.append(NODE_REMOVED, "a")
+        log.publish()
+        log.subscribe(batches.append, since=0)
+        log.append(NODE_REMOVED, "b")
+        log.append(NODE_REMOVED, "c")
+        log.publish()
+        log.unsubscribe(batches.append)
+        log.append(NODE_REMOVED, "d")
+        log.publish()
+        assert [[change.key for change in batch] for batch in batches] == [["a"], ["b", "c"]]
+
+
+class StoreChangeCaptureTestCase(TestCase):
+
+    def setUp(self):
+        self.store = MutableGraphStore()
+        self.log = self.store.change_log()
+        self.batches = []
+        self.log.subscribe(self.batches.append)
+
+    def changes(self):
+        return [(change.type, change.key, change.detail) for batch in self.batches for change in batch]
+
+    def test_only_changes_after_capture_starts_are_recorded(self):
+        store = MutableGraphStore()
+        store.add_nodes([(["Person"], {})])
+        log = store.change_log()
+        assert store.change_log() is log
+        assert log.changes() == []
+
+    def test_node_and_relationship_changes(self):
+        a, b = self.store.add_nodes([(["Person"], {"name": "Alice"}), (["Person"], {"name": "Bob"})])
+        ab, = self.store.add_relationships([("KNOWS", (a, b), {"since": 1999})])
+        self.store.node_labels(a).add("Employee")
+        self.store.node_labels(a).discard("Employee")
+        self.store.node_properties(a)["age"] = 33
+        self.store.relationship_properties(ab)["since"] = 2000
+        self.store.remove_nodes([b])
+        assert self.changes() == [
+            (NODE_CREATED, a, (frozenset({"Person"}), {"name": "Alice"})),
+            (NODE_CREATED, b, (frozenset({"Person"}), {"name": "Bob"})),
+            (RELATIONSHIP_CREATED, ab, ("KNOWS", (a, b), {"since": 1999})),
+            (NODE_LABELS_ADDED, a, frozenset({"Employee"})),
+            (NODE_LABELS_REMOVED, a, frozenset({"Employee"})),
+            (NODE_PROPERTY_SET, a, ("age", 33)),
+            (RELATIONSHIP_PROPERTY_SET, ab, ("since", 2000)),
+            (RELATIONSHIP_REMOVED, ab, None),
+            (NODE_REMOVED, b, None),
+        ]
+
+    def test_changes_are_delivered_in_one_batch_per_operation(self):
+        with self.store.transaction() as tx:
+            a, b = tx.add_nodes([(["Person"], {}), (["Person"], {})])
+            tx.add_relationships([("KNOWS", (a, b), {})])
+            tx.remove_nodes([a])
+        assert len(self.batches) == 1
+        assert [change.sequence for change in self.batches[0]] == [1, 2, 3, 4, 5]
+
+    def test_rejected_changes_are_not_recorded(self):
+        self.store.create_uniqueness_constraint("Person", "name")
+        a, b = self.store.add_nodes([(["Person"], {"name": "Alice"}), (["Person"], {"name": "Bob"})])
+        with self.assertRaises(ValueError):
+            self.store.node_properties(b)["name"] = "Alice"
+        assert [change.type for change in self.log.changes()] == [INDEX_CREATED, CONSTRAINT_CREATED,
+                                                                  NODE_CREATED, NODE_CREATED]
+
+    def test_schema_changes(self):
+        self.store.create_index("Person", "name")
+        self.store.create_uniqueness_constraint("Person", "name")
+        self.store.drop_uniqueness_constraint("Person", "name")
+        self.store.drop_index("Person", "name")
+        self.store.create_index("Person", "age", ordered=True)
+        assert self.changes() == [
+            (INDEX_CREATED, ("Person", "name"), False),
+            (CONSTRAINT_CREATED, ("Person", "name"), None),
+            (CONSTRAINT_DROPPED, ("Person", "name"), None),
+            (INDEX_DROPPED, ("Person", "name"), None),
+            (INDEX_CREATED, ("Person", "age"), True),
+        ]
+
+    def test_apply_replicates_changes(self):
+        self.store.create_index("Person", "name", ordered=True)
+        self.store.create_uniqueness_constraint("Person", "name")
+        a, b = self.store.add_nodes([(["Person"], {"name": "Alice"}), (["Person"], {"name": "Bob"})])
+        ab, = self.store.add_relationships([("KNOWS", (a, b), {"since": 1999})])
+        self.store.node_labels(a).add("Employee")
+        self.store.node_labels(b).discard("Person")
+        self.store.node_properties(a)["age"] = 33
+        self.store.relationship_properties(ab)["since"] = 2000
+        c, = self.store.add_nodes([(["Person"], {"name": "Carol"})])
+        self.store.remove_nodes([c])
+        replica = MutableGraphStore()
+        replica.apply(self.log.changes())
+        assert replica == self.store
+        assert replica.ordered_node_indexes() == {("Person", "name")}
+        assert replica.uniqueness_constraints() == {("Person", "name")}
+        assert set(replica.nodes("Employee")) == {a}
+        assert set(replica.nodes_by_property("Person", "name", "Bob")) == set()
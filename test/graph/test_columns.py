@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from array import array
+from unittest import TestCase, skipIf
+
+from cypy.graph import Graph, NodeSelection, RelationshipSelection, relationship_type
+from cypy.graph.columns import And, Or, column, filter_keys, numpy
+from cypy.graph.matching import Predicate
+
+
+KNOWS = relationship_type("KNOWS")
+
+
+class ColumnTestCase(TestCase):
+
+    def test_integer_column(self):
+        values, nulls = column([1, None, 3], use_numpy=False)
+        assert isinstance(values, array) and values.itemsize == 8
+        assert values.tolist() == [1, 0, 3]
+        assert list(nulls) == [0, 1, 0]
+
+    def test_float_column(self):
+        values, nulls = column([1, 2.5, None], use_numpy=False)
+        assert values == array("d", [1.0, 2.5, 0.0])
+        assert list(nulls) == [0, 0, 1]
+
+    def test_boolean_column(self):
+        values, _ = column([True, False], use_numpy=False)
+        assert values == array("b", [1, 0])
+
+    def test_other_columns_are_lists(self):
+        assert column(["a", None], use_numpy=False) == (["a", None], bytearray([0, 1]))
+        assert column([1, "a"], use_numpy=False).values == [1, "a"]
+        assert column([True, 1], use_numpy=False).values == [True, 1]
+        assert column([2 ** 64], use_numpy=False).values == [2 ** 64]
+        assert column([], use_numpy=False) == ([], bytearray())
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_column(self):
+        values, nulls = column([1, None, 3], use_numpy=True)
+        assert values.dtype == numpy.int64
+        assert values.tolist() == [1, 0, 3]
+        assert nulls.tolist() == [False, True, False]
+
+    @skipIf(numpy is not None, "NumPy is installed")
+    def test_numpy_required(self):
+        with self.assertRaises(ImportError):
+            column([1], use_numpy=True)
+
+
+class SelectionValuesTestCase(TestCase):
+
+    def setUp(self):
+        self.graph = Graph()
+        alice = self.graph.create("Person", name="Alice", age=33)
+        bob = self.graph.create("Person", name="Bob")
+        carol = self.graph.create("Person", name="Carol", age=55.5)
+        self.graph.update(KNOWS(alice, bob, since=1999) | KNOWS(bob, carol))
+
+    def test_node_values(self):
+        names, ages = self.graph.nodes("Person").order_by("name").values("name", "age", use_numpy=False)
+        assert names == (["Alice", "Bob", "Carol"], bytearray([0, 0, 0]))
+        assert ages == (array("d", [33.0, 0.0, 55.5]), bytearray([0, 1, 0]))
+
+    def test_relationship_values(self):
+        since, = self.graph.relationships(KNOWS).order_by("since").values("since", use_numpy=False)
+        assert since.values.typecode == column([1], use_numpy=False).values.typecode
+        assert since == (array(since.values.typecode, [1999, 0]), bytearray([0, 1]))
+
+    def test_values_for_empty_selection(self):
+        names, = self.graph.nodes("Robot").values("name", use_numpy=False)
+        assert names == ([], bytearray())
+
+    def test_values_for_missing_entities(self):
+        store = self.graph.__graph_store__()
+        bob, = self.graph.nodes("Person").where(name="Bob").keys()
+        keys = list(self.graph.nodes("Person").keys())
+        r_keys = list(self.graph.relationships().keys())
+        store.remove_nodes([bob])
+        people = NodeSelection(store, keys)
+        names, = people.order_by("name").values("name", use_numpy=False)
+        assert names == (["Alice", "Carol", None], bytearray([0, 0, 1]))
+        assert people.order_by("name").first()["name"] == "Alice"
+        assert people.filter(("name", "IS NULL", None), use_numpy=False) == {bob}
+        since, = RelationshipSelection(store, r_keys).values("since", use_numpy=False)
+        assert since.nulls == bytearray([1, 1])
+
+    def test_unexpected_keyword(self):
+        with self.assertRaises(TypeError):
+            self.graph.nodes().values("name", numpy=True)
+
+
+class FilterKeysTestCase(TestCase):
+
+    keys = ["a", "b", "c", "d", "e"]
+
+    rows = [
+        {"name": "Alice", "age": 33, "score": 1.5, "active": True},
+        {"name": "Bob", "age": 44, "active": False},
+        {"name": "Carol", "score": 3.0},
+        {"name": "Anne", "age": 2 ** 70, "score": "high", "active": True},
+        {"age": 55, "score": 2.5},
+    ]
+
+    use_numpy = False
+
+    def filter(self, expression):
+        return filter_keys(self.keys, self.rows, expression, use_numpy=self.use_numpy)
+
+    def test_comparisons(self):
+        assert self.filter(("score", ">", 2)) == {"c", "e"}
+        assert self.filter(("score", "<=", 1.5)) == {"a"}
+        assert self.filter(("score", "=", 3)) == {"c"}
+        assert self.filter(("active", "=", True)) == {"a", "d"}
+        assert self.filter(("active", "<>", True)) == {"b"}
+        assert self.filter(("name", "<", "B")) == {"a", "d"}
+
+    def test_integer_column_comparisons(self):
+        rows = [{"age": 33}, {"age": 44}, {}, {"age": 55}, {"age": 66}]
+        assert filter_keys(self.keys, rows, ("age", ">=", 44), self.use_numpy) == {"b", "d", "e"}
+        assert filter_keys(self.keys, rows, ("age", "<", 2 ** 70), self.use_numpy) == {"a", "b", "d", "e"}
+        assert filter_keys(self.keys, rows, ("age", "=", True), self.use_numpy) == set()
+
+    def test_mixed_column_comparisons(self):
+        assert self.filter(("age", ">", 40)) == {"b", "d", "e"}
+        assert self.filter(("score", "<>", 1.5)) == {"c", "d", "e"}
+        assert self.filter(("active", "<>", 1)) == {"a", "b", "d"}
+
+    def test_in(self):
+        assert self.filter(("age", "IN", [33, 55, "x"])) == {"a", "e"}
+        assert self.filter(("score", "IN", [3])) == {"c"}
+        assert self.filter(("name", "IN", ["Bob", "Zoe"])) == {"b"}
+        assert self.filter(("active", "IN", [1])) == set()
+
+    def test_string_operators(self):
+        assert self.filter(("name", "STARTS WITH", "A")) == {"a", "d"}
+        assert self.filter(("name", "ENDS WITH", "ol")) == {"c"}
+        assert self.filter(("name", "CONTAINS", "o")) == {"b", "c"}
+        assert self.filter(("score", "STARTS WITH", "h")) == {"d"}
+        assert self.filter(("age", "STARTS WITH", 3)) == set()
+
+    def test_null_operators(self):
+        assert self.filter(("age", "IS NULL", None)) == {"c"}
+        assert self.filter(("active", "is not null", None)) == {"a", "b", "d"}
+        assert self.filter(("missing", "IS NULL", None)) == set(self.keys)
+
+    def test_nulls_never_match(self):
+        assert self.filter(("active", "<>", None)) == set()
+        assert self.filter(("age", "<>", 0)) == {"a", "b", "d", "e"}
+
+    def test_and_or(self):
+        assert self.filter(And(("age", ">", 40), ("score", "IS NOT NULL", None))) == {"d", "e"}
+        assert self.filter(Or(("name", "STARTS WITH", "C"), ("age", "=", 33))) == {"a", "c"}
+        assert self.filter(And(("name", "IS NOT NULL", None),
+                               Or(("active", "=", False), ("score", ">=", 3)))) == {"b", "c"}
+
+    def test_predicate(self):
+        assert self.filter(Predicate("n", "age", "<", 40)) == {"a"}
+
+    def test_invalid_expressions(self):
+        with self.assertRaises(ValueError):
+            self.filter(("age", "~", 1))
+        with self.assertRaises(ValueError):
+            self.filter(("age", ">"))
+        with self.assertRaises(ValueError):
+            self.filter(Or())
+
+    def test_repr(self):
+        assert repr(And(("age", ">", 1), Or())) == "And(('age', '>', 1), Or())"
+
+    def test_no_keys(self):
+        assert filter_keys([], [], ("age", ">", 1), use_numpy=self.use_numpy) == set()
+
+
+@skipIf(numpy is None, "NumPy is not installed")
+class NumPyFilterKeysTestCase(FilterKeysTestCase):
+
+    use_numpy = True
+
+
+class SelectionFilterTestCase(TestCase):
+
+    def setUp(self):
+        self.graph = Graph()
+        self.alice = self.graph.create("Person", name="Alice", age=33)
+        self.bob = self.graph.create("Person", name="Bob", age=44)
+        self.carol = self.graph.create("Person", name="Carol")
+        self.graph.update(KNOWS(self.alice, self.bob, since=1999) | KNOWS(self.bob, self.carol, since=2009))
+
+    def test_node_filter(self):
+        people = self.graph.nodes("Person")
+        keys = people.filter(And(("age", ">", 30), ("name", "<>", "Bob")))
+        assert keys == {self.alice.id}
+        assert people.where(name="Bob").filter(("age", "IS NOT NULL", None)) == {self.bob.id}
+
+    def test_composition(self):
+        people = self.graph.nodes("Person")
+        keys = people.filter(("age", "IS NULL", None)) | people.filter(("name", "STARTS WITH", "A"))
+        selected = NodeSelection(self.graph.__graph_store__(), keys)
+        assert set(selected) == {self.alice, self.carol}
+
+    def test_relationship_filter(self):
+        keys = self.graph.relationships(KNOWS).filter(("since", ">=", 2000))
+        r, = [r for r in self.graph.relationships() if r.id in keys]
+        assert r.nodes() == (self.bob, self.carol)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import json
+from io import open as io_open
+from os.path import join as path_join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from cypy.graph.exporter import write_csv, write_jsonl
+from cypy.graph.loader import CSVLoader
+from cypy.graph.store import MutableGraphStore
+
+
+class ExporterTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.store = MutableGraphStore.build({
+            "a": (["Person", "Employee"], {"name": "Alice", "age": 33, "tags": ["x", "y"], "active": True}),
+            "b": (["Person"], {"name": "Bob", "age": 44.5}),
+            "c": (["Robot"], {}),
+        }, {
+            "ab": ("KNOWS", ("a", "b"), {"since": 1999}),
+            "bc": ("OWNS", ("b", "c"), {}),
+        })
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def path(self, name):
+        return path_join(self.directory, name)
+
+    def test_should_write_admin_import_headers(self):
+        node_paths, relationship_paths = write_csv(self.store, self.path("nodes.csv"), self.path("rels.csv"))
+        assert node_paths == [self.path("nodes.csv")]
+        with io_open(node_paths[0], newline="") as f:
+            assert f.readline() == u":ID,active:boolean,age:double,name:string,tags:string[],:LABEL\n"
+        with io_open(relationship_paths[0], newline="") as f:
+            assert f.readline() == u":START_ID,:END_ID,since:long,:TYPE\n"
+
+    def test_csv_should_load_back(self):
+        node_paths, relationship_paths = write_csv(self.store, self.path("nodes.csv"), self.path("rels.csv"))
+        copy = MutableGraphStore()
+        loader = CSVLoader(copy)
+        loader.load_nodes(node_paths[0])
+        loader.load_relationships(relationship_paths[0])
+        a, b, c = (loader.id_map[(None, key)] for key in "abc")
+        assert copy.node_labels(a) == {"Person", "Employee"}
+        assert copy.node_properties(a) == {"name": "Alice", "age": 33.0, "tags": ["x", "y"], "active": True}
+        assert copy.node_properties(c) == {}
+        ab, = copy.relationships("KNOWS")
+        assert copy.relationship_nodes(ab) == (a, b)
+        assert copy.relationship_properties(ab) == {"since": 1999}
+
+    def test_should_split_into_compressed_shards(self):
+        node_paths, relationship_paths = write_csv(self.store, self.path("nodes.csv"), self.path("rels.csv"),
+                                                   shard_size=2, compress=True)
+        assert node_paths == [self.path("nodes-00000.csv.gz"), self.path("nodes-00001.csv.gz")]
+        assert relationship_paths == [self.path("rels-00000.csv.gz")]
+        rows = []
+        for path in node_paths:
+            with gzip.open(path, "rt") as f:
+                lines = f.read().splitlines()
+            assert lines[0].startswith(":ID,")
+            rows.extend(lines[1:])
+        assert sorted(row.split(",")[0] for row in rows) == ["a", "b", "c"]
+
+    def test_should_write_json_lines(self):
+        paths = write_jsonl(self.store, self.path("graph.jsonl"))
+        with io_open(paths[0]) as f:
+            entries = [json.loads(line) for line in f]
+        assert len(entries) == 5
+        assert {"type": "node", "id": "a", "labels": ["Employee", "Person"],
+                "properties": {"name": "Alice", "age": 33, "tags": ["x", "y"], "active": True}} in entries
+        assert {"type": "relationship", "id": "ab", "label": "KNOWS", "start": "a", "end": "b",
+                "properties": {"since": 1999}} in entries
+        assert [entry["type"] for entry in entries] == ["node"] * 3 + ["relationship"] * 2
+
+    def test_should_write_empty_store(self):
+        paths = write_jsonl(MutableGraphStore(), self.path("empty.jsonl.gz"), shard_size=10)
+        assert paths == [self.path("empty-00000.jsonl.gz")]
+        with gzip.open(paths[0], "rt") as f:
+            assert f.read() == ""
+
+    def test_should_write_non_ascii_text(self):
+        store = MutableGraphStore.build({"z": ([u"Persön"], {u"name": u"Zoë"})})
+        node_paths, _ = write_csv(store, self.path("nodes.csv.gz"), self.path("rels.csv"))
+        with gzip.open(node_paths[0]) as f:
+            assert f.read().decode("utf-8") == u":ID,name:string,:LABEL\nz,Zoë,Persön\n"
+        paths = write_jsonl(store, self.path("graph.jsonl"))
+        with io_open(paths[0], encoding="utf-8") as f:
+            assert json.loads(f.read())["properties"] == {u"name": u"Zoë"}
@@ -18,7 +18,7 @@
 
 from unittest import TestCase
 
-from cypy.graph import Node, relationship_type, Graph, FrozenGraph, graph_order, graph_size
+from cypy.graph import Node, NodeSelection, Selection, relationship_type, Graph, FrozenGraph, graph_order, graph_size
 
 
 KNOWS = relationship_type("KNOWS")
@@ -121,6 +121,53 @@ class NodeTestCase(TestCase):
         a2 = Person("Employee", name="Alice")
         self.assertEqual(set(a2.labels()), {"Person", "Employee"})
 
+    def test_standalone_node_builds_store_only_when_needed(self):
+        a = Node("Person", name="Alice")
+        # On Python 2, the Mapping base class provides an empty __dict__.
+        self.assertFalse(getattr(a, "__dict__", None))
+        self.assertIsNone(a._store)
+        store = a.__graph_store__()
+        self.assertIs(a.__graph_store__(), store)
+        self.assertEqual(list(store.nodes("Person")), [a.id])
+        self.assertEqual(store.node_properties(a.id), {"name": "Alice"})
+
+
+class RelationshipTestCase(TestCase):
+
+    def test_standalone_relationship_builds_store_only_when_needed(self):
+        a = Node("Person", name="Alice")
+        b = Node("Person", name="Bob")
+        ab = KNOWS(a, b, since=1999)
+        self.assertIsNone(ab._store)
+        self.assertIsNone(a._store)
+        self.assertEqual(dict(ab), {"since": 1999})
+        self.assertEqual(graph_order(ab), 2)
+        store = ab.__graph_store__()
+        self.assertEqual(store.relationship_nodes(ab.id), (a.id, b.id))
+        self.assertIs(store.relationship_type(ab.id), KNOWS)
+        self.assertEqual(store.node_properties(b.id), {"name": "Bob"})
+
+    def test_relationship_between_node_views(self):
+        g = Graph()
+        a = g.create("Person", name="Alice")
+        b = g.create("Person", name="Bob")
+        store = KNOWS(a, b).__graph_store__()
+        self.assertEqual(store.node_properties(a.id), {"name": "Alice"})
+        self.assertEqual(store.node_properties(b.id), {"name": "Bob"})
+        self.assertFalse(store.is_mutable())
+
+    def test_relationship_captures_node_views(self):
+        g = Graph()
+        a = g.create("Person", name="Alice")
+        b = g.create("Person", name="Bob")
+        ab = KNOWS(a, b)
+        a["name"] = "Alison"
+        g.__graph_store__().remove_nodes([b.id])
+        store = ab.__graph_store__()
+        self.assertEqual(store.node_properties(a.id), {"name": "Alice"})
+        self.assertEqual(store.node_properties(b.id), {"name": "Bob"})
+        self.assertEqual(set(store.node_labels(b.id)), {"Person"})
+
 
 class GraphTestCase(TestCase):
 
@@ -191,6 +238,35 @@ class GraphTestCase(TestCase):
         assert not set(g.nodes("Y", "Z"))
         assert not set(g.nodes("X", "Y", "Z"))
 
+    def test_identity_map(self):
+        a = Node(name="Alice")
+        b = Node(name="Bob")
+        g = Graph(a | b | KNOWS(a, b), identity_map=True)
+        alice = next(g.nodes())
+        assert next(g.nodes()) is alice
+        ab = next(g.relationships())
+        assert next(g.relationships()) is ab
+        assert alice in ab.nodes()
+        assert any(node is alice for node in ab.nodes())
+        assert g.create(name="Carol") is not g.create(name="Carol")
+        f = FrozenGraph(g, identity_map=True)
+        assert next(f.nodes()) is next(f.nodes())
+        assert next(f.nodes()) is not alice
+
+    def test_identity_map_holds_views_weakly(self):
+        import gc
+        g = Graph(Node(name="Alice"), identity_map=True)
+        views = g.__graph_store__()._views
+        alice = next(g.nodes())
+        assert len(views) == 1
+        del alice
+        gc.collect()
+        assert len(views) == 0
+
+    def test_no_identity_map_by_default(self):
+        g = Graph(Node(name="Alice"))
+        assert next(g.nodes()) is not next(g.nodes())
+
     def test_node_selection_deletion(self):
         a = Node(name="Alice")
         b = Node("X", name="Bob")
@@ -222,6 +298,15 @@ class GraphTestCase(TestCase):
         ab["since"] = 1999
         self.assertEqual(ab["since"], 1999)
 
+    def test_snapshot(self):
+        g = Graph(Node("Person", name="Alice"))
+        f = g.snapshot()
+        a = next(g.nodes())
+        a["name"] = "Alison"
+        self.assertIsInstance(f, FrozenGraph)
+        self.assertEqual(next(f.nodes())["name"], "Alice")
+        self.assertEqual(next(g.snapshot().nodes())["name"], "Alison")
+
 
 class GraphCreateTestCase(TestCase):
 
@@ -230,3 +315,156 @@ class GraphCreateTestCase(TestCase):
         g.create()
         assert graph_order(g) == 1
         assert graph_size(g) == 0
+
+    def test_can_merge_new_node(self):
+        g = Graph()
+        a = g.merge("Person", {"name": "Alice"}, age=33)
+        assert graph_order(g) == 1
+        self.assertEqual(set(a.labels()), {"Person"})
+        self.assertEqual(dict(a), {"name": "Alice", "age": 33})
+
+    def test_can_merge_existing_node(self):
+        g = Graph()
+        a1 = g.merge("Person", {"name": "Alice"})
+        a2 = g.merge("Person", {"name": "Alice"}, age=33)
+        b = g.merge("Person", {"name": "Bob"})
+        assert graph_order(g) == 2
+        self.assertEqual(a1.id, a2.id)
+        self.assertNotEqual(a1.id, b.id)
+        self.assertEqual(dict(a1), {"name": "Alice", "age": 33})
+
+
+class SelectionTestCase(TestCase):
+
+    def setUp(self):
+        self.graph = Graph()
+        store = self.graph.__graph_store__()
+        store.create_index("Person", "age")
+        self.people = [self.graph.create("Person", name=name, age=age)
+                       for name, age in [("Alice", 33), ("Bob", 44), ("Carol", 55), ("Dave", 33), ("Eve", None)]]
+        self.graph.create("Robot", name="Marvin", age=33)
+        alice, bob, carol = self.people[:3]
+        self.graph.update(KNOWS(alice, bob, since=1999) | KNOWS(bob, carol, since=2001) |
+                          KNOWS(alice, carol))
+
+    def names(self, selection):
+        return [node["name"] for node in selection]
+
+    def test_where(self):
+        assert set(self.names(self.graph.nodes("Person").where(age=33))) == {"Alice", "Dave"}
+        assert set(self.names(self.graph.nodes().where(age=33))) == {"Alice", "Dave", "Marvin"}
+        assert set(self.names(self.graph.nodes("Person").where(age=33, name="Dave"))) == {"Dave"}
+        assert not self.graph.nodes("Person").where(age=None).exists()
+        assert self.graph.nodes("Person").where(age=33.0).count() == 2
+
+    def test_where_uses_property_index(self):
+        store = self.graph.__graph_store__()
+        selection = self.graph.nodes("Person").where(age=33)
+        store.nodes = None
+        assert selection.count() == 2
+
+    def test_order_skip_limit(self):
+        people = self.graph.nodes("Person")
+        assert self.names(people.order_by("age", "name")) == ["Alice", "Dave", "Bob", "Carol", "Eve"]
+        assert self.names(people.order_by("age", "name").skip(1).limit(2)) == ["Dave", "Bob"]
+        assert self.names(people.order_by("age", "name").limit(3).skip(1)) == ["Dave", "Bob"]
+        assert people.order_by("name").first()["name"] == "Alice"
+        assert people.where(name="Zoe").first() is None
+        with self.assertRaises(ValueError):
+            people.limit(1).where(name="Alice")
+        with self.assertRaises(ValueError):
+            people.skip(-1)
+
+    def test_order_descending(self):
+        people = self.graph.nodes("Person")
+        assert self.names(people.order_by("name", descending=True)) == ["Eve", "Dave", "Carol", "Bob", "Alice"]
+        assert self.names(people.order_by("age", "name", descending=True)) == ["Eve", "Carol", "Bob", "Dave", "Alice"]
+        assert self.names(people.order_by("age", "name", descending=[True, False])) == \
+            ["Eve", "Carol", "Bob", "Alice", "Dave"]
+        assert self.names(people.order_by("age", "name", descending=[False, True])) == \
+            ["Dave", "Alice", "Bob", "Carol", "Eve"]
+        with self.assertRaises(ValueError):
+            people.order_by("age", "name", descending=[True])
+        with self.assertRaises(TypeError):
+            people.order_by("age", reverse=True)
+
+    def test_top_k(self):
+        people = self.graph.nodes("Person")
+        assert self.names(people.order_by("age", "name").limit(2)) == ["Alice", "Dave"]
+        assert self.names(people.order_by("age", "name", descending=True).limit(2)) == ["Eve", "Carol"]
+        assert self.names(people.order_by("age", "name", descending=[True, False]).skip(1).limit(2)) == \
+            ["Carol", "Bob"]
+        assert self.names(people.order_by("name").limit(0)) == []
+        assert self.names(people.order_by("name").limit(10)) == ["Alice", "Bob", "Carol", "Dave", "Eve"]
+
+    def test_order_uses_ordered_index(self):
+        store = self.graph.__graph_store__()
+        store.create_index("Person", "name", ordered=True)
+        self.graph.create("Person", age=1)
+        people = self.graph.nodes("Person")
+        sort = Selection._sorted
+        Selection._sorted = None
+        try:
+            assert self.names(people.order_by("name").limit(2)) == ["Alice", "Bob"]
+            assert self.names(people.order_by("name")) == ["Alice", "Bob", "Carol", "Dave", "Eve", None]
+            assert self.names(people.order_by("name", descending=True).limit(3)) == [None, "Eve", "Dave"]
+            assert self.names(self.graph.nodes("Person", "Employee").order_by("name")) == []
+        finally:
+            Selection._sorted = sort
+        assert self.names(people.where(age=33).order_by("name", descending=True)) == ["Dave", "Alice"]
+
+    def test_descending_order_from_complete_index_reads_no_properties(self):
+        store = self.graph.__graph_store__()
+        store.create_index("Person", "name", ordered=True)
+        people = self.graph.nodes("Person")
+        property_maps = NodeSelection._property_maps
+        NodeSelection._property_maps = None
+        try:
+            assert self.names(people.order_by("name", descending=True).limit(2)) == ["Eve", "Dave"]
+        finally:
+            NodeSelection._property_maps = property_maps
+        assert self.names(people.where(name="Bob").order_by("name")) == ["Bob"]
+
+    def test_count_and_exists(self):
+        people = self.graph.nodes("Person")
+        assert people.count() == 5
+        assert people.skip(3).count() == 2
+        assert people.skip(3).limit(1).count() == 1
+        assert people.exists()
+        assert not people.skip(5).exists()
+        assert not people.limit(0).exists()
+        assert not self.graph.nodes("Alien").exists()
+
+    def test_keys_construct_no_views(self):
+        people = self.graph.nodes("Person").where(age=33)
+        views = []
+        view = Node.view
+        Node.view = classmethod(lambda cls, *args: views.append(args) or view.__func__(cls, *args))
+        try:
+            assert set(people.keys()) == {self.people[0].id, self.people[3].id}
+            assert people.count() == 2
+            assert people.order_by("name").first()["name"] == "Alice"
+        finally:
+            Node.view = view
+        assert len(views) == 1
+
+    def test_selection_from_iterator(self):
+        store = self.graph.__graph_store__()
+        people = NodeSelection(store, iter([self.people[0].id, self.people[1].id]))
+        assert people.count() == 2
+        assert set(self.names(people)) == {"Alice", "Bob"}
+        assert people.exists()
+
+    def test_relationship_selection(self):
+        alice = self.people[0]
+        knows = self.graph.relationships(KNOWS)
+        assert knows.count() == 3
+        assert knows.where(since=1999).count() == 1
+        assert [r["since"] for r in knows.order_by("since")] == [1999, 2001, None]
+        assert self.graph.relationships(KNOWS, {alice}).count() == 2
+        assert self.graph.relationships(KNOWS, {alice}).where(since=2001).count() == 0
+
+    def test_delete_selection(self):
+        self.graph.nodes("Person").where(age=33).delete()
+        assert self.graph.nodes("Person").count() == 3
+        assert self.graph.relationships().count() == 1
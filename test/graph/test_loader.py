@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from io import StringIO, open as io_open
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase
+
+from cypy.graph import Graph
+from cypy.graph.loader import CSVLoader, load
+from cypy.graph.store import MutableGraphStore
+
+
+PEOPLE = u"""\
+id:ID(Person),name,age:int,score:float,active:boolean,tags:string[],:LABEL,notes:IGNORE
+p1,Alice,33,1.5,true,x;y,Person;Employee,ignored
+p2,Bob,,2.5,false,,Person,
+p3,"Carol, Jr.",55,,TRUE,z,Person,
+"""
+
+KNOWS = u"""\
+:START_ID(Person),:END_ID(Person),since:int,:TYPE
+p1,p2,1999,KNOWS
+p2,p3,,LIKES
+"""
+
+
+class CSVLoaderTestCase(TestCase):
+
+    def test_should_load_nodes_with_typed_properties(self):
+        store = MutableGraphStore()
+        loader = CSVLoader(store, batch_size=2)
+        assert loader.load_nodes(StringIO(PEOPLE), labels=["Imported"]) == 3
+        p1, p2, p3 = (loader.id_map[("Person", n)] for n in ("p1", "p2", "p3"))
+        assert store.node_properties(p1) == {"id": "p1", "name": "Alice", "age": 33, "score": 1.5,
+                                             "active": True, "tags": ["x", "y"]}
+        assert store.node_properties(p2) == {"id": "p2", "name": "Bob", "score": 2.5, "active": False}
+        assert store.node_properties(p3)["name"] == "Carol, Jr."
+        assert store.node_labels(p1) == {"Person", "Employee", "Imported"}
+        assert store.node_labels(p2) == {"Person", "Imported"}
+
+    def test_should_load_relationships_through_id_map(self):
+        store = MutableGraphStore()
+        loader = CSVLoader(store)
+        loader.load_nodes(StringIO(PEOPLE))
+        assert loader.load_relationships(StringIO(KNOWS)) == 2
+        p1, p2, p3 = (loader.id_map[("Person", n)] for n in ("p1", "p2", "p3"))
+        ab, = store.relationships("KNOWS")
+        assert store.relationship_nodes(ab) == (p1, p2)
+        assert store.relationship_properties(ab) == {"since": 1999}
+        bc, = store.relationships("LIKES")
+        assert store.relationship_nodes(bc) == (p2, p3)
+
+    def test_should_apply_default_relationship_type(self):
+        store = MutableGraphStore()
+        loader = CSVLoader(store)
+        loader.load_nodes(StringIO(u":ID\na\nb\n"))
+        loader.load_relationships(StringIO(u":START_ID,:END_ID\na,b\n"), r_type="LINKS")
+        assert store.relationship_count("LINKS") == 1
+        assert store.node_properties(loader.id_map[(None, "a")]) == {}
+
+    def test_should_keep_id_groups_apart(self):
+        store = MutableGraphStore()
+        loader = CSVLoader(store)
+        loader.load_nodes(StringIO(u":ID(A)\n1\n"))
+        loader.load_nodes(StringIO(u":ID(B)\n1\n"))
+        assert store.node_count() == 2
+        with self.assertRaises(ValueError):
+            loader.load_nodes(StringIO(u":ID(A)\n1\n"))
+
+    def test_should_report_bad_rows(self):
+        loader = CSVLoader(MutableGraphStore())
+        with self.assertRaises(ValueError) as context:
+            loader.load_nodes(StringIO(u"name,age:int\nAlice,33\nBob,old\n"))
+        assert str(context.exception).startswith("Line 3:")
+        with self.assertRaises(ValueError):
+            loader.load_nodes(StringIO(u"name\nAlice,33\n"))
+        with self.assertRaises(ValueError):
+            loader.load_nodes(StringIO(u"name:decimal\n"))
+        with self.assertRaises(ValueError):
+            loader.load_relationships(StringIO(u":START_ID,:END_ID,:TYPE\nx,y,KNOWS\n"))
+
+    def test_should_load_non_ascii_text(self):
+        fd, path = mkstemp(suffix=".csv")
+        close(fd)
+        with io_open(path, "w", encoding="utf-8") as f:
+            f.write(u"id:ID,name\np1,Zo\u00eb\n")
+        try:
+            for source in (path, StringIO(u"id:ID,name\np1,Zo\u00eb\n")):
+                store = MutableGraphStore()
+                loader = CSVLoader(store)
+                assert loader.load_nodes(source) == 1
+                assert store.node_properties(loader.id_map[(None, "p1")]) == {"id": u"p1", "name": u"Zo\u00eb"}
+        finally:
+            remove(path)
+
+    def test_should_load_files_into_graph(self):
+        paths = []
+        for content in (PEOPLE, KNOWS):
+            fd, path = mkstemp(suffix=".csv")
+            close(fd)
+            with open(path, "w") as f:
+                f.write(content)
+            paths.append(path)
+        try:
+            graph = Graph()
+            loader = load(graph, nodes=[paths[0]], relationships=[paths[1]])
+            assert graph.__graph_store__().node_count("Person") == 3
+            assert graph.__graph_store__().relationship_count() == 2
+            assert len(loader.id_map) == 3
+        finally:
+            for path in paths:
+                remove(path)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from io import BytesIO
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase
+
+from cypy.graph import FrozenGraph
+from cypy.graph.mapped import MappedGraphStore, ImageError, write
+from cypy.graph.store import FrozenGraphStore, MutableGraphStore
+
+
+def image(graph_store):
+    f = BytesIO()
+    write(graph_store, f)
+    return f.getvalue()
+
+
+class MappedGraphStoreTestCase(TestCase):
+
+    def setUp(self):
+        store = MutableGraphStore()
+        store.create_index("Person", "name", ordered=True)
+        store.create_index("Person", "age")
+        self.a, self.b, self.c = store.add_nodes([
+            (["Person"], {"name": "Alice", "age": 33}),
+            (["Person", "Employee"], {"name": "Bob", "age": 44, "tags": ["x", "y"]}),
+            (["Robot"], {}),
+        ])
+        self.ab, self.bc = store.add_relationships([
+            ("KNOWS", (self.a, self.b), {"since": 1999}),
+            ("BUILT", (self.b, self.c), {}),
+        ])
+        self.original = FrozenGraphStore(store)
+        self.store = MappedGraphStore(image(store))
+
+    def test_equal_to_original(self):
+        assert self.store == self.original
+        assert self.original == self.store
+
+    def test_entries(self):
+        assert self.store.node_labels(self.b) == {"Person", "Employee"}
+        assert self.store.node_properties(self.b) == {"name": "Bob", "age": 44, "tags": ["x", "y"]}
+        assert self.store.relationship_type(self.ab) == "KNOWS"
+        assert self.store.relationship_nodes(self.ab) == (self.a, self.b)
+        assert self.store.relationship_properties(self.ab) == {"since": 1999}
+        assert self.store.node_properties("missing") is None
+
+    def test_counts_and_selection(self):
+        assert self.store.node_count() == 3
+        assert self.store.node_count("Person") == 2
+        assert set(self.store.nodes("Person", "Employee")) == {self.b}
+        assert set(self.store.nodes("Nobody")) == set()
+        assert self.store.node_labels() == {"Person", "Employee", "Robot"}
+        assert self.store.relationship_types() == {"KNOWS", "BUILT"}
+        assert self.store.relationship_count("KNOWS") == 1
+        assert set(self.store.relationships(None, (self.b, None))) == {self.bc}
+        assert set(self.store.relationships(None, {self.b})) == {self.ab, self.bc}
+
+    def test_property_indexes(self):
+        assert self.store.node_indexes() == {("Person", "name"), ("Person", "age")}
+        assert self.store.ordered_node_indexes() == {("Person", "name")}
+        assert list(self.store.nodes_by_property("Person", "name", "Bob")) == [self.b]
+        assert list(self.store.nodes_by_property("Person", "age", 33)) == [self.a]
+        assert list(self.store.nodes_by_property("Person", "age", "33")) == []
+        assert list(self.store.nodes_by_property_range("Person", "name", descending=True)) == [self.b, self.a]
+        assert list(self.store.nodes_by_property_prefix("Person", "name", "Al")) == [self.a]
+        assert list(self.store.nodes_by_property_range("Person", "age", lower=40)) == [self.b]
+
+    def test_frozen_graph_shares_store(self):
+        graph = FrozenGraph(self.store)
+        assert graph._store._nodes is self.store._nodes
+        assert set(node.id for node in graph.nodes("Person")) == {self.a, self.b}
+
+    def test_union(self):
+        other = MutableGraphStore()
+        d, = other.add_nodes([(["Person"], {"name": "Dave"})])
+        union = self.store.union(other)
+        assert union.node_count() == 4
+        assert list(union.nodes_by_property("Person", "name", "Dave")) == [d]
+
+    def test_empty_store(self):
+        store = MappedGraphStore(image(FrozenGraphStore()))
+        assert store.node_count() == 0
+        assert store == FrozenGraphStore()
+
+    def test_invalid_image(self):
+        with self.assertRaises(ImageError):
+            MappedGraphStore(b"not an image")
+
+    def test_open_file(self):
+        fd, path = mkstemp()
+        close(fd)
+        try:
+            with open(path, "wb") as f:
+                write(self.original, f)
+            store = MappedGraphStore.open(path)
+            try:
+                assert store == self.original
+            finally:
+                store.close()
+        finally:
+            remove(path)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from unittest import TestCase
+
+from cypy.graph import Graph, FrozenGraph, Node, relationship_type
+from cypy.graph.matching import NodePattern, RelationshipPattern, PathPattern, Predicate, Query, \
+    match, parse, INCOMING, UNDIRECTED
+
+
+KNOWS = relationship_type("KNOWS")
+LIKES = relationship_type("LIKES")
+
+
+class MatchTestCase(TestCase):
+
+    def setUp(self):
+        self.alice = Node("Person", name="Alice", age=33)
+        self.bob = Node("Person", name="Bob", age=44)
+        self.carol = Node("Person", name="Carol", age=25)
+        self.dave = Node("Robot", name="Dave")
+        self.graph = Graph(self.alice | self.bob | self.carol | self.dave |
+                           KNOWS(self.alice, self.bob) | KNOWS(self.bob, self.carol) |
+                           KNOWS(self.alice, self.carol) | LIKES(self.carol, self.dave))
+
+    def names(self, records, *keys):
+        return sorted(tuple(record[key] for key in keys) for record in records)
+
+    def test_should_match_single_node(self):
+        records = list(match(self.graph, NodePattern("a", ["Person"])))
+        assert len(records) == 3
+        assert set(records[0].keys()) == {"a"}
+        assert {record["a"]["name"] for record in records} == {"Alice", "Bob", "Carol"}
+
+    def test_should_match_node_by_property(self):
+        records = list(match(self.graph, NodePattern("a", ["Person"], {"name": "Bob"})))
+        assert [record["a"] for record in records] == [self.bob]
+
+    def test_should_match_path(self):
+        pattern = PathPattern(NodePattern("a", ["Person"]), RelationshipPattern("r", "KNOWS"),
+                              NodePattern("b", ["Person"]))
+        records = list(match(self.graph, pattern, returns=["a.name", "b.name"]))
+        assert self.names(records, "a.name", "b.name") == [("Alice", "Bob"), ("Alice", "Carol"), ("Bob", "Carol")]
+
+    def test_should_return_relationships(self):
+        pattern = PathPattern(NodePattern("a"), RelationshipPattern("r", LIKES), NodePattern("b"))
+        records = list(match(self.graph, pattern))
+        assert len(records) == 1
+        assert records[0].keys() == ("a", "r", "b")
+        assert records[0]["r"] == LIKES(self.carol, self.dave)
+
+    def test_should_match_incoming_and_undirected(self):
+        incoming = PathPattern(NodePattern("a", properties={"name": "Carol"}),
+                               RelationshipPattern(type="KNOWS", direction=INCOMING), NodePattern("b"))
+        assert self.names(match(self.graph, incoming, returns=["b.name"]), "b.name") == [("Alice",), ("Bob",)]
+        undirected = PathPattern(NodePattern("a", properties={"name": "Carol"}),
+                                 RelationshipPattern(direction=UNDIRECTED), NodePattern("b"))
+        assert self.names(match(self.graph, undirected, returns=["b.name"]), "b.name") == \
+            [("Alice",), ("Bob",), ("Dave",)]
+
+    def test_should_apply_predicates(self):
+        pattern = PathPattern(NodePattern("a"), RelationshipPattern(type="KNOWS"), NodePattern("b"))
+        records = match(self.graph, pattern, [Predicate("b", "age", ">", 30)], ["a.name", "b.name"])
+        assert self.names(records, "a.name", "b.name") == [("Alice", "Bob")]
+        records = match(self.graph, pattern, [("a", "name", "STARTS WITH", "A"), ("b", "age", "<", 30)],
+                        ["a.name", "b.name"])
+        assert self.names(records, "a.name", "b.name") == [("Alice", "Carol")]
+
+    def test_should_join_patterns_on_shared_variables(self):
+        patterns = [
+            PathPattern(NodePattern("a"), RelationshipPattern(type="KNOWS"), NodePattern("b")),
+            PathPattern(NodePattern("b"), RelationshipPattern(type="KNOWS"), NodePattern("c")),
+        ]
+        records = match(self.graph, patterns, returns=["a.name", "b.name", "c.name"])
+        assert self.names(records, "a.name", "b.name", "c.name") == [("Alice", "Bob", "Carol")]
+
+    def test_should_not_reuse_relationships(self):
+        pattern = PathPattern(NodePattern("a"), RelationshipPattern(type="LIKES", direction=UNDIRECTED),
+                              NodePattern("b"), RelationshipPattern(type="LIKES", direction=UNDIRECTED),
+                              NodePattern("c"))
+        assert list(match(self.graph, pattern)) == []
+
+    def test_should_match_cycle(self):
+        records = match(self.graph, parse("MATCH (a)-[:KNOWS]->(b)-[:KNOWS]->(c), (a)-[:KNOWS]->(c) "
+                                          "RETURN a.name, c.name").patterns, returns=["a.name", "c.name"])
+        assert self.names(records, "a.name", "c.name") == [("Alice", "Carol")]
+
+    def test_should_use_property_index(self):
+        self.graph.__graph_store__().create_index("Person", "name")
+        records = list(self.graph.match("MATCH (a:Person {name: 'Alice'})-[:KNOWS]->(b) RETURN b.name"))
+        assert self.names(records, "b.name") == [("Bob",), ("Carol",)]
+
+    def test_should_use_ordered_index(self):
+        self.graph.__graph_store__().create_index("Person", "age", ordered=True)
+        records = list(self.graph.match("MATCH (a:Person) WHERE a.age >= 33 RETURN a.name"))
+        assert self.names(records, "a.name") == [("Alice",), ("Bob",)]
+        records = list(self.graph.match("MATCH (a:Person) WHERE a.name STARTS WITH 'C' RETURN a.name"))
+        assert self.names(records, "a.name") == [("Carol",)]
+
+    def test_should_match_cypher_query(self):
+        records = self.graph.match("MATCH (a:Person)-[:KNOWS]->(b:Person) WHERE b.age > 30 RETURN a, b")
+        assert [(record["a"], record["b"]) for record in records] == [(self.alice, self.bob)]
+
+    def test_should_match_cypher_query_with_parameters(self):
+        records = self.graph.match("MATCH (a:Person) WHERE a.name IN $names AND a.age <> 44 RETURN a.name",
+                                   {"names": ["Alice", "Bob"]})
+        assert self.names(records, "a.name") == [("Alice",)]
+
+    def test_should_match_cypher_query_against_frozen_graph(self):
+        records = FrozenGraph(self.graph).match("MATCH (a)-[:LIKES]->(b:Robot) RETURN a.name, b.name")
+        assert self.names(records, "a.name", "b.name") == [("Carol", "Dave")]
+
+    def test_should_match_structured_query(self):
+        query = Query([PathPattern(NodePattern("a", ["Robot"]))], [], None)
+        assert [record["a"] for record in self.graph.match(query)] == [self.dave]
+
+    def test_should_be_lazy(self):
+        records = self.graph.match("MATCH (a), (b) RETURN a, b")
+        assert next(records) is not None
+
+
+class ParseTestCase(TestCase):
+
+    def test_should_parse_patterns(self):
+        query = parse("MATCH (a:Person:Employee {name: 'Alice', age: -33})<-[r:KNOWS {since: 1999.5}]-(b), (c) "
+                      "RETURN a, r.since")
+        assert len(query.patterns) == 2
+        a, r, b = query.patterns[0].elements
+        assert a.name == "a"
+        assert a.labels == {"Person", "Employee"}
+        assert a.properties == {"name": "Alice", "age": -33}
+        assert r.name == "r"
+        assert r.type == "KNOWS"
+        assert r.properties == {"since": 1999.5}
+        assert r.direction == INCOMING
+        assert b.name == "b"
+        assert query.where == []
+        assert query.returns == ["a", "r.since"]
+
+    def test_should_parse_predicates(self):
+        query = parse("match (a) where a.x is null and a.y IS NOT NULL and a.z ends with \"x\" "
+                      "and a.w contains 'it\\'s' and a.v = true and a.u IN [1, 2, null]")
+        assert query.where == [
+            Predicate("a", "x", "IS NULL", None),
+            Predicate("a", "y", "IS NOT NULL", None),
+            Predicate("a", "z", "ENDS WITH", "x"),
+            Predicate("a", "w", "CONTAINS", "it's"),
+            Predicate("a", "v", "=", True),
+            Predicate("a", "u", "IN", [1, 2, None]),
+        ]
+        assert query.returns is None
+
+    def test_should_reject_unsupported_syntax(self):
+        for query in ("CREATE (a)", "MATCH (a) RETURN a ORDER BY a", "MATCH (a)<-->(b)",
+                      "MATCH (a) WHERE a.x ~ 1", "MATCH (a) WHERE a.x = $y", "MATCH (a"):
+            with self.assertRaises(ValueError):
+                parse(query)
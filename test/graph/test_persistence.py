@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from os import listdir
+from os.path import getsize, join as path_join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
+from unittest import TestCase, skipUnless
+from uuid import uuid4
+
+from cypy.compat import bytes_types, unicode_types, utf8_types
+from cypy.graph import relationship_type
+from cypy.graph.persistence import Journal, JournalError, Unpacker, pack
+
+
+# Binary data is held in a bytearray on Python 2, where bytes is str.
+BINARY = bytearray(b"\x00\xff") if utf8_types else b"\x00\xff"
+
+
+class PackTestCase(TestCase):
+
+    def assert_round_trip(self, value):
+        data = bytearray()
+        pack(value, data)
+        unpacked, offset = Unpacker().unpack(data)
+        assert unpacked == value
+        assert type(unpacked) is type(value)
+        assert offset == len(data)
+
+    def test_values(self):
+        for value in [None, True, False, 0, 1, -1, 63, -64, 2 ** 63 - 1, -2 ** 63, 2 ** 100, 3.25,
+                      u"", u"héllo", BINARY, uuid4(), [1, [u"a"]], (1, 2), frozenset({u"A"}),
+                      {u"name": u"Alice", u"age": 33}]:
+            self.assert_round_trip(value)
+
+    def test_text_and_binary_types(self):
+        data = bytearray()
+        pack(["abc", u"héllo".encode("utf-8"), bytearray(b"\x00\xff")], data)
+        (text, utf8, binary), _ = Unpacker().unpack(data)
+        assert text == u"abc" and isinstance(text, unicode_types)
+        assert utf8 == (u"héllo" if utf8_types else b"h\xc3\xa9llo")
+        assert binary == b"\x00\xff" and isinstance(binary, bytes_types)
+
+    @skipUnless(utf8_types, "Native strings are not UTF-8 text")
+    def test_native_strings_must_be_utf8(self):
+        with self.assertRaises(UnicodeDecodeError):
+            pack(b"\x00\xff", bytearray())
+
+    def test_relationship_types_are_shared_by_name(self):
+        knows = relationship_type("KNOWS")
+        data = bytearray()
+        pack([knows, knows], data)
+        (first, second), _ = Unpacker().unpack(data)
+        assert first.__name__ == "KNOWS"
+        assert first is second
+        (first, _), _ = Unpacker({"KNOWS": knows}).unpack(data)
+        assert first is knows
+
+    def test_unsupported_value(self):
+        with self.assertRaises(TypeError):
+            pack(object(), bytearray())
+
+
+class JournalTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def open(self, **kwargs):
+        return Journal.open(self.directory, **kwargs)
+
+    def populate(self, store):
+        store.create_index("Person", "name", ordered=True)
+        store.create_uniqueness_constraint("Person", "name")
+        a, b = store.add_nodes([(["Person"], {"name": "Alice", "tags": ["x", "y"]}),
+                                (["Person"], {"name": "Bob", "score": 1.5})])
+        ab, = store.add_relationships([("KNOWS", (a, b), {"since": 1999})])
+        store.node_labels(a).add("Employee")
+        store.node_properties(b)["age"] = 44
+        store.relationship_properties(ab)["since"] = 2000
+        return a, b, ab
+
+    def assert_recovered(self, store, **kwargs):
+        with self.open(**kwargs) as journal:
+            recovered = journal.store
+            assert recovered == store
+            assert recovered.ordered_node_indexes() == store.ordered_node_indexes()
+            assert recovered.uniqueness_constraints() == store.uniqueness_constraints()
+            return recovered
+
+    def test_new_journal_is_empty(self):
+        with self.open() as journal:
+            assert journal.store.node_count() == 0
+
+    def test_recovery_from_log(self):
+        with self.open() as journal:
+            self.populate(journal.store)
+        self.assert_recovered(journal.store)
+
+    def test_recovery_from_snapshot_and_log(self):
+        with self.open() as journal:
+            a, b, _ = self.populate(journal.store)
+            journal.checkpoint()
+            journal.store.remove_nodes([b])
+            journal.store.node_properties(a)["name"] = "Alicia"
+        recovered = self.assert_recovered(journal.store)
+        assert set(recovered.nodes_by_property("Person", "name", "Alicia")) == {a}
+
+    def test_recovery_of_changes_of_value_type(self):
+        with self.open() as journal:
+            a, = journal.store.add_nodes([(["Person"], {"x": 1})])
+            journal.checkpoint()
+            journal.store.node_properties(a)["x"] = True
+            journal.checkpoint()
+        with self.open() as journal:
+            assert journal.store.node_properties(a)["x"] is True
+
+    def test_recovery_continues_sequence(self):
+        with self.open() as journal:
+            self.populate(journal.store)
+            last = journal.store.change_log().last_sequence()
+        with self.open() as journal:
+            assert journal.store.change_log().last_sequence() == last
+            journal.store.add_nodes([(["Person"], {"name": "Carol"})])
+        with self.open() as journal:
+            assert journal.store.node_count() == 3
+
+    def test_checkpoint_removes_old_segments(self):
+        with self.open() as journal:
+            self.populate(journal.store)
+            journal.checkpoint()
+            assert sorted(listdir(self.directory)) == ["snapshot", "wal.000002"]
+
+    def test_automatic_checkpoint(self):
+        with self.open(checkpoint_interval=10) as journal:
+            journal.store.add_nodes([(["Person"], {"n": i}) for i in range(20)])
+            assert "snapshot" in listdir(self.directory)
+        with self.open() as journal:
+            assert journal.store.node_count() == 20
+
+    def test_group_commit(self):
+        with self.open(sync_interval=60.0) as journal:
+            for i in range(10):
+                journal.store.add_nodes([(["Person"], {"n": i})])
+            journal.sync()
+        with self.open() as journal:
+            assert journal.store.node_count() == 10
+
+    def test_group_commit_syncs_quiet_tail(self):
+        with self.open(sync_interval=0.05) as journal:
+            journal.store.add_nodes([(["Person"], {"n": 1})])
+            journal.store.add_nodes([(["Person"], {"n": 2})])
+            deadline = time() + 5
+            while journal._unsynced and time() < deadline:
+                sleep(0.01)
+            assert not journal._unsynced
+
+    def test_write_failure_marks_journal_as_failed(self):
+
+        class BrokenFile(object):
+
+            def __init__(self, f):
+                self.f = f
+
+            def write(self, data):
+                raise IOError("Disk full")
+
+            def close(self):
+                self.f.close()
+
+        journal = self.open()
+        journal.store.add_nodes([(["Person"], {"n": 1})])
+        journal._file = BrokenFile(journal._file)
+        journal.store.add_nodes([(["Person"], {"n": 2})])
+        assert journal.store.node_count() == 2
+        assert journal.failed()
+        with self.assertRaises(JournalError):
+            journal.sync()
+        with self.assertRaises(JournalError):
+            journal.close()
+        assert journal.closed()
+        with self.open() as journal:
+            assert journal.store.node_count() == 1
+
+    def test_torn_tail_is_discarded(self):
+        with self.open() as journal:
+            journal.store.add_nodes([(["Person"], {"n": 1})])
+            journal.store.add_nodes([(["Person"], {"n": 2})])
+        path = path_join(self.directory, "wal.000001")
+        with open(path, "r+b") as f:
+            f.truncate(getsize(path) - 2)
+        with self.open() as journal:
+            assert [props["n"] for props in map(journal.store.node_properties, journal.store.nodes())] == [1]
+            journal.store.add_nodes([(["Person"], {"n": 3})])
+        with self.open() as journal:
+            assert journal.store.node_count() == 2
+
+    def test_damage_before_tail_is_an_error(self):
+        with self.open() as journal:
+            journal.store.add_nodes([(["Person"], {"n": 1})])
+        with self.open() as journal:
+            journal.store.add_nodes([(["Person"], {"n": 2})])
+        path = path_join(self.directory, "wal.000001")
+        with open(path, "r+b") as f:
+            f.truncate(getsize(path) - 2)
+        with self.assertRaises(JournalError):
+            self.open()
+
+    def test_relationship_type_classes(self):
+        knows = relationship_type("KNOWS")
+        with self.open() as journal:
+            a, b = journal.store.add_nodes([(["Person"], {}), (["Person"], {})])
+            journal.store.add_relationships([(knows, (a, b), {})])
+        with self.open(relationship_types={"KNOWS": knows}) as journal:
+            assert set(journal.store.nodes("Person")) == {a, b}
+            r_id, = journal.store.relationships(knows)
+            assert journal.store.relationship_type(r_id) is knows
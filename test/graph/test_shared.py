@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from os.path import dirname
+from subprocess import check_output
+from sys import executable
+from unittest import TestCase, skipIf
+
+from cypy.graph.shared import SharedGraphStore, shared_memory
+from cypy.graph.store import FrozenGraphStore, MutableGraphStore
+
+
+@skipIf(shared_memory is None, "Shared memory is not supported")
+class SharedGraphStoreTestCase(TestCase):
+
+    def setUp(self):
+        store = MutableGraphStore()
+        store.create_index("Person", "name")
+        a, b = store.add_nodes([(["Person"], {"name": "Alice"}), (["Person"], {"name": "Bob"})])
+        store.add_relationships([("KNOWS", (a, b), {})])
+        self.original = FrozenGraphStore(store)
+        self.store = SharedGraphStore.publish(store)
+
+    def tearDown(self):
+        self.store.close()
+        self.store.unlink()
+
+    def test_published_store(self):
+        assert self.store == self.original
+
+    def test_attach_in_same_process(self):
+        attached = SharedGraphStore.attach(self.store.name)
+        try:
+            assert attached == self.original
+            assert list(attached.nodes_by_property("Person", "name", "Bob")) == \
+                list(self.original.nodes_by_property("Person", "name", "Bob"))
+        finally:
+            attached.close()
+
+    def test_attach_in_other_process(self):
+        script = ("from cypy.graph.shared import SharedGraphStore\n"
+                  "store = SharedGraphStore.attach({!r})\n"
+                  "print(store.node_count('Person'), store.relationship_count('KNOWS'))\n"
+                  "store.close()\n").format(self.store.name)
+        output = check_output([executable, "-c", script], cwd=dirname(dirname(dirname(__file__))))
+        assert output.split() == [b"2", b"1"]
+        # The block outlives the attached process.
+        attached = SharedGraphStore.attach(self.store.name)
+        assert attached.node_count() == 2
+        attached.close()
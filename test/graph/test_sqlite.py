@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Copyright 2002-2018, Neo4j
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from os import close, remove
+from tempfile import mkstemp
+from unittest import TestCase
+
+from cypy.graph.sqlite import SQLiteGraphStore
+from cypy.graph.store import FrozenGraphStore, MutableGraphStore, ConstraintError
+
+import test.graph.test_store as store_tests
+
+
+class SQLiteGraphStoreTestCase(store_tests.GraphStoreTestCase):
+
+    graph_store_class = SQLiteGraphStore
+
+
+class SQLiteMutableGraphStoreTestCase(store_tests.MutableGraphStoreTestCase):
+
+    graph_store_class = SQLiteGraphStore
+
+
+class SQLiteNodePropertyIndexTestCase(store_tests.NodePropertyIndexTestCase):
+
+    graph_store_class = SQLiteGraphStore
+
+
+class SQLiteOrderedNodePropertyIndexTestCase(store_tests.OrderedNodePropertyIndexTestCase):
+
+    graph_store_class = SQLiteGraphStore
+
+
+class SQLiteUniquenessConstraintTestCase(store_tests.UniquenessConstraintTestCase):
+
+    graph_store_class = SQLiteGraphStore
+
+
+class SQLiteMergeTestCase(store_tests.MergeTestCase):
+
+    graph_store_class = SQLiteGraphStore
+
+
+class SQLiteStorageTestCase(TestCase):
+
+    def setUp(self):
+        fd, self.path = mkstemp(suffix=".db")
+        close(fd)
+        remove(self.path)
+
+    def tearDown(self):
+        remove(self.path)
+
+    def test_should_reopen_database(self):
+        store = SQLiteGraphStore(database=self.path)
+        store.create_uniqueness_constraint("Person", "name")
+        store.create_index("Person", "age", ordered=True)
+        a, b = store.add_nodes([(["Person"], {"name": "Alice", "age": 33}), (["Person"], {"name": "Bob", "age": 44})])
+        ab, = store.add_relationships([("KNOWS", (a, b), {"since": 1999})])
+        expected = store.snapshot()
+        store.close()
+        store = SQLiteGraphStore(database=self.path)
+        try:
+            assert FrozenGraphStore(store) == expected
+            assert store.uniqueness_constraints() == {("Person", "name")}
+            assert store.ordered_node_indexes() == {("Person", "age")}
+            assert list(store.nodes_by_property_range("Person", "age", lower=40)) == [b]
+            with self.assertRaises(ConstraintError):
+                store.add_nodes([(["Person"], {"name": "Alice"})])
+        finally:
+            store.close()
+
+    def test_should_roll_back_failed_batch(self):
+        store = SQLiteGraphStore(database=self.path)
+        a, = store.add_nodes([(["Person"], {"name": "Alice"})])
+        with self.assertRaises(RuntimeError):
+            with store.batch():
+                store.add_nodes([(["Person"], {"name": "Bob"})])
+                store.node_properties(a)["name"] = "Alison"
+                raise RuntimeError()
+        assert store.node_count() == 1
+        assert store.node_properties(a) == {"name": "Alice"}
+        store.close()
+
+    def test_should_write_through_evicted_entries(self):
+        store = SQLiteGraphStore(database=self.path, cache_size=2)
+        n_ids = store.add_nodes([(["Person"], {"n": i}) for i in range(10)])
+        for n_id in n_ids:
+            store.node_properties(n_id)["n"] += 1
+            store.node_labels(n_id).add("Counted")
+        assert store.node_count("Counted") == 10
+        assert sorted(store.node_properties(n_id)["n"] for n_id in n_ids) == list(range(1, 11))
+        store.close()
+
+    def test_should_interoperate_with_memory_stores(self):
+        memory = MutableGraphStore.build({
+            "a": (["Person"], {"name": "Alice"}),
+            "b": (["Person"], {"name": "Bob"}),
+        }, {
+            "ab": ("KNOWS", ("a", "b"), {}),
+        })
+        memory.create_index("Person", "name")
+        store = SQLiteGraphStore(memory, database=self.path)
+        assert MutableGraphStore(store) == memory
+        assert FrozenGraphStore(store).node_indexes() == {("Person", "name")}
+        store.close()
+
+    def test_should_store_text_and_binary_values(self):
+        store = SQLiteGraphStore(database=self.path)
+        store.create_index(u"Persön", "name")
+        store.create_index(u"Persön", "tag")
+        a, = store.add_nodes([([u"Persön"], {"name": u"Zoë", "tag": "x"})])
+        ab, = store.add_relationships([("KNOWS", (a, a), {})])
+        assert store.node_labels(a) == {u"Persön"}
+        assert set(store.nodes_by_property(u"Persön", "name", u"Zoë")) == {a}
+        assert set(store.nodes_by_property(u"Persön", "tag", u"x")) == {a}
+        assert store.node_properties(a) == {"name": u"Zoë", "tag": "x"}
+        assert set(store.relationships("KNOWS", [a, None])) == {ab}
+        store.close()
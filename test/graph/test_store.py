@@ -19,7 +19,8 @@
 from unittest import TestCase
 
 import cypy
-from cypy.graph.store import FrozenGraphStore, MutableGraphStore
+from cypy.graph.store import FrozenGraphStore, MutableGraphStore, ConstraintError, ConcurrentModificationError, \
+    NodeDelta, RelationshipDelta
 
 _n = 65
 
@@ -36,6 +37,8 @@ cypy.graph.store.new_key = _counter
 
 class GraphStoreTestCase(TestCase):
 
+    graph_store_class = FrozenGraphStore
+
     store = MutableGraphStore()
     a, b, c, d = store.add_nodes((
         (["X"], {"name": "Alice"}),
@@ -54,11 +57,11 @@ class GraphStoreTestCase(TestCase):
     ))
 
     def test_should_reflect_self_in_store_magic_method(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.__graph_store__() is store
 
     def test_should_get_counts(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.node_count() == 4
         assert store.node_count("X") == 3
         assert store.relationship_count() == 6
@@ -67,7 +70,7 @@ class GraphStoreTestCase(TestCase):
         assert store.relationship_types() == {"LIKES", "KNOWS", "MARRIED_TO"}
 
     def test_should_get_node_degree(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.relationship_count(n_ids={self.a}) == 4
         assert store.relationship_count(r_type="LIKES", n_ids={self.a}) == 2
         assert store.relationship_count(n_ids={self.b}) == 4
@@ -75,22 +78,22 @@ class GraphStoreTestCase(TestCase):
         assert store.relationship_count(n_ids={self.d}) == 1
 
     def test_should_get_nodes(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert set(store.nodes()) == {self.a, self.b, self.c, self.d}
 
     def test_should_get_nodes_with_a_label(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert set(store.nodes("X")) == {self.a, self.b, self.c}
         assert set(store.nodes("Y")) == {self.b, self.c, self.d}
         assert not set(store.nodes("Z"))
 
     def test_should_get_nodes_with_multiple_labels(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert set(store.nodes("X", "Y")) == {self.b, self.c}
         assert not set(store.nodes("X", "Z"))
 
     def test_should_get_node_labels(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.node_labels() == {"X", "Y"}
         assert store.node_labels(self.a) == {"X"}
         assert store.node_labels(self.b) == {"X", "Y"}
@@ -99,7 +102,7 @@ class GraphStoreTestCase(TestCase):
         assert store.node_labels(object()) is None
 
     def test_should_get_node_properties(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.node_properties(self.a) == {"name": "Alice"}
         assert store.node_properties(self.b) == {"name": "Bob"}
         assert store.node_properties(self.c) == {"name": "Carol"}
@@ -107,7 +110,7 @@ class GraphStoreTestCase(TestCase):
         assert store.node_properties(object()) is None
 
     def test_should_get_relationships(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert set(store.relationships()) == {self.a_likes_b, self.b_likes_a, self.a_knows_b, self.a_knows_c, self.c_knows_b, self.c_married_to_d}
         assert set(store.relationships("KNOWS")) == {self.a_knows_b, self.a_knows_c, self.c_knows_b}
         assert set(store.relationships("MARRIED_TO")) == {self.c_married_to_d}
@@ -123,20 +126,20 @@ class GraphStoreTestCase(TestCase):
         assert set(store.relationships("KNOWS", n_ids={self.a, self.b})) == {self.a_knows_b}
 
     def test_should_fail_on_bad_node_sequence(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert list(store.relationships(n_ids=(self.a, self.b, self.c))) == []
 
     def test_should_fail_on_bad_node_set(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         _ = store.relationships(n_ids={self.a, self.b, self.c})
 
     def test_should_fail_on_bad_node_type(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         with self.assertRaises(TypeError):
             _ = store.relationships(n_ids=1)
 
     def test_should_get_relationship_nodes(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.relationship_nodes(self.a_likes_b) == (self.a, self.b)
         assert store.relationship_nodes(self.b_likes_a) == (self.b, self.a)
         assert store.relationship_nodes(self.a_knows_b) == (self.a, self.b)
@@ -146,14 +149,14 @@ class GraphStoreTestCase(TestCase):
         assert store.relationship_nodes(object()) is None
 
     def test_should_get_relationship_properties(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.relationship_properties(self.a_knows_b) == {"since": 1999}
         assert store.relationship_properties(self.a_knows_c) == {"since": 2000}
         assert store.relationship_properties(self.c_knows_b) == {"since": 2001}
         assert store.relationship_properties(object()) is None
 
     def test_should_get_relationship_type(self):
-        store = FrozenGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.relationship_type(self.a_likes_b) == "LIKES"
         assert store.relationship_type(self.b_likes_a) == "LIKES"
         assert store.relationship_type(self.a_knows_b) == "KNOWS"
@@ -226,9 +229,334 @@ class FrozenGraphStoreTestCase(TestCase):
         assert store.relationship_type("ab") == "KNOWS"
         assert store.relationship_properties("ab") == {"since": 1999}
 
+    def test_union(self):
+        extra = FrozenGraphStore.build({
+            "e": (["X"], {"name": "Eve"}),
+        }, {
+            "de": ("KNOWS", (self.d, "e"), {}),
+        })
+        store = extra.union(self.store)
+        assert store.node_count() == 5
+        assert store.relationship_count() == 5
+        assert set(store.nodes("X")) == {self.a, self.b, self.c, "e"}
+        assert set(store.relationships("KNOWS", [self.d, None])) == {"de"}
+        assert self.store.node_count() == 4
+        assert extra.node_count() == 1
+
+    def test_union_shares_structure_with_largest_store(self):
+        extra = FrozenGraphStore.build({"e": (["X"], {"name": "Eve"})})
+        store = extra.union(self.store)
+        assert store._nodes_by_label["Y"] is self.store._nodes_by_label["Y"]
+        assert store._relationships_by_type is self.store._relationships_by_type
+        assert store._nodes[self.a] is self.store._nodes[self.a]
+
+    def test_union_prefers_later_entries(self):
+        first = FrozenGraphStore.build({"a": (["X"], {"name": "Alice"}), "b": (["X"], {})})
+        second = FrozenGraphStore.build({"a": (["Y"], {"name": "Alison"})})
+        store = first.union(second)
+        assert store.node_labels("a") == {"Y"}
+        assert store.node_properties("a") == {"name": "Alison"}
+        assert set(store.nodes("X")) == {"b"}
+        store = second.union(first)
+        assert store.node_labels("a") == {"X"}
+        assert set(store.nodes("X")) == {"a", "b"}
+        assert set(store.nodes("Y")) == set()
+
+    def test_union_prefers_later_values_of_other_types(self):
+        for old, new in [(1, True), (True, 1), (1, 1.0), (1.0, 1), (0, False), ([1], [True])]:
+            first = FrozenGraphStore.build({"a": (["X"], {"x": old})}, {"r": ("R", ("a", "a"), {"x": old})})
+            second = FrozenGraphStore.build({"a": (["X"], {"x": new})}, {"r": ("R", ("a", "a"), {"x": new})})
+            store = first.union(second)
+            assert type(store.node_properties("a")["x"]) is type(new)
+            assert type(store.relationship_properties("r")["x"]) is type(new)
+            assert store.node_properties("a")["x"] == new
+
+    def test_union_with_mutable_store(self):
+        mutable = MutableGraphStore()
+        e, = mutable.add_nodes([(["X"], {"name": "Eve"})])
+        mutable.create_index("X", "name")
+        store = self.store.union(mutable)
+        assert isinstance(store, FrozenGraphStore)
+        assert store.node_count() == 5
+        assert store.node_indexes() == {("X", "name")}
+        assert set(store.nodes_by_property("X", "name", "Eve")) == {e}
+        assert set(store.nodes_by_property("X", "name", "Alice")) == {self.a}
+
+    def test_union_maintains_ordered_indexes(self):
+        mutable = MutableGraphStore(self.store)
+        mutable.create_index("X", "name", ordered=True)
+        indexed = FrozenGraphStore(mutable)
+        store = indexed.union(FrozenGraphStore.build({"e": (["X"], {"name": "Bart"})}))
+        names = [store.node_properties(n_id)["name"] for n_id in store.nodes_by_property_range("X", "name")]
+        assert names == ["Alice", "Bart", "Bob", "Carol"]
+        names = [indexed.node_properties(n_id)["name"] for n_id in indexed.nodes_by_property_range("X", "name")]
+        assert names == ["Alice", "Bob", "Carol"]
+
+
+class LazySecondaryStoreTestCase(TestCase):
+
+    def new_store(self):
+        return FrozenGraphStore.build({
+            "a": (["Person"], {"name": "Alice"}),
+            "b": (["Person", "Robot"], {"name": "Bob"}),
+        }, {
+            "ab": ("KNOWS", ("a", "b"), {}),
+        })
+
+    def test_should_build_secondary_stores_on_first_use(self):
+        store = self.new_store()
+        assert "_nodes_by_label" not in store.__dict__
+        assert "_relationships_by_type" not in store.__dict__
+        assert "_relationships_by_node" not in store.__dict__
+        assert set(store.nodes("Robot")) == {"b"}
+        assert "_nodes_by_label" in store.__dict__
+        assert "_relationships_by_type" not in store.__dict__
+        assert set(store.relationships("KNOWS", ["b"])) == {"ab"}
+        with self.assertRaises(AttributeError):
+            _ = store._no_such_store
+
+    def test_should_share_built_stores_with_copies(self):
+        store = self.new_store()
+        copy = FrozenGraphStore(store)
+        assert "_nodes_by_label" not in copy.__dict__
+        _ = store.node_count("Person")
+        copy = FrozenGraphStore(store)
+        assert copy._nodes_by_label is store._nodes_by_label
+        assert "_relationships_by_node" not in copy.__dict__
+
+    def test_should_build_once_across_threads(self):
+        from threading import Thread
+        store = self.new_store()
+        built = []
+        build = store._build_nodes_by_label
+        store._build_nodes_by_label = lambda: built.append(None) or build()
+        results = []
+        threads = [Thread(target=lambda: results.append(store._nodes_by_label)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(built) == 1
+        assert all(result is results[0] for result in results)
+
+
+class SnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.store = MutableGraphStore()
+        self.a, self.b = self.store.add_nodes([(["Person"], {"name": "Alice"}), (["Person"], {"name": "Bob"})])
+        self.ab, = self.store.add_relationships([("KNOWS", (self.a, self.b), {})])
+
+    def test_snapshot_is_frozen_copy(self):
+        snapshot = self.store.snapshot()
+        assert isinstance(snapshot, FrozenGraphStore)
+        assert snapshot.node_count() == 2
+        assert snapshot.relationship_count() == 1
+        assert set(snapshot.nodes("Person")) == {self.a, self.b}
+
+    def test_unchanged_store_returns_same_snapshot(self):
+        assert self.store.snapshot() is self.store.snapshot()
+
+    def test_snapshot_is_isolated_from_later_changes(self):
+        snapshot = self.store.snapshot()
+        self.store.node_properties(self.a)["name"] = "Alison"
+        self.store.node_labels(self.b).add("Employee")
+        self.store.relationship_properties(self.ab)["since"] = 1999
+        c, = self.store.add_nodes([(["Person"], {"name": "Carol"})])
+        assert snapshot.node_properties(self.a) == {"name": "Alice"}
+        assert snapshot.node_labels(self.b) == {"Person"}
+        assert snapshot.relationship_properties(self.ab) == {}
+        assert snapshot.node_count() == 2
+        later = self.store.snapshot()
+        assert later.node_properties(self.a) == {"name": "Alison"}
+        assert set(later.nodes("Employee")) == {self.b}
+        assert later.relationship_properties(self.ab) == {"since": 1999}
+        assert set(later.nodes("Person")) == {self.a, self.b, c}
+
+    def test_snapshot_shares_unchanged_entries(self):
+        snapshot = self.store.snapshot()
+        self.store.node_properties(self.a)["name"] = "Alison"
+        later = self.store.snapshot()
+        assert later._nodes[self.b] is snapshot._nodes[self.b]
+        assert later._relationships is snapshot._relationships
+
+    def test_snapshot_after_removal(self):
+        self.store.snapshot()
+        self.store.remove_nodes([self.b])
+        snapshot = self.store.snapshot()
+        assert set(snapshot.nodes()) == {self.a}
+        assert snapshot.relationship_count() == 0
+        assert not set(snapshot.relationships(None, [self.a, None]))
+
+    def test_snapshot_includes_new_indexes(self):
+        self.store.snapshot()
+        self.store.create_index("Person", "name")
+        snapshot = self.store.snapshot()
+        assert snapshot.node_indexes() == {("Person", "name")}
+        self.store.node_properties(self.a)["name"] = "Alison"
+        snapshot = self.store.snapshot()
+        assert set(snapshot.nodes_by_property("Person", "name", "Alison")) == {self.a}
+        assert not set(snapshot.nodes_by_property("Person", "name", "Alice"))
+
+    def test_snapshot_follows_changes_of_value_type(self):
+        self.store.create_index("Person", "x")
+        for value in [1, True, 1.0, 0, False, 1]:
+            self.store.node_properties(self.a)["x"] = value
+            self.store.relationship_properties(self.ab)["x"] = value
+            snapshot = self.store.snapshot()
+            copy = FrozenGraphStore(self.store)
+            assert snapshot == copy
+            assert type(snapshot.node_properties(self.a)["x"]) is type(value)
+            assert type(snapshot.relationship_properties(self.ab)["x"]) is type(value)
+            assert set(snapshot.nodes_by_property("Person", "x", value)) == {self.a}
+            assert set(snapshot.nodes_by_property("Person", "x", value)) == \
+                set(copy.nodes_by_property("Person", "x", value))
+
+
+class ConcurrencyTestCase(TestCase):
+
+    def setUp(self):
+        self.store = MutableGraphStore()
+        self.n_ids = self.store.add_nodes([(["Person"], {"name": name}) for name in ("Alice", "Bob", "Carol")])
+
+    def test_iterator_fails_fast_on_node_addition(self):
+        nodes = self.store.nodes()
+        next(nodes)
+        self.store.add_nodes([(["Person"], {"name": "Dave"})])
+        with self.assertRaises(ConcurrentModificationError):
+            list(nodes)
+
+    def test_iterator_fails_fast_on_node_removal(self):
+        nodes = self.store.nodes("Person")
+        next(nodes)
+        self.store.remove_nodes(self.n_ids[1:])
+        with self.assertRaises(ConcurrentModificationError):
+            list(nodes)
+
+    def test_iterator_fails_fast_on_node_addition_before_first_step(self):
+        nodes = self.store.nodes()
+        self.store.add_nodes([(["Person"], {"name": "Dave"})])
+        with self.assertRaises(ConcurrentModificationError):
+            list(nodes)
+
+    def test_iterator_fails_fast_on_relationship_addition_before_first_step(self):
+        relationships = self.store.relationships()
+        self.store.add_relationships([("KNOWS", (self.n_ids[0], self.n_ids[1]), {})])
+        with self.assertRaises(ConcurrentModificationError):
+            list(relationships)
+
+    def test_iterator_allows_property_changes(self):
+        for n_id in self.store.nodes("Person"):
+            self.store.node_properties(n_id)["age"] = 33
+        assert all(self.store.node_properties(n_id)["age"] == 33 for n_id in self.n_ids)
+
+    def test_index_iterator_fails_fast_on_indexed_property_change(self):
+        self.store.create_index("Person", "name", ordered=True)
+        nodes = self.store.nodes_by_property_range("Person", "name")
+        next(nodes)
+        self.store.node_properties(self.n_ids[2])["name"] = "Caroline"
+        with self.assertRaises(ConcurrentModificationError):
+            list(nodes)
+
+    def test_cannot_write_while_holding_read_lock(self):
+        with self.store.read_lock():
+            with self.assertRaises(RuntimeError):
+                self.store.add_nodes([(["Person"], {})])
+        self.store.add_nodes([(["Person"], {})])
+        assert self.store.node_count() == 4
+
+    def test_read_lock_holds_off_writers(self):
+        from threading import Thread
+        events = []
+
+        def write():
+            self.store.add_nodes([(["Person"], {})])
+            events.append("write")
+
+        with self.store.read_lock():
+            writer = Thread(target=write)
+            writer.start()
+            writer.join(0.1)
+            events.append("read")
+            assert self.store.node_count() == 3
+        writer.join()
+        assert events == ["read", "write"]
+        assert self.store.node_count() == 4
+
+
+class TransactionTestCase(TestCase):
+
+    def setUp(self):
+        self.store = MutableGraphStore()
+        self.a, = self.store.add_nodes([(["Person"], {"name": "Alice"})])
+
+    def test_commit_applies_changes(self):
+        with self.store.transaction() as tx:
+            b, c = tx.add_nodes([(["Person"], {"name": "Bob"}), (["Person"], {"name": "Carol"})])
+            ab, bc = tx.add_relationships([("KNOWS", (self.a, b), {}), ("KNOWS", (b, c), {})])
+            assert self.store.node_count() == 1
+        assert tx.closed()
+        assert set(self.store.nodes("Person")) == {self.a, b, c}
+        assert set(self.store.relationships("KNOWS")) == {ab, bc}
+        assert set(self.store.relationships(None, [b, None])) == {bc}
+
+    def test_exception_rolls_back(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.store.transaction() as tx:
+                tx.add_nodes([(["Person"], {"name": "Bob"})])
+                tx.remove_nodes([self.a])
+                _ = 1 / 0
+        assert tx.closed()
+        assert set(self.store.nodes()) == {self.a}
+
+    def test_explicit_rollback(self):
+        tx = self.store.transaction()
+        tx.add_nodes([(["Person"], {"name": "Bob"})])
+        tx.rollback()
+        assert self.store.node_count() == 1
+        with self.assertRaises(ValueError):
+            tx.add_nodes([(["Person"], {"name": "Carol"})])
+
+    def test_removals_are_applied_in_order(self):
+        tx = self.store.transaction()
+        b, = tx.add_nodes([(["Person"], {"name": "Bob"})])
+        ab, = tx.add_relationships([("KNOWS", (self.a, b), {})])
+        tx.remove_nodes([self.a])
+        tx.commit()
+        assert set(self.store.nodes()) == {b}
+        assert self.store.relationship_count() == 0
+
+    def test_constraint_violation_leaves_store_unchanged(self):
+        self.store.create_uniqueness_constraint("Person", "name")
+        tx = self.store.transaction()
+        tx.add_nodes([(["Person"], {"name": "Bob"})])
+        tx.add_nodes([(["Person"], {"name": "Alice"})])
+        with self.assertRaises(ConstraintError):
+            tx.commit()
+        assert not tx.closed()
+        assert self.store.node_count() == 1
+
+    def test_constraint_allows_replacement_within_transaction(self):
+        self.store.create_uniqueness_constraint("Person", "name")
+        with self.store.transaction() as tx:
+            tx.remove_nodes([self.a])
+            a, = tx.add_nodes([(["Person"], {"name": "Alice"})])
+        assert set(self.store.nodes_by_property("Person", "name", "Alice")) == {a}
+
+    def test_committed_nodes_are_indexed(self):
+        self.store.create_index("Person", "name", ordered=True)
+        with self.store.transaction() as tx:
+            b, = tx.add_nodes([(["Person"], {"name": "Bob"})])
+        assert set(self.store.nodes_by_property("Person", "name", "Bob")) == {b}
+        self.store.node_properties(b)["name"] = "Robert"
+        assert set(self.store.nodes_by_property("Person", "name", "Robert")) == {b}
+        assert list(self.store.nodes_by_property_prefix("Person", "name", "R")) == [b]
+
 
 class MutableGraphStoreTestCase(TestCase):
 
+    graph_store_class = MutableGraphStore
+
     store = MutableGraphStore()
     a, b, c, d = store.add_nodes((
         (["X"], {"name": "Alice"}),
@@ -244,28 +572,28 @@ class MutableGraphStoreTestCase(TestCase):
     ))
 
     def test_should_create_empty_on_none(self):
-        store = MutableGraphStore()
+        store = self.graph_store_class()
         assert store.node_count() == 0
         assert store.relationship_count() == 0
         assert not store.node_labels()
         assert not store.relationship_types()
 
     def test_should_create_copy_of_frozen_store(self):
-        store = MutableGraphStore(FrozenGraphStore(self.store))
+        store = self.graph_store_class(FrozenGraphStore(self.store))
         assert store.node_count() == 4
         assert store.relationship_count() == 4
         assert store.node_labels() == {"X", "Y"}
         assert store.relationship_types() == {"KNOWS"}
 
     def test_should_create_copy_of_mutable_store(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         assert store.node_count() == 4
         assert store.relationship_count() == 4
         assert store.node_labels() == {"X", "Y"}
         assert store.relationship_types() == {"KNOWS"}
 
     def test_can_add_new_label(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         labels = store.node_labels(self.a)
         assert labels == {"X"}
         labels.add("Z")
@@ -273,62 +601,62 @@ class MutableGraphStoreTestCase(TestCase):
         assert "Z" in set(store.node_labels())
 
     def test_can_add_existing_label(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         labels = store.node_labels(self.a)
         assert labels == {"X"}
         labels.add("X")
         assert store.node_labels(self.a) == {"X"}
 
     def test_can_remove_label(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         labels = store.node_labels(self.a)
         assert labels == {"X"}
         labels.remove("X")
         assert not store.node_labels(self.a)
 
     def test_can_discard_label(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         labels = store.node_labels(self.a)
         assert labels == {"X"}
         labels.discard("Z")
         assert store.node_labels(self.a) == {"X"}
 
     def test_can_clear_labels(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         labels = store.node_labels(self.b)
         assert labels == {"X", "Y"}
         labels.clear()
         assert not store.node_labels(self.b)
 
     def test_can_add_properties(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         properties = store.node_properties(self.a)
         assert properties == {"name": "Alice"}
         properties["age"] = 33
         assert store.node_properties(self.a) == {"name": "Alice", "age": 33}
 
     def test_can_update_properties(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         properties = store.node_properties(self.a)
         assert properties == {"name": "Alice"}
         properties["name"] = "Alistair"
         assert store.node_properties(self.a) == {"name": "Alistair"}
 
     def test_can_remove_properties(self):
-        store = MutableGraphStore(self.store)
+        store = self.graph_store_class(self.store)
         properties = store.node_properties(self.a)
         assert properties == {"name": "Alice"}
         del properties["name"]
         assert store.node_properties(self.a) == {}
 
     def test_should_allow_construction_arguments(self):
-        store = MutableGraphStore.build({
+        store = self.graph_store_class.build({
             "a": (["Person"], {"name": "Alice", "age": 33}),
             "b": (["Person"], {"name": "Bob", "age": 44}),
         }, {
             "ab": ("KNOWS", ("a", "b"), {"since": 1999}),
         })
-        assert isinstance(store, MutableGraphStore)
+        assert isinstance(store, self.graph_store_class)
         assert store.node_count() == 2
         assert store.relationship_count() == 1
         assert store.node_labels() == {"Person"}
@@ -340,4 +668,480 @@ class MutableGraphStoreTestCase(TestCase):
         assert store.node_properties("b") == {"name": "Bob", "age": 44}
         assert set(store.relationships(r_type="KNOWS")) == {"ab"}
         assert store.relationship_type("ab") == "KNOWS"
-        assert store.relationship_properties("ab") == {"since": 1999}
\ No newline at end of file
+        assert store.relationship_properties("ab") == {"since": 1999}
+
+class NodePropertyIndexTestCase(TestCase):
+
+    graph_store_class = MutableGraphStore
+
+    def new_store(self):
+        store = self.graph_store_class()
+        store.create_index("Person", "name")
+        a, b, c = store.add_nodes((
+            (["Person"], {"name": "Alice", "age": 33}),
+            (["Person"], {"name": "Bob", "age": 44}),
+            (["Robot"], {"name": "Alice"}),
+        ))
+        return store, a, b, c
+
+    def test_should_list_indexes(self):
+        store, _, _, _ = self.new_store()
+        assert store.node_indexes() == {("Person", "name")}
+
+    def test_should_find_nodes_by_indexed_property(self):
+        store, a, b, c = self.new_store()
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == {a}
+        assert set(store.nodes_by_property("Person", "name", "Bob")) == {b}
+        assert set(store.nodes_by_property("Person", "name", "Carol")) == set()
+        assert set(store.nodes_by_property("Person", "name", None)) == set()
+
+    def test_should_find_nodes_by_unindexed_property(self):
+        store, a, b, c = self.new_store()
+        assert set(store.nodes_by_property("Person", "age", 33)) == {a}
+        assert set(store.nodes_by_property("Robot", "name", "Alice")) == {c}
+
+    def test_should_index_existing_nodes_on_creation(self):
+        store, a, b, c = self.new_store()
+        store.create_index("Robot", "name")
+        assert store.node_indexes() == {("Person", "name"), ("Robot", "name")}
+        assert set(store.nodes_by_property("Robot", "name", "Alice")) == {c}
+
+    def test_should_drop_index(self):
+        store, a, b, c = self.new_store()
+        store.drop_index("Person", "name")
+        store.drop_index("Person", "name")
+        assert store.node_indexes() == set()
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == {a}
+
+    def test_should_track_property_assignment(self):
+        store, a, b, c = self.new_store()
+        properties = store.node_properties(a)
+        properties["name"] = "Alistair"
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == set()
+        assert set(store.nodes_by_property("Person", "name", "Alistair")) == {a}
+        del properties["name"]
+        assert set(store.nodes_by_property("Person", "name", "Alistair")) == set()
+        properties.update(name="Alice")
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == {a}
+        properties.clear()
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == set()
+
+    def test_should_track_label_changes(self):
+        store, a, b, c = self.new_store()
+        store.node_labels(c).add("Person")
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == {a, c}
+        store.node_labels(a).discard("Person")
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == {c}
+
+    def test_should_track_node_removal(self):
+        store, a, b, c = self.new_store()
+        properties = store.node_properties(a)
+        store.remove_nodes([a])
+        assert set(store.nodes_by_property("Person", "name", "Alice")) == set()
+        properties["name"] = "Bob"
+        assert set(store.nodes_by_property("Person", "name", "Bob")) == {b}
+
+    def test_should_index_list_values(self):
+        store = self.graph_store_class()
+        store.create_index("Person", "tags")
+        a, = store.add_nodes([(["Person"], {"tags": ["x", "y"]})])
+        assert set(store.nodes_by_property("Person", "tags", ["x", "y"])) == {a}
+
+    def test_should_find_same_nodes_with_and_without_index(self):
+        store = self.graph_store_class()
+        a, b, c = store.add_nodes([(["Thing"], {"x": True}), (["Thing"], {"x": 1}), (["Thing"], {"x": 1.0})])
+        for indexed in (False, True):
+            if indexed:
+                store.create_index("Thing", "x")
+            assert set(store.nodes_by_property("Thing", "x", True)) == {a}
+            assert set(store.nodes_by_property("Thing", "x", 1)) == {b, c}
+            assert set(store.nodes_by_property("Thing", "x", 1.0)) == {b, c}
+
+    def test_should_copy_indexes(self):
+        store, a, b, c = self.new_store()
+        for copy in (FrozenGraphStore(store), FrozenGraphStore(FrozenGraphStore(store)), MutableGraphStore(store)):
+            assert copy.node_indexes() == {("Person", "name")}
+            assert set(copy.nodes_by_property("Person", "name", "Alice")) == {a}
+            assert set(copy.nodes_by_property("Person", "name", "Bob")) == {b}
+
+
+class OrderedNodePropertyIndexTestCase(TestCase):
+
+    graph_store_class = MutableGraphStore
+
+    def new_store(self):
+        store = self.graph_store_class()
+        store.create_index("Person", "age", ordered=True)
+        store.create_index("Person", "name", ordered=True)
+        a, b, c, d, e = store.add_nodes((
+            (["Person"], {"name": "Alice", "age": 33}),
+            (["Person"], {"name": "Bob", "age": 44}),
+            (["Person"], {"name": "Albert", "age": 55.5}),
+            (["Person"], {"name": "Carol", "age": "unknown"}),
+            (["Robot"], {"name": "Alan", "age": 1}),
+        ))
+        return store, a, b, c, d, e
+
+    def stores(self):
+        store, a, b, c, d, e = self.new_store()
+        unindexed = self.graph_store_class(store)
+        unindexed.drop_index("Person", "age")
+        unindexed.drop_index("Person", "name")
+        return [store, FrozenGraphStore(store), unindexed], a, b, c, d, e
+
+    def test_should_tell_whether_index_is_complete(self):
+        stores, a, b, _, _, _ = self.stores()
+        for store in stores:
+            assert store._node_index_is_complete("Person", "age")
+            assert store._node_index_is_complete("Robot", "name")
+        store, a, b, _, _, _ = self.new_store()
+        store.node_properties(b)["name"] = "Alice"
+        assert store._node_index_is_complete("Person", "name")
+        store.node_properties(a)["name"] = None
+        assert not store._node_index_is_complete("Person", "name")
+        assert not FrozenGraphStore(store)._node_index_is_complete("Person", "name")
+
+    def test_should_list_ordered_indexes(self):
+        store, _, _, _, _, _ = self.new_store()
+        store.create_index("Person", "email")
+        assert store.node_indexes() == {("Person", "age"), ("Person", "name"), ("Person", "email")}
+        assert store.ordered_node_indexes() == {("Person", "age"), ("Person", "name")}
+        assert FrozenGraphStore(store).ordered_node_indexes() == {("Person", "age"), ("Person", "name")}
+
+    def test_should_find_nodes_in_range(self):
+        stores, a, b, c, d, e = self.stores()
+        for store in stores:
+            assert list(store.nodes_by_property_range("Person", "age", 33, 55.5)) == [a, b, c]
+            assert list(store.nodes_by_property_range("Person", "age", 33, 55.5,
+                                                      include_lower=False, include_upper=False)) == [b]
+            assert list(store.nodes_by_property_range("Person", "age", lower=40)) == [b, c]
+            assert list(store.nodes_by_property_range("Person", "age", upper=40)) == [a]
+            assert list(store.nodes_by_property_range("Person", "age", lower=40, descending=True)) == [c, b]
+            assert list(store.nodes_by_property_range("Person", "age", 30, "z")) == []
+
+    def test_should_find_nodes_in_order(self):
+        stores, a, b, c, d, e = self.stores()
+        for store in stores:
+            assert list(store.nodes_by_property_range("Person", "age")) == [d, a, b, c]
+            assert list(store.nodes_by_property_range("Person", "age", descending=True)) == [c, b, a, d]
+
+    def test_should_find_nodes_by_prefix(self):
+        stores, a, b, c, d, e = self.stores()
+        for store in stores:
+            assert list(store.nodes_by_property_prefix("Person", "name", "Al")) == [c, a]
+            assert list(store.nodes_by_property_prefix("Person", "name", "Z")) == []
+            with self.assertRaises(TypeError):
+                list(store.nodes_by_property_prefix("Person", "name", 1))
+
+    def test_should_track_changes(self):
+        store, a, b, c, d, e = self.new_store()
+        store.node_properties(b)["age"] = 20
+        store.node_labels(e).add("Person")
+        store.remove_nodes([c])
+        assert list(store.nodes_by_property_range("Person", "age", lower=0)) == [e, b, a]
+        store.node_properties(a)["age"] = 1
+        assert set(store.nodes_by_property_range("Person", "age", upper=1)) == {a, e}
+        assert list(store.nodes_by_property_range("Person", "age", lower=1, include_lower=False)) == [b]
+
+    def test_should_not_confuse_booleans_and_numbers(self):
+        store = self.graph_store_class()
+        store.create_index("Flag", "value", ordered=True)
+        a, b = store.add_nodes([(["Flag"], {"value": True}), (["Flag"], {"value": 1})])
+        assert set(store.nodes_by_property("Flag", "value", True)) == {a}
+        assert set(store.nodes_by_property("Flag", "value", 1)) == {b}
+        assert list(store.nodes_by_property_range("Flag", "value", lower=0)) == [b]
+
+
+class UniquenessConstraintTestCase(TestCase):
+
+    graph_store_class = MutableGraphStore
+
+    def new_store(self):
+        store = self.graph_store_class()
+        store.create_uniqueness_constraint("Person", "email")
+        a, b = store.add_nodes((
+            (["Person"], {"email": "alice@example.com"}),
+            (["Person"], {"email": "bob@example.com"}),
+        ))
+        return store, a, b
+
+    def test_should_create_backing_index(self):
+        store, a, b = self.new_store()
+        assert store.uniqueness_constraints() == {("Person", "email")}
+        assert store.node_indexes() == {("Person", "email")}
+        assert set(store.nodes_by_property("Person", "email", "alice@example.com")) == {a}
+
+    def test_should_not_create_constraint_over_duplicates(self):
+        store = self.graph_store_class()
+        store.add_nodes([(["Person"], {"email": "x"}), (["Person"], {"email": "x"})])
+        with self.assertRaises(ConstraintError):
+            store.create_uniqueness_constraint("Person", "email")
+        assert store.uniqueness_constraints() == set()
+        assert store.node_indexes() == set()
+
+    def test_should_reject_duplicate_on_add(self):
+        store, a, b = self.new_store()
+        with self.assertRaises(ConstraintError):
+            store.add_nodes([(["Person"], {"email": "carol@example.com"}),
+                             (["Person"], {"email": "alice@example.com"})])
+        assert store.node_count() == 2
+
+    def test_should_reject_duplicate_within_batch(self):
+        store, a, b = self.new_store()
+        with self.assertRaises(ConstraintError):
+            store.add_nodes([(["Person"], {"email": "carol@example.com"}),
+                             (["Person"], {"email": "carol@example.com"})])
+        assert store.node_count() == 2
+
+    def test_should_allow_duplicate_without_label(self):
+        store, a, b = self.new_store()
+        store.add_nodes([(["Robot"], {"email": "alice@example.com"})])
+        assert store.node_count() == 3
+
+    def test_should_reject_duplicate_on_update(self):
+        store, a, b = self.new_store()
+        other = MutableGraphStore.build({"c": (["Person"], {"email": "bob@example.com"})})
+        with self.assertRaises(ConstraintError):
+            store.update(other)
+        assert store.node_count() == 2
+
+    def test_should_allow_update_that_replaces_holder(self):
+        store, a, b = self.new_store()
+        store.update(MutableGraphStore.build({
+            a: (["Person"], {"email": "bob@example.com"}),
+            b: (["Person"], {"email": "alice@example.com"}),
+        }))
+        assert set(store.nodes_by_property("Person", "email", "alice@example.com")) == {b}
+
+    def test_should_reject_duplicate_on_property_assignment(self):
+        store, a, b = self.new_store()
+        properties = store.node_properties(b)
+        with self.assertRaises(ConstraintError):
+            properties["email"] = "alice@example.com"
+        assert properties["email"] == "bob@example.com"
+        properties["email"] = "bob@example.com"
+        properties["email"] = "robert@example.com"
+        assert set(store.nodes_by_property("Person", "email", "robert@example.com")) == {b}
+
+    def test_should_reject_duplicate_on_label_addition(self):
+        store, a, b = self.new_store()
+        c, = store.add_nodes([(["Robot"], {"email": "alice@example.com"})])
+        labels = store.node_labels(c)
+        with self.assertRaises(ConstraintError):
+            labels.add("Person")
+        assert labels == {"Robot"}
+        assert set(store.nodes("Person")) == {a, b}
+
+    def test_should_not_drop_backing_index(self):
+        store, a, b = self.new_store()
+        with self.assertRaises(ConstraintError):
+            store.drop_index("Person", "email")
+        store.drop_uniqueness_constraint("Person", "email")
+        store.drop_index("Person", "email")
+        store.add_nodes([(["Person"], {"email": "alice@example.com"})])
+        assert store.node_count() == 3
+
+
+class MergeTestCase(TestCase):
+
+    graph_store_class = MutableGraphStore
+
+    def test_should_merge_nodes(self):
+        store = self.graph_store_class()
+        a, = store.add_nodes([(["Person"], {"name": "Alice", "age": 33})])
+        n_ids = store.merge_nodes([
+            ("Person", {"name": "Alice"}, {"age": 34}),
+            ("Person", {"name": "Bob"}, {"age": 44}),
+            ("Person", {"name": "Bob"}, {}),
+            ("Robot", {"name": "Alice"}, {}),
+        ])
+        assert n_ids[0] == a
+        assert n_ids[1] == n_ids[2]
+        assert len(set(n_ids)) == 3
+        assert store.node_count() == 3
+        assert store.node_properties(a) == {"name": "Alice", "age": 34}
+        assert store.node_labels(n_ids[1]) == {"Person"}
+        assert store.node_properties(n_ids[1]) == {"name": "Bob", "age": 44}
+        assert store.node_labels(n_ids[3]) == {"Robot"}
+
+    def test_should_not_create_index_for_merge(self):
+        store = self.graph_store_class()
+        a, = store.add_nodes([(["Person"], {"name": "Alice", "email": "alice@example.com"})])
+        n_ids = store.merge_nodes([
+            ("Person", {"name": "Alice", "email": "alice@example.com"}, {"email": "alice@example.org"}),
+            ("Person", {"email": "alice@example.org"}, {"age": 33}),
+            ("Person", {"email": "bob@example.com"}, {}),
+            ("Person", {"email": "bob@example.com"}, {"name": "Bob"}),
+        ])
+        assert store.node_indexes() == set()
+        assert n_ids[:2] == [a, a]
+        assert n_ids[2] == n_ids[3] != a
+        assert store.node_properties(a) == {"name": "Alice", "email": "alice@example.org", "age": 33}
+        assert store.node_properties(n_ids[2]) == {"email": "bob@example.com", "name": "Bob"}
+
+    def test_should_use_existing_index_for_merge(self):
+        store = self.graph_store_class()
+        store.create_index("Person", "name")
+        store.merge_nodes([("Person", {"name": "Alice", "email": "alice@example.com"}, {})])
+        n_ids = store.merge_nodes([("Person", {"name": "Alice", "email": "alice@example.org"}, {})])
+        assert store.node_indexes() == {("Person", "name")}
+        assert store.node_count() == 2
+        assert store.node_properties(n_ids[0])["email"] == "alice@example.org"
+
+    def test_should_merge_on_label_alone(self):
+        store = self.graph_store_class()
+        n_ids = store.merge_nodes([("Config", {}, {"debug": True}), ("Config", {}, {"debug": False})])
+        assert n_ids[0] == n_ids[1]
+        assert store.node_properties(n_ids[0]) == {"debug": False}
+
+    def test_should_not_merge_on_null(self):
+        store = self.graph_store_class()
+        with self.assertRaises(ValueError):
+            store.merge_nodes([("Person", {"name": None}, {})])
+        with self.assertRaises(ValueError):
+            store.merge_nodes([("Person", {"name": "Alice"}, {}), ("Person", {"name": None}, {})])
+        assert store.node_count() == 0
+
+    def test_should_merge_relationships(self):
+        store = self.graph_store_class()
+        a, b = store.add_nodes([(["Person"], {}), (["Person"], {})])
+        ab, = store.add_relationships([("KNOWS", (a, b), {})])
+        r_ids = store.merge_relationships([
+            ("KNOWS", (a, b), {"since": 1999}),
+            ("KNOWS", (b, a), {}),
+            ("LIKES", (a, b), {}),
+            ("LIKES", (a, b), {"much": True}),
+        ])
+        assert r_ids[0] == ab
+        assert r_ids[2] == r_ids[3]
+        assert len(set(r_ids)) == 3
+        assert store.relationship_count() == 3
+        assert store.relationship_properties(ab) == {"since": 1999}
+        assert store.relationship_properties(r_ids[2]) == {"much": True}
+
+
+class DiffTestCase(TestCase):
+
+    def new_store(self):
+        return MutableGraphStore.build({
+            "a": (["Person"], {"name": "Alice", "age": 33}),
+            "b": (["Person"], {"name": "Bob"}),
+            "c": (["Person"], {"name": "Carol"}),
+        }, {
+            "ab": ("KNOWS", ("a", "b"), {"since": 1999}),
+            "bc": ("KNOWS", ("b", "c"), {}),
+        })
+
+    def change(self, store):
+        store.node_labels("a").add("Employee")
+        store.node_properties("a")["age"] = 34
+        store.node_properties("b")["name"] = None
+        store.node_properties("b")["flag"] = True
+        store.remove_nodes(["c"])
+        store.update(MutableGraphStore.build({"d": (["Person"], {})}, {"ab": ("LIKES", ("a", "b"), {})}))
+
+    def check(self, diff):
+        assert diff.nodes_added == {"d"}
+        assert diff.nodes_removed == {"c"}
+        assert diff.nodes_changed == {
+            "a": NodeDelta({"Employee"}, set(), {"age": 34}, set()),
+            "b": NodeDelta(set(), set(), {"flag": True}, {"name"}),
+        }
+        assert diff.relationships_added == {"ab"}
+        assert diff.relationships_removed == {"ab", "bc"}
+        assert diff.relationships_changed == {}
+
+    def test_should_diff_mutable_stores(self):
+        store = self.new_store()
+        before = MutableGraphStore(store)
+        self.change(store)
+        self.check(before.diff(store))
+
+    def test_should_diff_snapshots(self):
+        store = self.new_store()
+        before = store.snapshot()
+        self.change(store)
+        self.check(before.diff(store.snapshot()))
+        self.check(before.diff(store))
+
+    def test_should_report_property_changes(self):
+        store = self.new_store()
+        before = store.snapshot()
+        store.node_properties("a")["age"] = 35
+        store.relationship_properties("ab")["since"] = 2000
+        diff = before.diff(store.snapshot())
+        assert diff.nodes_changed == {"a": NodeDelta(set(), set(), {"age": 35}, set())}
+        assert diff.relationships_changed == {"ab": RelationshipDelta({"since": 2000}, set())}
+
+    def test_should_report_changes_of_value_type(self):
+        store = self.new_store()
+        before = MutableGraphStore(store)
+        store.node_properties("a")["age"] = True
+        diff = before.diff(store)
+        assert diff.nodes_changed == {"a": NodeDelta(set(), set(), {"age": True}, set())}
+        assert type(diff.nodes_changed["a"].properties_set["age"]) is bool
+
+    def test_should_find_no_difference(self):
+        store = self.new_store()
+        assert not any(store.diff(store.snapshot()))
+        assert not any(store.snapshot().diff(FrozenGraphStore(store)))
+
+
+class HashTestCase(TestCase):
+
+    def new_store(self):
+        return MutableGraphStore.build({
+            "a": (["Person"], {"name": "Alice", "age": 33, "tags": ["x", "y"]}),
+            "b": (["Person"], {"name": "Bob"}),
+        }, {
+            "ab": ("KNOWS", ("a", "b"), {"since": 1999}),
+        })
+
+    def test_should_hash_content(self):
+        store = self.new_store()
+        other = self.new_store()
+        assert hash(store) == hash(other)
+        other.node_properties("a")["age"] = 34
+        assert hash(store) != hash(other)
+        assert store != other
+        other.node_properties("a")["age"] = 33.0
+        assert hash(store) == hash(other)
+        assert store == other
+        other.relationship_properties("ab")["since"] = 2000
+        assert hash(store) != hash(other)
+
+    def test_should_maintain_hash_through_changes(self):
+        store = self.new_store()
+        store.node_labels("a").add("Employee")
+        store.node_labels("b").discard("Person")
+        labels = store.node_labels("a")
+        labels &= {"Employee", "Robot"}
+        store.node_properties("b")["name"] = None
+        store.node_properties("b")["flag"] = True
+        store.relationship_properties("ab")["since"] = 2000
+        with store.transaction() as tx:
+            c, = tx.add_nodes([(["Person"], {"name": "Carol"})])
+            tx.add_relationships([("LIKES", ("b", c), {})])
+        store.update(MutableGraphStore.build({"a": (["Person"], {})}, {}))
+        assert hash(store) == store._content_hash()
+        store.remove_nodes(["b"])
+        assert hash(store) == store._content_hash()
+
+    def test_should_share_hash_with_snapshots(self):
+        store = self.new_store()
+        snapshot = store.snapshot()
+        assert snapshot._hash == hash(store) == snapshot._content_hash()
+        store.node_properties("b")["name"] = "Robert"
+        store.remove_relationships(["ab"])
+        snapshot = store.snapshot()
+        assert snapshot._hash == hash(store) == snapshot._content_hash()
+        union = snapshot.union(FrozenGraphStore(self.new_store()))
+        assert union._hash == union._content_hash()
+        assert hash(FrozenGraphStore(store)) == hash(store)
+
+    def test_should_compare_unequal_by_hash(self):
+        store = self.new_store()
+        other = self.new_store()
+        other.node_properties("a")["age"] = 34
+        store._nodes = other._nodes = None
+        assert store != other
@@ -18,7 +18,7 @@
 
 from unittest import TestCase
 
-from cypy.collections import ReactiveSet
+from cypy.collections import ReactiveSet, SortedSet, FrozenSortedSet, PersistentMap, PersistentSet
 
 
 class ReactiveSetTestCase(TestCase):
@@ -46,7 +46,7 @@ class ReactiveSetTestCase(TestCase):
         s &= {2, 3}
         assert s == {2}
         assert not added
-        assert removed == {1, 3}
+        assert removed == {1}
 
     def test_isub(self):
         added = set()
@@ -143,3 +143,180 @@ class ReactiveSetTestCase(TestCase):
         assert not s
         assert not added
         assert removed == {1, 2}
+
+
+class SortedSetTestCase(TestCase):
+
+    set_class = SortedSet
+
+    def test_should_sort_distinct_elements(self):
+        s = self.set_class([3, 1, 2, 3])
+        assert list(s) == [1, 2, 3]
+        assert list(reversed(s)) == [3, 2, 1]
+        assert len(s) == 3
+        assert 2 in s
+        assert 4 not in s
+
+    def test_should_iterate_range(self):
+        s = self.set_class(range(10))
+        assert list(s.irange(3, 6)) == [3, 4, 5, 6]
+        assert list(s.irange(3, 6, inclusive=(False, False))) == [4, 5]
+        assert list(s.irange(3, 6, reverse=True)) == [6, 5, 4, 3]
+        assert list(s.irange(minimum=7)) == [7, 8, 9]
+        assert list(s.irange(maximum=2)) == [0, 1, 2]
+        assert list(s.irange(maximum=2, inclusive=(True, False), reverse=True)) == [1, 0]
+        assert list(s.irange(6, 3)) == []
+        assert list(s.irange(10, 20)) == []
+
+
+class FrozenSortedSetTestCase(SortedSetTestCase):
+
+    set_class = FrozenSortedSet
+
+
+class SortedSetMutationTestCase(TestCase):
+
+    def test_should_stay_sorted_across_sublists(self):
+        from random import Random
+        random = Random(0)
+        s = SortedSet()
+        s.load = 4
+        expected = set()
+        for _ in range(2000):
+            value = random.randint(0, 200)
+            if random.random() < 0.6:
+                s.add(value)
+                expected.add(value)
+            else:
+                s.discard(value)
+                expected.discard(value)
+            assert len(s) == len(expected)
+        assert list(s) == sorted(expected)
+        assert list(reversed(s)) == sorted(expected, reverse=True)
+        assert list(s.irange(50, 150)) == [x for x in sorted(expected) if 50 <= x <= 150]
+        assert list(s.irange(50, 150, reverse=True)) == [x for x in sorted(expected, reverse=True) if 50 <= x <= 150]
+        assert all(x in s for x in expected)
+
+
+class CollidingKey(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.value == other.value
+
+    def __hash__(self):
+        return self.value % 3
+
+
+class PersistentMapTestCase(TestCase):
+
+    def test_construction(self):
+        m = PersistentMap({"a": 1, "b": 2})
+        assert len(m) == 2
+        assert m["a"] == 1
+        assert m.get("c") is None
+        assert dict(m) == {"a": 1, "b": 2}
+        assert m == {"a": 1, "b": 2}
+
+    def test_set_returns_new_map(self):
+        m1 = PersistentMap({"a": 1})
+        m2 = m1.set("b", 2)
+        m3 = m2.set("a", 3)
+        assert dict(m1) == {"a": 1}
+        assert dict(m2) == {"a": 1, "b": 2}
+        assert dict(m3) == {"a": 3, "b": 2}
+        assert m3.set("a", 3) is m3
+
+    def test_discard_returns_new_map(self):
+        m1 = PersistentMap({"a": 1, "b": 2})
+        m2 = m1.discard("a")
+        assert dict(m1) == {"a": 1, "b": 2}
+        assert dict(m2) == {"b": 2}
+        assert m2.discard("a") is m2
+
+    def test_many_keys(self):
+        m = PersistentMap()
+        versions = []
+        for i in range(2000):
+            m = m.set(i, str(i))
+            versions.append(m)
+        for i in range(0, 2000, 2):
+            m = m.discard(i)
+        assert dict(m.items()) == {i: str(i) for i in range(1, 2000, 2)}
+        assert len(versions[999]) == 1000
+        assert dict(versions[999].items()) == {i: str(i) for i in range(1000)}
+
+    def test_colliding_keys(self):
+        keys = [CollidingKey(i) for i in range(20)]
+        m = PersistentMap((key, key.value) for key in keys)
+        assert len(m) == 20
+        assert all(m[key] == key.value for key in keys)
+        for key in keys[:19]:
+            m = m.discard(key)
+        assert dict(m) == {keys[19]: 19}
+
+    def test_evolver(self):
+        m1 = PersistentMap({"a": 1, "b": 2})
+        e = m1.evolver()
+        e["c"] = 3
+        del e["a"]
+        e.discard("z")
+        with self.assertRaises(KeyError):
+            del e["a"]
+        m2 = e.persistent()
+        e["d"] = 4
+        assert dict(m1) == {"a": 1, "b": 2}
+        assert dict(m2) == {"b": 2, "c": 3}
+        assert dict(e.persistent()) == {"b": 2, "c": 3, "d": 4}
+
+    def test_update(self):
+        m1 = PersistentMap({"a": 1})
+        m2 = m1.update({"a": 2, "b": 3})
+        assert dict(m1) == {"a": 1}
+        assert dict(m2) == {"a": 2, "b": 3}
+
+    def test_diff(self):
+        m1 = PersistentMap((i, str(i)) for i in range(1000))
+        m2 = m1.set(5, "five").discard(6).set(1000, "1000")
+        assert sorted(m1.diff(m2)) == [(5, "5", "five"), (6, "6", None), (1000, None, "1000")]
+        assert sorted(m2.diff(m1)) == [(5, "five", "5"), (6, None, "6"), (1000, "1000", None)]
+        assert list(m1.diff(PersistentMap(m1))) == []
+        assert sorted(PersistentMap({1: "a"}).diff(PersistentMap({1: "a", 2: "b"}))) == [(2, None, "b")]
+
+
+class PersistentSetTestCase(TestCase):
+
+    def test_construction(self):
+        s = PersistentSet([1, 2, 3])
+        assert len(s) == 3
+        assert 2 in s
+        assert 4 not in s
+        assert s == {1, 2, 3}
+
+    def test_add_and_discard(self):
+        s1 = PersistentSet([1, 2])
+        s2 = s1.add(3)
+        s3 = s2.discard(1)
+        assert s1 == {1, 2}
+        assert s2 == {1, 2, 3}
+        assert s3 == {2, 3}
+        assert s3.add(2) is s3
+        assert s3.discard(1) is s3
+
+    def test_set_operations(self):
+        s = PersistentSet([1, 2, 3])
+        assert s & {2, 3, 4} == {2, 3}
+        assert {2, 3, 4} & s == {2, 3}
+        assert s | {4} == {1, 2, 3, 4}
+        assert hash(s) == hash(frozenset([1, 2, 3]))
+
+    def test_evolver(self):
+        s1 = PersistentSet([1, 2])
+        e = s1.evolver()
+        e.add(3)
+        e.discard(1)
+        s2 = e.persistent()
+        assert s1 == {1, 2}
+        assert s2 == {2, 3}